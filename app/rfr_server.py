@@ -1,7 +1,9 @@
 from common.schema import RfRResponse, RfRRequest
+from common import metrics
+from common.settings import OLLAMASETTINGS
 from mcp.server.fastmcp import FastMCP
-from app.tools import analyze
-import logging
+from app.tools import analyze, load_pipeline
+import asyncio, json, logging, sys
 
 # Initialize FastMCP server
 mcp = FastMCP(
@@ -42,9 +44,40 @@ async def analyze_stablecoin_risk(request: RfRRequest) -> RfRResponse:
     response: RfRResponse = await analyze(request)
     return response
 
+@mcp.resource(
+        "rfr://metrics",
+        name="RunFromRun-METRICS",
+        description="In-process server metrics (e.g. single-flight coalescing rate of PDF analyses).",
+        mime_type="application/json"
+)
+def server_metrics() -> str:
+    return json.dumps(metrics.snapshot())
+
+async def prepare_pipeline():
+    # 서버가 요청을 받기 시작한 뒤 분석 파이프라인을 별도 스레드에서 import하여, 첫 요청이 import를 기다리지 않도록 함
+    await asyncio.to_thread(load_pipeline)
+    if OLLAMASETTINGS.WARM_UP: # 첫 요청이 모델 로딩을 기다리지 않도록 미리 올려둠
+        from data_pulling.offchain.model_scheduler import get_model_scheduler
+        await get_model_scheduler().warm_up(OLLAMASETTINGS.MODELS)
+
+async def serve():
+    # FastMCP의 lifespan은 세션마다 실행되므로, 서버 시작 시 한 번만 필요한 작업은 서버와 같은 event loop에서 직접 시작
+    from data_pulling.offchain.cache_manager import run_eviction_loop # PDF 풀과 AssetTable 캐시 용량 관리
+    background_tasks: list[asyncio.Task] = [asyncio.create_task(prepare_pipeline()), asyncio.create_task(run_eviction_loop())]
+    try:
+        await mcp.run_streamable_http_async() # mcp.run(transport="streamable-http")과 동일
+    finally:
+        for task in background_tasks:
+            task.cancel()
+
 def main():
     logger.info("RfR Server Initiating...")
-    mcp.run(transport="streamable-http")
+    try:
+        asyncio.run(serve())
+    finally:
+        extraction_executor = sys.modules.get("data_pulling.offchain.extraction_executor")
+        if extraction_executor is not None: # 추출 풀을 사용한 적이 없으면 종료할 것도 없으므로 import하지 않음
+            extraction_executor.shutdown_extraction_executor()
     logger.info("Finished")
 
 if __name__ == "__main__":
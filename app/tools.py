@@ -1,18 +1,36 @@
 from common.schema import AssetTable, OnChainData, CoinData, Index, Indices, RiskResult, RfRRequest, RfRResponse
-from data_pulling.offchain.pdf_analysis import analyze_pdf
-from data_pulling.onchain.get_onchain import get_onchain_data
-from summary.threshold_check import check_thresholds_and_alarm
-from index_calculation import calculator
+from common.tracing import span, trace, traced
 from datetime import datetime
-import asyncio, logging
+import asyncio, importlib, logging, time
 from uuid import uuid4 
 
 logger = logging.getLogger("RunFromRun.Analyze")
 logger.setLevel(logging.DEBUG)
 
-async def _preprocess(id:str, report_pdf_url: str, stablecoin: str) -> CoinData:
-    asset_table_coro = analyze_pdf(id=id, report_pdf_url=report_pdf_url, stablecoin=stablecoin) # 로그 기록을 위해 id 필요
-    onchain_data_coro =  get_onchain_data(stablecoin=stablecoin)
+# 분석 파이프라인 모듈은 pandas, camelot, PyMuPDF, ollama, web3 등을 불러오므로 import에 수 초가 걸림.
+# 서버가 요청을 받기 전에 이 비용을 치르지 않도록 각 함수 안에서 import하고, 서버는 시작 직후 load_pipeline으로 미리 불러둠.
+PIPELINE_MODULES = (
+    "data_pulling.offchain.pdf_analysis",
+    "data_pulling.onchain.get_onchain",
+    "summary.threshold_check",
+    "index_calculation.calculator",
+    "web3", # evm.get_total_supply에서 처음 호출할 때 import하므로 여기서 미리 불러둠
+)
+
+def load_pipeline() -> float:
+    # 파이프라인 모듈을 모두 import하고 걸린 시간을 반환. event loop를 막지 않도록 별도 스레드에서 호출.
+    start = time.perf_counter()
+    for module in PIPELINE_MODULES:
+        importlib.import_module(module)
+    elapsed = time.perf_counter() - start
+    logger.info(f"Analysis pipeline loaded in {elapsed:.2f} seconds")
+    return elapsed
+
+async def _preprocess(id:str, report_pdf_url: str, stablecoin: str, issuer: str) -> CoinData:
+    from data_pulling.offchain.pdf_analysis import analyze_pdf
+    from data_pulling.onchain.get_onchain import get_onchain_data
+    asset_table_coro = traced("analyze_pdf", analyze_pdf(id=id, report_pdf_url=report_pdf_url, stablecoin=stablecoin, issuer=issuer)) # 로그 기록을 위해 id 필요
+    onchain_data_coro =  traced("onchain", get_onchain_data(stablecoin=stablecoin))
     asset_table, onchain_data = await asyncio.gather(asset_table_coro, onchain_data_coro)
     coin_data = CoinData(
         stablecoin_ticker=stablecoin, 
@@ -23,12 +41,15 @@ async def _preprocess(id:str, report_pdf_url: str, stablecoin: str) -> CoinData:
 
 def _calculate_indices(coin_data: CoinData) -> Indices:
     """Calculate OHS, RCR, RQS indices."""
-    FRRS_index: Index = calculator.calculate_FRRS(coin_data=coin_data)
-    OHS_index: Index = calculator.calculate_OHS(onchain_data=coin_data.onchain_data)
-    result_indices: Indices = calculator.calculate_TRS(FRRS=FRRS_index,OHS=OHS_index,coin_data=coin_data)
+    from index_calculation import calculator
+    with span("index_calculation"):
+        FRRS_index: Index = calculator.calculate_FRRS(coin_data=coin_data)
+        OHS_index: Index = calculator.calculate_OHS(onchain_data=coin_data.onchain_data)
+        result_indices: Indices = calculator.calculate_TRS(FRRS=FRRS_index,OHS=OHS_index,coin_data=coin_data)
     return result_indices
 
 def _alarm_and_complete(coin_data: CoinData, indices: Indices):
+    from summary.threshold_check import check_thresholds_and_alarm
     analysis = "Summary:\n" + check_thresholds_and_alarm(indices=indices)
     risk_result = RiskResult(
         coin_data=coin_data,
@@ -40,23 +61,26 @@ def _alarm_and_complete(coin_data: CoinData, indices: Indices):
 async def analyze(request: RfRRequest) -> RfRResponse:
     # 메인 프로세스: 지수 계산, 임계값 확인, 총 위험 점수 계산 및 응답 반환
     id:str = uuid4().hex
-    try:
-        logger.debug("Preprocessing...")
-        coin_data: CoinData = await _preprocess(id=id, report_pdf_url=request.provenance.report_pdf_url, stablecoin=request.stablecoin_ticker)
-        logger.debug("Preprocessing Complete. Starting Index Calculation")
-        indices: Indices =_calculate_indices(coin_data=coin_data)
-        logger.debug("Calculation Completed. Starting Alarming and Decision Making")
-        risk_result: RiskResult = _alarm_and_complete(coin_data=coin_data,indices=indices)
-        logger.debug("All Mision COMPLETED")
-    except Exception as e:
-        logger.error(f"Error during analyzing: {e}")
-        return RfRResponse(
-            id="Error",
-            err_status=str(e),
-            stablecoin_ticker = request.stablecoin_ticker,
-            provenance=request.provenance,
-            mcp_version=request.mcp_version,
-        )
+    # 이 요청에서 생성되는 모든 span에 id와 coin을 붙이고, trace id로 요청 id를 사용
+    with trace("analyze", trace_id=id, id=id, coin=request.stablecoin_ticker, issuer=request.provenance.report_issuer) as root_span:
+        try:
+            logger.debug("Preprocessing...")
+            coin_data: CoinData = await _preprocess(id=id, report_pdf_url=request.provenance.report_pdf_url, stablecoin=request.stablecoin_ticker, issuer=request.provenance.report_issuer)
+            logger.debug("Preprocessing Complete. Starting Index Calculation")
+            indices: Indices =_calculate_indices(coin_data=coin_data)
+            logger.debug("Calculation Completed. Starting Alarming and Decision Making")
+            risk_result: RiskResult = _alarm_and_complete(coin_data=coin_data,indices=indices)
+            logger.debug("All Mision COMPLETED")
+        except Exception as e:
+            logger.error(f"Error during analyzing: {e}")
+            root_span.record_error(e)
+            return RfRResponse(
+                id="Error",
+                err_status=str(e),
+                stablecoin_ticker = request.stablecoin_ticker,
+                provenance=request.provenance,
+                mcp_version=request.mcp_version,
+            )
     return RfRResponse(
         id=id,
         evaluation_time=datetime.now(),
@@ -0,0 +1,19 @@
+# 프로세스 내부 지표(metric) 모음.
+# 각 모듈은 자신의 통계를 dict로 반환하는 collector를 등록하고, 서버는 snapshot()으로 한 번에 노출함.
+from typing import Callable
+import threading
+
+_collectors: dict[str, Callable[[], dict]] = {}
+_lock = threading.Lock()
+
+def register_collector(name: str, collector: Callable[[], dict]):
+    with _lock:
+        _collectors[name] = collector
+
+def snapshot() -> dict[str, dict]:
+    with _lock:
+        collectors = dict(_collectors)
+    return {name: collector() for name, collector in collectors.items()}
+
+def ratio(numerator: float, denominator: float) -> float:
+    return numerator / denominator if denominator else 0.0
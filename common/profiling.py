@@ -0,0 +1,147 @@
+# 분석 과정 프로파일링 sink.
+# 기존에는 PDF 분석이 끝날 때마다 요청 처리 경로에서 pyplot으로 지연시간 그림을 그려 작업 디렉토리에 저장했으며,
+# pyplot figure를 닫지 않아 요청마다 메모리가 늘어났음.
+# 이제 분석 코드는 get_profiling_sink()에 지연시간/결과만 넘기고, 무엇을 할지는 PROFILING.SINK로 선택한 sink가 결정함.
+# - "none" (기본값): 아무것도 하지 않음
+# - "plot": 별도 스레드에서 matplotlib Figure(OO API, pyplot 전역 상태 없음)로 그려 PROFILING_ARTIFACT_DIR에 저장하고,
+#           파일 수는 PROFILING_MAX_ARTIFACTS로 제한
+# 다른 sink(예: 외부 대시보드 전송)는 register_sink로 추가.
+from common import metrics
+from common.schema import AssetTable
+from common.settings import MOUNTED_DIR, PROFILING
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+import logging, threading, time
+from uuid import uuid4
+
+logger = logging.getLogger("RunFromRun.Profiling")
+logger.setLevel(logging.DEBUG)
+
+# 응답에 실패하거나 early quorum으로 취소된 모델은 delay_dict에 없으므로 색상은 항목 이름으로 결정
+COLOR_BY_JOB = {"layout_template": "olive", "rule_extraction": "cyan", "openfigi": "purple", "preprocess_delay": "blue", "early_exit_saved": "gray", "voting_delay": "orange", "e2e_delay": "red"}
+ARTIFACT_PATTERN = "*_pdf_analysis_*.png"
+
+def artifact_dir() -> Path:
+    return PROFILING.ARTIFACT_DIR or MOUNTED_DIR / "profiling"
+
+def prune_artifacts(directory: Path, max_artifacts: int):
+    # 가장 최근 max_artifacts개만 남기고 삭제
+    artifacts = sorted(directory.glob(ARTIFACT_PATTERN), key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in artifacts[max_artifacts:]:
+        path.unlink(missing_ok=True)
+
+def _artifact_path(directory: Path, stablecoin: str, kind: str) -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f"{stablecoin}_pdf_analysis_{kind}_{time.strftime('%Y%m%d-%H%M%S')}_{uuid4().hex[:6]}.png"
+
+def _save_bar_chart(path: Path, names: list[str], values: list[float], title: str, xlabel: str, ylabel: str, colors: Optional[list[str]] = None):
+    from matplotlib.figure import Figure # pyplot과 달리 전역 figure 목록에 등록되지 않아 스레드에서 사용 가능하고, 참조가 없어지면 해제됨
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.bar(names, values, color=colors)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.tick_params(axis="x", labelrotation=30)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment("right")
+    fig.tight_layout()   # 라벨 잘림 방지
+    fig.savefig(path)
+
+# Analysis 결과 시각화 함수. 테스트 스크립트에서는 직접 호출하고, 서버에서는 PlotSink가 별도 스레드에서 호출.
+def plotit_asset_tables(stablecoin: str, asset_table: AssetTable, output_dir: Optional[Path] = None) -> Path:
+    directory = output_dir or artifact_dir()
+    asset_names = []
+    asset_values = []
+    for name, asset in asset_table.to_list():
+        asset_names.append(name)
+        asset_values.append(asset.amount)
+    path = _artifact_path(directory, stablecoin, "assets")
+    _save_bar_chart(path, asset_names, asset_values, f'Asset proportion : {stablecoin}', 'Asset', 'US Dollar')
+    prune_artifacts(directory, PROFILING.MAX_ARTIFACTS)
+    return path
+
+def plotit_delay(stablecoin: str, delay_dict: dict[str, float], output_dir: Optional[Path] = None) -> Path:
+    directory = output_dir or artifact_dir()
+    delay_name = list(delay_dict)
+    delay_time = list(delay_dict.values())
+    colors = [COLOR_BY_JOB.get(name, "green") for name in delay_name]
+    path = _artifact_path(directory, stablecoin, "delay")
+    _save_bar_chart(path, delay_name, delay_time, f'Delay proportion : {stablecoin} PDF analysis in RTX 5070', 'Job', 'Seconds', colors)
+    prune_artifacts(directory, PROFILING.MAX_ARTIFACTS)
+    return path
+
+# ============== Sink ==============
+class ProfilingSink:
+    # 기본 sink: 아무것도 하지 않음 (PROFILING_SINK="none")
+    def record_delays(self, stablecoin: str, delay_dict: dict[str, float]):
+        pass
+
+    def record_asset_table(self, stablecoin: str, asset_table: AssetTable):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+class PlotSink(ProfilingSink):
+    # 요청 처리 경로에서는 그릴 작업만 넘기고 바로 반환. 그리기는 스레드 하나에서 순서대로 처리.
+    def __init__(self, max_pending: int):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profiling")
+        self._max_pending = max(1, max_pending)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stats = {"rendered": 0, "dropped": 0, "failed": 0}
+
+    def _submit(self, render: Callable[..., Path], *args):
+        with self._lock:
+            if self._pending >= self._max_pending: # 그리기가 밀리면 메모리를 쌓지 않고 버림
+                self._stats["dropped"] += 1
+                logger.debug(f"Profiling queue is full, dropping {render.__name__} for {args[0]}")
+                return
+            self._pending += 1
+        self._executor.submit(render, *args).add_done_callback(self._done)
+
+    def _done(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+            if future.exception() is not None:
+                self._stats["failed"] += 1
+                logger.warning(f"Failed to render profiling artifact: {future.exception()}")
+            else:
+                self._stats["rendered"] += 1
+                logger.debug(f"Profiling artifact written to {future.result()}")
+
+    def record_delays(self, stablecoin: str, delay_dict: dict[str, float]):
+        self._submit(plotit_delay, stablecoin, dict(delay_dict))
+
+    def record_asset_table(self, stablecoin: str, asset_table: AssetTable):
+        self._submit(plotit_asset_tables, stablecoin, asset_table)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return self._stats | {"pending": self._pending, "artifact_dir": str(artifact_dir())}
+
+_sink_factories: dict[str, Callable[[], ProfilingSink]] = {
+    "none": ProfilingSink,
+    "plot": lambda: PlotSink(PROFILING.MAX_PENDING),
+}
+_sink: Optional[ProfilingSink] = None
+
+def register_sink(name: str, factory: Callable[[], ProfilingSink]):
+    _sink_factories[name] = factory
+
+def get_profiling_sink() -> ProfilingSink:
+    global _sink
+    if _sink is None:
+        # 개발용 설정이므로 알 수 없는 이름 때문에 이미 끝난 분석 요청이 실패하지 않도록 경고 후 기본 sink 사용.
+        # register_sink로 sink를 추가할 수 있어 설정을 읽는 시점에는 이름을 검증할 수 없음.
+        if PROFILING.SINK not in _sink_factories:
+            logger.warning(f"Unknown profiling sink {PROFILING.SINK!r} (available: {', '.join(_sink_factories)}), profiling disabled")
+            _sink = ProfilingSink()
+        else:
+            _sink = _sink_factories[PROFILING.SINK]()
+            logger.info(f"Profiling sink: {PROFILING.SINK}")
+    return _sink
+
+metrics.register_collector("profiling", lambda: _sink.stats() if _sink else {})
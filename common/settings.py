@@ -70,12 +70,87 @@ class OllamaSettings(BaseSettings):
     MODELS: list[str] | str
     HOST: str
     MAX_ROWS_PER_TABLE: int  # Not directly used for ollama, but dependent to model capacity
+    # Voting 방식: sequential은 모델을 하나씩 호출, concurrent는 MAX_PARALLEL_MODELS개까지 동시에 호출
+    VOTING_MODE: Literal["sequential", "concurrent"] = "concurrent"
+    MAX_PARALLEL_MODELS: int = 2  # 동시에 올라가는 모델 수는 GPU/메모리 용량에 맞게 조정
+    EARLY_QUORUM: bool = True     # 남은 모델이 어떤 값을 내도 중간값이 바뀌지 않으면 기다리지 않고 종료
+    # 모델 상주 시간(Ollama keep_alive 형식, 예: "30m", "-1"은 계속 유지). 서버 시작 시 WARM_UP이면 모델을 미리 올려둠
+    KEEP_ALIVE: str = "30m"
+    WARM_UP: bool = True
+    # 모델별 응답 제한 시간(초). 넘기면 해당 모델은 중단하고 나머지 응답으로 투표. 모델별 값은 JSON으로 지정
+    DEADLINE_SECONDS: float = 300.0
+    DEADLINES: dict[str, float] = {}
+    # 프롬프트에 넣을 표의 토큰 예산(문자 4개 ≈ 1토큰으로 추정). 모델별 값은 JSON으로 지정하며 없으면 TOKEN_BUDGET 사용
+    TOKEN_BUDGET: int = 6000
+    TOKEN_BUDGETS: dict[str, int] = {}
 
     def post_process(self):
         if isinstance(self.MODELS, str):
             self.MODELS = parse_from_string_env(self.MODELS, is_num=False)
         return self
 
+class ExtractionSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="EXTRACTION_", env_file= "../.env", env_file_encoding= "utf-8", extra="ignore") #[DEBUG] for development purpose
+    # Camelot/PyMuPDF 표 추출은 CPU 작업이므로 event loop가 아닌 별도 프로세스에서 실행
+    MAX_WORKERS: int = max(1, (os.cpu_count() or 2) - 1)  # 서버 프로세스 몫으로 코어 하나는 남겨둠
+    QUEUE_SIZE: int = 8           # 실행 중인 작업 외에 대기할 수 있는 추출 작업 수
+    QUEUE_TIMEOUT: float = 300.0  # 대기열이 가득 찬 경우 자리가 날 때까지 기다리는 최대 시간(초)
+    # Camelot 실행 전 PyMuPDF 텍스트로 준비금 표가 있을 법한 페이지만 고름
+    PAGE_PRESCREEN: bool = True
+    TOP_PAGES: int = 3            # 키워드 점수 상위 몇 페이지를 Camelot으로 넘길지
+    # 표 추출 엔진: "camelot", "pymupdf"(PyMuPDF page.find_tables, 페이지 렌더링 없이 추출), "auto"(두 엔진을 비교하여 점수가 높은 쪽을 기록)
+    # CAMELOT_MODE의 flavor는 선택한 엔진의 같은 방식으로 바뀜 (lattice → pymupdf_lines, hybrid/stream → pymupdf_text)
+    ENGINE: Literal["camelot", "pymupdf", "auto"] = "camelot"
+    ENGINES: dict[str, Literal["camelot", "pymupdf", "auto"]] = {}  # 코인별 엔진 (예: {"USDT": "pymupdf"}), 없으면 ENGINE
+    PYMUPDF_MAX_DRAWINGS: int = 1000 # 벡터 도형이 이보다 많은 페이지는 find_tables가 수십 초 걸리므로 같은 방식의 Camelot flavor로 추출
+    # CAMELOT_MODE에 없는 코인이나 "auto"로 지정한 코인은 아래 flavor들로 동시에 추출하여 점수가 가장 높은 결과를 사용
+    # 선택된 flavor는 발행사(Provenance.report_issuer)별로 기록하여 다음 보고서부터는 비교 없이 바로 사용
+    AUTO_FLAVORS: list[str] = ["lattice", "hybrid"]
+    # 규칙 기반 추출 결과가 보고서 합계와 RULE_TOLERANCE(비율) 안에서 맞으면 LLM 투표를 건너뜀
+    RULE_FAST_PATH: bool = True
+    RULE_TOLERANCE: float = 0.002
+    # 분석이 끝난 보고서의 표 위치와 행 이름 대응을 (발행사, 코인)별 템플릿으로 기록하고, 다음 보고서는 해당 영역만 추출
+    LAYOUT_TEMPLATES: bool = True
+    LAYOUT_AREA_MARGIN: float = 12.0 # 기록된 표 bbox 주변 여유(PDF point, hybrid/stream만). 행이 조금 늘어나도 영역 안에 들어오도록 함
+
+class CacheSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="CACHE_", env_file= "../.env", env_file_encoding= "utf-8", extra="ignore") #[DEBUG] for development purpose
+    # 같은 report_pdf_url은 ETag/Last-Modified 조건부 요청으로 변경 여부만 확인하고 본문은 받지 않음
+    URL_REVALIDATE: bool = True
+    URL_SIZE_MATCH: bool = True   # 서버가 ETag/Last-Modified를 주지 않으면 HEAD의 Content-Length 일치로 판단
+    # OpenFIGI CUSIP 해석 결과 캐시. 국채 CUSIP은 여러 보고서에서 반복되므로 재사용
+    CUSIP_TTL_DAYS: float = 90.0          # 해석에 성공한 CUSIP
+    CUSIP_NEGATIVE_TTL_DAYS: float = 7.0  # "UNVALID CUSIP" 결과 (새로 발행된 CUSIP이 나중에 등록될 수 있어 짧게 유지)
+    CUSIP_MAX_ENTRIES: int = 50000        # 초과 시 가장 오래 사용되지 않은 항목부터 삭제
+    # 파일 해시가 달라도 준비금 페이지 텍스트(DocuSign ID 등 변하는 토큰 제외)가 같으면 기존 AssetTable 재사용
+    CONTENT_FINGERPRINT: bool = True
+    # PDF 풀(컨테이너)과 AssetTable 캐시(캐시 인덱스) 용량 제한. 초과하면 백그라운드에서 가장 오래 사용되지 않은 항목부터 삭제
+    PDF_POOL_MAX_BYTES: int = 2 * 1024**3
+    PDF_POOL_MAX_ENTRIES: int = 1000
+    ASSET_TABLE_MAX_BYTES: int = 64 * 1024**2
+    ASSET_TABLE_MAX_ENTRIES: int = 20000
+    TABLE_ARTIFACT_MAX_BYTES: int = 512 * 1024**2 # 후처리된 표 artifact(table_artifacts) 최대 용량
+    PAGE_CACHE_MAX_BYTES: int = 512 * 1024**2     # 페이지별 원본 표 캐시(page_tables) 최대 용량
+    EVICTION_INTERVAL: float = 600.0      # 초
+
+class ProfilingSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="PROFILING_", env_file= "../.env", env_file_encoding= "utf-8", extra="ignore") #[DEBUG] for development purpose
+    # 분석 지연시간/자산 구성 시각화. 요청 처리와 무관한 개발용 기능이므로 기본값은 사용하지 않음
+    SINK: str = "none"                # "none" 또는 "plot" (profiling.register_sink로 추가한 sink 이름도 가능, 알 수 없는 이름이면 경고 후 "none")
+    ARTIFACT_DIR: Path | None = None  # 그림을 저장할 디렉토리 (기본값: MOUNTED_DIR/profiling)
+    MAX_ARTIFACTS: int = 100          # 초과 시 가장 오래된 그림부터 삭제
+    MAX_PENDING: int = 8              # 그리기를 기다리는 작업 수 상한, 초과 시 새 작업은 버림
+
+class TracingSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="TRACING_", env_file= "../.env", env_file_encoding= "utf-8", extra="ignore") #[DEBUG] for development purpose
+    # 분석 단계별 span. 단계별 p50/p95는 항상 metrics로 노출하고, 아래 설정에 따라 span 원본을 내보냄
+    JSONL: bool = False                # span을 JSON lines 파일로 기록
+    JSONL_PATH: Path | None = None     # 기본값: MOUNTED_DIR/traces/spans.jsonl
+    JSONL_MAX_BYTES: int = 50_000_000  # 초과 시 .1 파일로 교체하고 새 파일에 기록
+    OTLP_ENDPOINT: str | None = None   # OTLP/HTTP(JSON) collector 주소 (예: http://localhost:4318/v1/traces)
+    SERVICE_NAME: str = "runfromrun"
+    WINDOW: int = 1000                 # span 이름별로 p50/p95 계산에 사용할 최근 span 수
+
 class APIKeys(BaseSettings):
     model_config = SettingsConfigDict(env_prefix="API_KEY_", env_file= "../.env", env_file_encoding= "utf-8", extra="ignore") #[DEBUG] for development purpose
     OPENAI: str | None
@@ -103,6 +178,10 @@ class ChainRPCURLs(BaseSettings):
 AVAILABLE = Available().post_process()
 THRESHOLDS = Thresholds()
 OLLAMASETTINGS = OllamaSettings().post_process()   
+EXTRACTION = ExtractionSettings()
+CACHE = CacheSettings()
+PROFILING = ProfilingSettings()
+TRACING = TracingSettings()
 API_KEYS = APIKeys()
 API_URLS = APIURLs()
 CHAIN_RPC_URLS = ChainRPCURLs()
@@ -0,0 +1,249 @@
+# 요청 단위 span tracing.
+# 기존에는 analyze_pdf_local_llm 안의 delay_dict만 로그로 남기고 버렸기 때문에, 어느 단계에서 p95 지연이 생기는지 알 수 없었음.
+# 각 단계를 `with span("이름", 속성=...)`으로 감싸면 시작/종료 시각, 부모 span, 오류 여부가 기록됨.
+# - 현재 span과 요청 단위 속성(id, coin)은 contextvars로 전달되므로 asyncio.gather, create_task, to_thread로 만든 작업에도 이어짐
+# - 모든 span은 이름별로 최근 TRACING.WINDOW개의 지연시간을 보관하여 metrics("tracing")로 p50/p95를 노출
+# - TRACING_JSONL이면 JSON lines 파일로, TRACING_OTLP_ENDPOINT가 있으면 OTLP/HTTP(JSON)로 별도 스레드에서 내보냄
+from common import metrics
+from common.settings import MOUNTED_DIR, TRACING
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Iterator, Optional, TypeVar
+import asyncio, atexit, json, logging, math, os, queue, threading, time
+from uuid import uuid4
+
+logger = logging.getLogger("RunFromRun.Tracing")
+logger.setLevel(logging.DEBUG)
+
+T = TypeVar("T")
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    attributes: dict[str, Any]
+    start_ns: int = field(default_factory=time.time_ns)
+    duration: float = 0.0 # 초
+    status: str = "ok"    # "ok", "error", "cancelled"
+    error: Optional[str] = None
+
+    def set(self, **attributes):
+        # 시작할 때 알 수 없는 속성(캐시 적중 여부, 결과 개수 등)은 span 안에서 추가
+        self.attributes.update(attributes)
+
+    def record_error(self, e: BaseException):
+        # 예외를 처리하여 span 밖으로 전달되지 않는 경우에도 실패로 기록
+        self.status = "error"
+        self.error = f"{type(e).__name__}: {e}"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start_ns / 1e9,
+            "duration": self.duration,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("rfr_current_span", default=None)
+_trace_attributes: ContextVar[dict[str, Any]] = ContextVar("rfr_trace_attributes", default={})
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    # 현재 span의 자식 span을 열고, 블록이 끝나면 종료 시각과 결과(정상/오류/취소)를 기록. 예외는 그대로 전달.
+    parent = _current_span.get()
+    current = Span(
+        name=name,
+        trace_id=parent.trace_id if parent else uuid4().hex,
+        span_id=uuid4().hex[:16],
+        parent_id=parent.span_id if parent else None,
+        attributes=_trace_attributes.get() | attributes,
+    )
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except (asyncio.CancelledError, GeneratorExit):
+        current.status = "cancelled"
+        raise
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        _current_span.reset(token)
+        _finish(current)
+
+@contextmanager
+def trace(name: str, trace_id: Optional[str] = None, **attributes) -> Iterator[Span]:
+    # 요청 하나의 최상위 span. attributes(id, coin 등)는 이 요청에서 생성되는 모든 span에 붙음.
+    attributes_token = _trace_attributes.set(_trace_attributes.get() | attributes)
+    parent_token = _current_span.set(None)
+    try:
+        with span(name) as root:
+            if trace_id:
+                root.trace_id = trace_id
+            yield root
+    finally:
+        _current_span.reset(parent_token)
+        _trace_attributes.reset(attributes_token)
+
+async def traced(name: str, awaitable: Awaitable[T], **attributes) -> T:
+    # asyncio.gather에 넘기는 코루틴처럼 with 블록으로 감싸기 어려운 경우에 사용
+    with span(name, **attributes):
+        return await awaitable
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+# ============== 단계별 지연시간 통계 ==============
+_durations: dict[str, deque[float]] = defaultdict(lambda: deque(maxlen=TRACING.WINDOW))
+_counts: dict[str, int] = defaultdict(int)
+_errors: dict[str, int] = defaultdict(int)
+_stats_lock = threading.Lock()
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    # nearest-rank 방식
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def tracing_stats() -> dict:
+    with _stats_lock:
+        durations = {name: sorted(values) for name, values in _durations.items()}
+        counts, errors = dict(_counts), dict(_errors)
+    return {
+        "spans": {
+            name: {
+                "count": counts[name],
+                "errors": errors.get(name, 0),
+                "p50": _percentile(values, 0.50),
+                "p95": _percentile(values, 0.95),
+                "max": values[-1] if values else 0.0,
+            }
+            for name, values in sorted(durations.items())
+        },
+        "export": dict(_export_stats),
+    }
+
+metrics.register_collector("tracing", tracing_stats)
+
+def _finish(finished: Span):
+    with _stats_lock:
+        _durations[finished.name].append(finished.duration)
+        _counts[finished.name] += 1
+        if finished.status == "error":
+            _errors[finished.name] += 1
+    if TRACING.JSONL or TRACING.OTLP_ENDPOINT:
+        _ensure_exporter()
+        _export_queue.put(finished)
+
+# ============== 내보내기 ==============
+# 요청 처리 경로에서는 큐에 넣기만 하고, 파일 기록과 OTLP 전송은 별도 스레드에서 묶어서 처리
+EXPORT_BATCH_SIZE = 256
+EXPORT_INTERVAL = 2.0 # 초
+_export_queue: "queue.SimpleQueue[Span]" = queue.SimpleQueue()
+_export_stats = {"exported": 0, "failed": 0}
+_exporter: Optional[threading.Thread] = None
+_exporter_lock = threading.Lock()
+
+def jsonl_path() -> Path:
+    return TRACING.JSONL_PATH or MOUNTED_DIR / "traces" / "spans.jsonl"
+
+def _write_jsonl(spans: list[Span]):
+    path = jsonl_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists() and path.stat().st_size > TRACING.JSONL_MAX_BYTES:
+        os.replace(path, path.with_name(path.name + ".1"))
+    with open(path, "a", encoding="utf-8") as f:
+        for finished in spans:
+            f.write(json.dumps(finished.to_dict(), default=str) + "\n")
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+def _otlp_span(finished: Span) -> dict:
+    otlp_span = {
+        "traceId": finished.trace_id,
+        "spanId": finished.span_id,
+        "name": finished.name,
+        "kind": 1, # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(finished.start_ns),
+        "endTimeUnixNano": str(finished.start_ns + int(finished.duration * 1e9)),
+        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in finished.attributes.items() if value is not None],
+        "status": {"code": 2, "message": finished.error or finished.status} if finished.status != "ok" else {"code": 1},
+    }
+    if finished.parent_id:
+        otlp_span["parentSpanId"] = finished.parent_id
+    return otlp_span
+
+def _post_otlp(spans: list[Span]):
+    import httpx
+    payload = {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACING.SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "RunFromRun"}, "spans": [_otlp_span(finished) for finished in spans]}],
+    }]}
+    response = httpx.post(TRACING.OTLP_ENDPOINT, json=payload, timeout=5)
+    response.raise_for_status()
+
+def _export(spans: list[Span]):
+    for enabled, exporter in ((TRACING.JSONL, _write_jsonl), (TRACING.OTLP_ENDPOINT, _post_otlp)):
+        if not enabled:
+            continue
+        try:
+            exporter(spans)
+        except Exception as e: # 내보내기 실패로 분석이 영향을 받지 않도록 기록만 함
+            _export_stats["failed"] += len(spans)
+            logger.warning(f"Failed to export {len(spans)} spans with {exporter.__name__}: {e}")
+        else:
+            _export_stats["exported"] += len(spans)
+
+def flush():
+    # 큐에 남은 span을 모두 내보냄. 프로세스 종료 시 자동으로 호출.
+    spans: list[Span] = []
+    while True:
+        try:
+            spans.append(_export_queue.get_nowait())
+        except queue.Empty:
+            break
+    for i in range(0, len(spans), EXPORT_BATCH_SIZE):
+        _export(spans[i:i + EXPORT_BATCH_SIZE])
+
+def _export_loop():
+    while True:
+        batch = [_export_queue.get()]
+        deadline = time.monotonic() + EXPORT_INTERVAL
+        while len(batch) < EXPORT_BATCH_SIZE and (remaining := deadline - time.monotonic()) > 0:
+            try:
+                batch.append(_export_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        _export(batch)
+
+def _ensure_exporter():
+    global _exporter
+    if _exporter is not None:
+        return
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = threading.Thread(target=_export_loop, name="span-exporter", daemon=True)
+            _exporter.start()
+            atexit.register(flush)
@@ -0,0 +1,153 @@
+# 마운트 디렉토리의 캐시 인덱스 (SQLite, WAL 모드)
+# 기존에는 pdfHash_id.log를 매 요청마다 한 줄씩 읽어 선형 탐색하고, 잠금 없이 append 하였음.
+# => 기록이 쌓일수록 조회 비용이 커지고, 동시에 쓰는 경우 줄이 섞일 수 있음.
+# SQLite는 pdf_hash 기본키로 O(1)에 가깝게 조회하며, 트랜잭션 단위로 원자적으로 기록함.
+from common.settings import MOUNTED_DIR
+from common.schema import AssetTable
+from contextlib import contextmanager
+from pathlib import Path
+import logging, sqlite3, threading
+
+logger = logging.getLogger("RunFromRun.Analyze.Offchain.Cache_Index")
+logger.setLevel(logging.DEBUG)
+
+INDEX_DB_PATH: Path = MOUNTED_DIR / "rfr_cache.sqlite3"
+LEGACY_LOG_PATH: Path = MOUNTED_DIR / "pdfHash_id.log"
+LEGACY_ASSET_TABLE_DIR: Path = MOUNTED_DIR / "asset_tables"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS asset_tables (
+    pdf_hash         TEXT PRIMARY KEY,
+    id               TEXT NOT NULL,
+    coin             TEXT,
+    url              TEXT,
+    analysis_time    TEXT NOT NULL,
+    asset_table_json TEXT NOT NULL,
+    last_access      REAL
+);
+CREATE TABLE IF NOT EXISTS cusip_descriptions (
+    cusip        TEXT PRIMARY KEY,
+    description  TEXT NOT NULL,
+    resolved_at  REAL NOT NULL,
+    last_access  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cusip_descriptions_last_access ON cusip_descriptions (last_access);
+CREATE TABLE IF NOT EXISTS llm_responses (
+    cache_key    TEXT PRIMARY KEY,
+    model        TEXT NOT NULL,
+    digest       TEXT NOT NULL,
+    prompt_key   TEXT,
+    content      TEXT NOT NULL,
+    latency      REAL NOT NULL,
+    created_at   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS flavor_choices (
+    issuer       TEXT PRIMARY KEY,
+    flavor       TEXT NOT NULL,
+    scores_json  TEXT NOT NULL,
+    chosen_at    REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS content_fingerprints (
+    fingerprint  TEXT PRIMARY KEY,
+    pdf_hash     TEXT NOT NULL,
+    created_at   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pdf_aliases (
+    pdf_hash        TEXT PRIMARY KEY,
+    canonical_hash  TEXT NOT NULL,
+    fingerprint     TEXT NOT NULL,
+    created_at      REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS layout_templates (
+    issuer         TEXT NOT NULL,
+    coin           TEXT NOT NULL,
+    template_json  TEXT NOT NULL,
+    learned_from   TEXT NOT NULL,
+    learned_at     REAL NOT NULL,
+    PRIMARY KEY (issuer, coin)
+);
+CREATE TABLE IF NOT EXISTS index_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_initialized = False
+_init_lock = threading.Lock()
+
+def _open() -> sqlite3.Connection:
+    conn = sqlite3.connect(INDEX_DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL") # WAL 모드에서는 NORMAL로도 커밋된 트랜잭션이 깨지지 않음
+    return conn
+
+def _initialize(conn: sqlite3.Connection):
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        conn.executescript(SCHEMA)
+        add_missing_columns(conn)
+        migrate_legacy_cache(conn)
+        _initialized = True
+
+@contextmanager
+def connect():
+    # 요청마다 짧게 연결을 열고 닫음. 블록이 정상 종료되면 commit, 예외가 발생하면 rollback.
+    conn = _open()
+    try:
+        _initialize(conn)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def issuer_key(issuer: str) -> str:
+    # 발행사별 기록(flavor_choices, layout_templates)의 키. Provenance.report_issuer의 대소문자/공백 차이는 같은 발행사로 봄.
+    return " ".join(issuer.lower().split())
+
+def add_missing_columns(conn: sqlite3.Connection):
+    # CREATE TABLE IF NOT EXISTS는 기존 테이블에 새 열을 추가하지 않으므로 이전 버전에서 만든 인덱스에 직접 추가
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(asset_tables)")}
+    if "last_access" not in columns:
+        with conn:
+            conn.execute("ALTER TABLE asset_tables ADD COLUMN last_access REAL")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(llm_responses)")}
+    with conn:
+        if "prompt_key" not in columns:
+            conn.execute("ALTER TABLE llm_responses ADD COLUMN prompt_key TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_responses_by_prompt ON llm_responses (model, prompt_key, created_at)")
+
+def migrate_legacy_cache(conn: sqlite3.Connection):
+    # 기존 pdfHash_id.log와 asset_tables/*.json을 한 번만 인덱스로 가져옴
+    if conn.execute("SELECT 1 FROM index_meta WHERE key = 'legacy_log_migrated'").fetchone():
+        return
+    imported = 0
+    if LEGACY_LOG_PATH.exists():
+        with conn: # 한 트랜잭션으로 가져와서 중간에 실패하면 다음 실행에서 다시 시도
+            with LEGACY_LOG_PATH.open("r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    pdf_hash, _, id = line.partition("_")
+                    asset_table_file = LEGACY_ASSET_TABLE_DIR / f"{pdf_hash}.json"
+                    if not asset_table_file.exists(): # 결과 파일 없이 로그만 남은 경우는 다시 분석되도록 가져오지 않음
+                        continue
+                    json_str = asset_table_file.read_text(encoding="utf-8")
+                    try:
+                        asset_table = AssetTable.model_validate_json(json_str)
+                    except Exception as e:
+                        logger.warning(f"Skipping broken legacy cache file {asset_table_file.name}: {e}")
+                        continue
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO asset_tables (pdf_hash, id, analysis_time, asset_table_json) VALUES (?, ?, ?, ?)",
+                        (pdf_hash, id, asset_table.pdf_analysis_time.isoformat(), json_str),
+                    )
+                    imported += cursor.rowcount
+            conn.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES ('legacy_log_migrated', '1')")
+    else:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES ('legacy_log_migrated', '1')")
+    if imported:
+        logger.info(f"Migrated {imported} cached AssetTables from {LEGACY_LOG_PATH.name} into {INDEX_DB_PATH.name}")
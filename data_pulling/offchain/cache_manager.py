@@ -0,0 +1,185 @@
+# PDF 풀, AssetTable 캐시, 페이지 캐시와 표 artifact의 용량 관리.
+# 기존에는 컨테이너의 PDF 풀(data_pulling/offchain/pdf)과 AssetTable 캐시가 계속 늘어나기만 하여, 오래 실행하면 디스크가 가득 차고 디렉토리 조회가 느려졌음.
+# - PDF 풀: 파일 mtime을 마지막 사용 시각으로 사용 (다운로드/재사용 시 touch_pdf로 갱신)
+# - AssetTable 캐시: 캐시 인덱스 asset_tables의 last_access 열 (조회 시 갱신)
+# - 페이지 캐시(page_tables), 표 artifact(table_artifacts): 파일 mtime (읽을 때 갱신). 파일 이름이 <pdf_hash>_로 시작함.
+# 서버는 CACHE.EVICTION_INTERVAL마다 run_eviction_loop에서 각 저장소의 용량(byte)과 개수 제한을 확인하고,
+# 초과하면 가장 오래 사용되지 않은 항목부터 삭제함. 분석 중인 요청이 pinned()로 잡고 있는 pdf_hash는 삭제하지 않음.
+from common import metrics
+from common.settings import CACHE
+from data_pulling.offchain import cache_index
+from data_pulling.offchain.pdf_fetch_caching import PDF_POOL_DIRECTORY
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+import asyncio, logging, math, re, threading, time
+
+logger = logging.getLogger("RunFromRun.Analyze.Offchain.Cache_Manager")
+logger.setLevel(logging.DEBUG)
+
+PARTIAL_DOWNLOAD_MAX_AGE = 24 * 3600 # 다운로드 도중 중단되어 남은 .part 파일 정리 기준(초)
+POOLED_PDF = re.compile(r"^[0-9a-f]{64}$") # download_and_hash_pdf가 저장한 <sha256>.pdf만 관리 (직접 넣어둔 파일은 건드리지 않음)
+
+# ============== Pin ==============
+_pins: Counter[str] = Counter()
+_pins_lock = threading.Lock()
+
+@contextmanager
+def pinned(pdf_hash: str) -> Iterator[None]:
+    # 블록이 끝날 때까지 해당 pdf_hash의 PDF와 AssetTable은 삭제되지 않음 (같은 pdf_hash를 여러 요청이 잡을 수 있음)
+    with _pins_lock:
+        _pins[pdf_hash] += 1
+    try:
+        yield
+    finally:
+        with _pins_lock:
+            _pins[pdf_hash] -= 1
+            if _pins[pdf_hash] <= 0:
+                del _pins[pdf_hash]
+
+def pinned_hashes() -> set[str]:
+    with _pins_lock:
+        return set(_pins)
+
+# ============== Eviction ==============
+_stats = {"runs": 0, "evicted_pdfs": 0, "evicted_asset_tables": 0, "evicted_table_files": 0, "skipped_pinned": 0, "last_run": None}
+
+def _over_budget(kept_bytes: int, kept_entries: int, size: int, max_bytes: int, max_entries: int) -> bool:
+    return kept_entries + 1 > max_entries or kept_bytes + size > max_bytes
+
+def evict_pdf_pool(max_bytes: Optional[int] = None, max_entries: Optional[int] = None) -> int:
+    # 최근에 사용한 PDF부터 제한 안에 들어가는 만큼 남기고 나머지를 삭제. 삭제한 파일 수 반환.
+    max_bytes = CACHE.PDF_POOL_MAX_BYTES if max_bytes is None else max_bytes
+    max_entries = CACHE.PDF_POOL_MAX_ENTRIES if max_entries is None else max_entries
+    now = time.time()
+    entries = []
+    for path in PDF_POOL_DIRECTORY.iterdir():
+        try:
+            stat = path.stat()
+        except FileNotFoundError: # 다른 요청이 방금 옮기거나 삭제한 경우
+            continue
+        if path.suffix == ".part":
+            if now - stat.st_mtime > PARTIAL_DOWNLOAD_MAX_AGE:
+                path.unlink(missing_ok=True)
+            continue
+        if path.suffix == ".pdf" and POOLED_PDF.match(path.stem):
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    kept_bytes = kept_entries = evicted = 0
+    for _, size, path in sorted(entries, reverse=True):
+        if not _over_budget(kept_bytes, kept_entries, size, max_bytes, max_entries):
+            kept_bytes += size
+            kept_entries += 1
+            continue
+        with _pins_lock: # 확인과 삭제 사이에 요청이 pin 하지 못하도록 잠금을 잡은 채로 삭제
+            if path.stem in _pins:
+                _stats["skipped_pinned"] += 1
+                kept_bytes += size
+                kept_entries += 1
+                continue
+            path.unlink(missing_ok=True)
+        evicted += 1
+    if evicted:
+        logger.info(f"Evicted {evicted} PDFs from the PDF pool ({kept_entries} files, {kept_bytes} bytes kept)")
+    return evicted
+
+def evict_asset_tables(max_bytes: Optional[int] = None, max_entries: Optional[int] = None) -> int:
+    # 캐시 인덱스의 AssetTable을 마지막 사용 시각 기준으로 정리. 삭제된 결과를 가리키는 alias도 함께 삭제.
+    max_bytes = CACHE.ASSET_TABLE_MAX_BYTES if max_bytes is None else max_bytes
+    max_entries = CACHE.ASSET_TABLE_MAX_ENTRIES if max_entries is None else max_entries
+    with cache_index.connect() as conn:
+        rows = conn.execute(
+            "SELECT pdf_hash, length(asset_table_json) FROM asset_tables ORDER BY COALESCE(last_access, 0) DESC"
+        ).fetchall()
+        kept_bytes = kept_entries = 0
+        victims: list[str] = []
+        with _pins_lock: # pin 확인부터 commit까지 잠금을 유지
+            for pdf_hash, size in rows:
+                if not _over_budget(kept_bytes, kept_entries, size, max_bytes, max_entries):
+                    kept_bytes += size
+                    kept_entries += 1
+                elif pdf_hash in _pins:
+                    _stats["skipped_pinned"] += 1
+                    kept_bytes += size
+                    kept_entries += 1
+                else:
+                    victims.append(pdf_hash)
+            conn.executemany("DELETE FROM asset_tables WHERE pdf_hash = ?", [(pdf_hash,) for pdf_hash in victims])
+            conn.executemany("DELETE FROM pdf_aliases WHERE canonical_hash = ?", [(pdf_hash,) for pdf_hash in victims])
+            conn.commit()
+    if victims:
+        logger.info(f"Evicted {len(victims)} AssetTables from the cache index ({kept_entries} kept, {kept_bytes} bytes)")
+    return len(victims)
+
+def evict_cache_files(directory: Path, pattern: str, max_bytes: int) -> int:
+    # 페이지 캐시/표 artifact 디렉토리를 mtime 기준으로 정리. 분석 중인 pdf_hash의 파일은 삭제하지 않음.
+    if not directory.exists():
+        return 0
+    entries = []
+    for path in directory.glob(pattern):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    kept_bytes = kept_entries = evicted = 0
+    for _, size, path in sorted(entries, reverse=True):
+        if not _over_budget(kept_bytes, kept_entries, size, max_bytes, math.inf):
+            kept_bytes += size
+            kept_entries += 1
+            continue
+        with _pins_lock:
+            if path.name.split("_", 1)[0] in _pins:
+                _stats["skipped_pinned"] += 1
+                kept_bytes += size
+                kept_entries += 1
+                continue
+            path.unlink(missing_ok=True)
+        evicted += 1
+    if evicted:
+        logger.info(f"Evicted {evicted} files from {directory.name} ({kept_entries} files, {kept_bytes} bytes kept)")
+    return evicted
+
+def evict_table_files() -> int:
+    # dataframe_process는 pandas/PyMuPDF를 불러오므로 서버 시작 시간에 영향을 주지 않도록 실제로 정리할 때 import
+    from data_pulling.offchain.dataframe_process import PAGE_CACHE_DIR, TABLE_ARTIFACT_DIR
+    return (
+        evict_cache_files(TABLE_ARTIFACT_DIR, "*_*.parquet", CACHE.TABLE_ARTIFACT_MAX_BYTES)
+        + evict_cache_files(PAGE_CACHE_DIR, "*_p*.json", CACHE.PAGE_CACHE_MAX_BYTES)
+    )
+
+def evict_all() -> dict:
+    result = {"pdfs": evict_pdf_pool(), "asset_tables": evict_asset_tables(), "table_files": evict_table_files()}
+    _stats["runs"] += 1
+    _stats["evicted_pdfs"] += result["pdfs"]
+    _stats["evicted_asset_tables"] += result["asset_tables"]
+    _stats["evicted_table_files"] += result["table_files"]
+    _stats["last_run"] = time.time()
+    return result
+
+async def run_eviction_loop():
+    # 서버 시작 시 serve()에서 백그라운드 작업으로 실행. 삭제 작업은 파일 I/O이므로 별도 스레드에서 실행.
+    while True:
+        try:
+            await asyncio.to_thread(evict_all)
+        except Exception as e: # 한 번 실패해도 다음 주기에 다시 시도
+            logger.warning(f"Cache eviction failed: {e}")
+        await asyncio.sleep(CACHE.EVICTION_INTERVAL)
+
+def remove_pdfs_of(stablecoin: str) -> int:
+    # 캐시 인덱스에 해당 코인으로 기록된 보고서 PDF를 PDF 풀에서 삭제 (분석 중인 PDF 제외). 분석 결과(AssetTable)는 유지.
+    with cache_index.connect() as conn:
+        hashes = [row[0] for row in conn.execute("SELECT pdf_hash FROM asset_tables WHERE coin = ?", (stablecoin.upper(),))]
+    removed = 0
+    for pdf_hash in hashes:
+        path = PDF_POOL_DIRECTORY / f"{pdf_hash}.pdf"
+        with _pins_lock:
+            if pdf_hash in _pins or not path.exists():
+                continue
+            path.unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+metrics.register_collector("cache_manager", lambda: _stats | {"pinned": len(pinned_hashes())})
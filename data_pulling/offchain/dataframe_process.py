@@ -1,8 +1,14 @@
 # Pipeline for testing RfR server.
+import numpy as np
 import pandas as pd
-import camelot, fitz, re # fitz for PyMuPDF
-from common.settings import CAMELOT_MODE, API_KEYS
-from data_pulling.offchain.openfigi_api import replace_cusip_openfigi
+import fitz, json, logging, os, re, time, unicodedata # fitz for PyMuPDF
+from common.settings import CAMELOT_MODE, EXTRACTION, MOUNTED_DIR
+from data_pulling.offchain import cache_index
+from hashlib import sha256
+from pathlib import Path
+
+logger = logging.getLogger("RunFromRun.Analyze.Offchain.Dataframe")
+logger.setLevel(logging.DEBUG)
 
 # PDF 분석 함수
 def get_pdf_style(pdf_path, sample_pages=3):
@@ -29,52 +35,92 @@ def get_pdf_style(pdf_path, sample_pages=3):
     else:
         raise ValueError("Unable to determine PDF type.")
 
-# Camelot으로 추출한 테이블 필터링 함수 
-def filter_valid_tables(tables: camelot.core.TableList):
+# 준비금 표가 있는 페이지를 고르기 위한 키워드 (소문자로 비교)
+RESERVE_KEYWORDS = ("treasury", "reserve", "money market", "repo", "total", "cash", "deposit")
+amount_like = re.compile(r"\(?\$?\d{1,3}(?:,\d{3})+(?:\.\d+)?\)?")  # 1,234,567 형태의 금액
+MIN_AMOUNTS_PER_PAGE = 3  # 금액이 거의 없는 페이지는 감사의견 등 문단 페이지이므로 제외
+
+def score_page(text: str) -> int:
+    # 키워드 등장 횟수로 페이지 점수 산출. 문단에서도 "reserve" 등은 자주 등장하므로 금액이 충분히 있는 페이지만 점수 부여.
+    if len(amount_like.findall(text)) < MIN_AMOUNTS_PER_PAGE:
+        return 0
+    lowered = text.lower()
+    return sum(lowered.count(keyword) for keyword in RESERVE_KEYWORDS)
+
+def rank_candidate_pages(pdf_path, top_k: int) -> list[int]:
+    """
+    PyMuPDF 텍스트 추출로 준비금 표가 있을 법한 페이지를 골라 1부터 시작하는 페이지 번호로 반환.
+    기존과 같이 표지(1페이지)는 제외하며, 점수가 있는 페이지가 없으면 빈 리스트 반환.
+    """
+    doc = fitz.open(pdf_path)
+    first_page = 1 if len(doc) > 1 else 0
+    scores = []
+    for i in range(first_page, len(doc)):
+        score = score_page(doc[i].get_text("text"))
+        if score > 0:
+            scores.append((score, i + 1))
+    doc.close()
+    top = sorted(scores, key=lambda x: x[0], reverse=True)[:top_k]
+    return sorted(page for _, page in top)
+
+def select_pages(pdf_path) -> list[int]:
+    # Camelot으로 파싱할 페이지 번호. 점수가 있는 페이지가 없으면 기존처럼 2페이지부터 전체 스캔('2-end').
+    if EXTRACTION.PAGE_PRESCREEN:
+        pages = rank_candidate_pages(pdf_path, top_k=EXTRACTION.TOP_PAGES)
+        if pages:
+            return pages
+    with fitz.open(pdf_path) as doc:
+        n_pages = len(doc)
+    return list(range(2, n_pages + 1))
+
+# 문자열 셀만 .str 연산 대상으로 삼기 위한 도우미. 문자열이 아닌 셀은 NaN이 되어 각 조건에서 False로 처리됨.
+def _str_cells(values) -> pd.Series:
+    col = pd.Series(values, dtype=object, copy=False)
+    if pd.api.types.infer_dtype(col, skipna=False) == "string": # Camelot 결과는 대부분 모든 셀이 문자열
+        return col
+    return col.where(col.map(type, na_action="ignore").eq(str))
+
+def _all_cells(df: pd.DataFrame) -> pd.Series:
+    # 표 전체를 한 열로 펼쳐서 .str 연산을 열 개수와 무관하게 한 번만 수행
+    return _str_cells(df.to_numpy(dtype=object).ravel())
+
+# Camelot으로 추출한 테이블 필터링 함수
+OUTSTANDING_TOKENS = re.compile(r"outstanding|inssuance|minted", re.IGNORECASE)
+def filter_valid_tables(tables: list[pd.DataFrame]) -> list[pd.DataFrame]:
     # Camelot 사용시 일반 문단도 talbe로 오인될 가능성 존재하기 때문에 필터링을 거침
     # 현재 필터링 조건:
     # 1) 최소한의 열이 있는지 확인 (2열 이상) -> 모든 자산 테이블에는 자산의 명칭과 그 값이 있기 때문에 최소 2열 이상이 되어야함.
     # 2) 왼쪽 열의 평균 길이가 너무 길면 잘못 추출된 테이블로 간주 (100자 이상) -> 문단을 오인하는 경우는 해당 문장이 전부 왼쪽 열에 들어가기 때문.
     # 3) '자산' 표만 추출해야하는데 발행량 표가 섞여 들어올 수 있고, LLM이 이를 코인 자산으로 오인 가능 -> 'outstanding'제외
     # 이외 필터링 조건은 추후 필요시 추가 가능.
-    def table_about_outstanding_token(cell) -> bool:
-        if not isinstance(cell, str):
-            return False
-        return 'outstanding' in cell.lower() or 'inssuance' in cell.lower() or 'minted' in cell.lower()
-    
     valid_tables = []
-    for table in tables:
-        df = table.df
+    for df in tables:
         #필터링 조건1: 최소한의 열이 있는지 확인
         if df.shape[1] < 2:
             continue
-        leftmost_col = df.iloc[:,0].astype(str) # 첫번째 열 + 문자열로 변환
-        next_left_col = df.iloc[:,1].astype(str) # 두번째 열 + 문자열로 변환
-        avg_len_1 = leftmost_col.apply(len).mean()
-        avg_len_2 = next_left_col.apply(len).mean()
+        avg_len_1 = df.iloc[:,0].astype(str).str.len().mean() # 첫번째 열 + 문자열로 변환
+        avg_len_2 = df.iloc[:,1].astype(str).str.len().mean() # 두번째 열 + 문자열로 변환
         if avg_len_1 > 70 or avg_len_2 > 70:  #필터링 조건2: 왼쪽 열의 평균 길이가 너무 길면 잘못 추출된 테이블로 간주
             continue
 
-        mask = df.map(table_about_outstanding_token)
-        if mask.any().any():
+        #필터링 조건3: 발행량 관련 단어가 포함된 셀이 하나라도 있으면 제외
+        if _all_cells(df).str.contains(OUTSTANDING_TOKENS, na=False).any():
             continue
         
-        valid_tables.append(table)
+        valid_tables.append(df)
     return valid_tables
 
 # 필터링된 테이블 후처리 함수
 num_like = re.compile(r"^\s*[\$\(\)\-\+\d.,% ]+\s*$")  # 금액/숫자/퍼센트 등
-def is_long_text(s: str, min_len=20, min_spaces=1):
-    s = str(s)
-    if not s or s.strip() == "":
-        return False
-    if num_like.match(s):          # 숫자/금액 형태면 제외
-        return False
-    if len(s) < min_len:           # 너무 짧으면 제외
-        return False
-    if s.count(" ") < min_spaces:  # 공백 거의 없으면(코드/약어) 제외
-        return False
-    return True
+def is_long_text(s: pd.Series, min_len=20, min_spaces=1) -> pd.Series:
+    # 문자열 열에서 "긴 문장" 셀 여부. 숫자/금액 형태, 너무 짧은 문자열, 공백이 거의 없는 문자열(코드/약어)은 제외
+    s = s.astype(str)
+    return (
+        s.str.strip().ne("")
+        & ~s.str.match(num_like)
+        & s.str.len().ge(min_len)
+        & s.str.count(" ").ge(min_spaces)
+    )
 
 def spillback_to_col0(df: pd.DataFrame) -> pd.DataFrame:
     # 만일 pdf의 첫번째 열에 지나치게 긴 문장이 오는 경우, 0번째 열이 비고 첫번째 열에 긴 문장이 오는 경우가 있어 이를 보정
@@ -85,30 +131,25 @@ def spillback_to_col0(df: pd.DataFrame) -> pd.DataFrame:
         return df
 
     # 0열이 비고, 다른 열 중 "긴 문장"이 있는 경우 → 가장 긴 문장을 0열로 이동
-    col0_empty = df.iloc[:, 0].astype(str).str.strip().eq("")
-
-    def pick_longest_text(row):
-        candidates = []
-        for j in range(1, n_cols):
-            sj = str(row[j])
-            if is_long_text(sj):
-                candidates.append((len(sj), j))
-        if not candidates:
-            return row
-        # 가장 긴 텍스트가 있는 열 선택
-        _, jmax = max(candidates, key=lambda x: x[0])
-
-        # 0열이 비어있으면 이동, 비어있지 않으면 앞에 합치기(안전)
-        left = str(row[0]).strip()
-        right = str(row[jmax]).strip()
-        if left == "":
-            row[0] = right
-        else:
-            row[0] = (left + " " + right).strip()
-        row[jmax] = ""  # 원래 위치 비우기
-        return row
-
-    df.loc[col0_empty, :] = df.loc[col0_empty, :].apply(pick_longest_text, axis=1)
+    col0_empty = df.iloc[:, 0].astype(str).str.strip().eq("").to_numpy()
+    if not col0_empty.any():
+        return df
+    rest = df.iloc[col0_empty, 1:].to_numpy(dtype=object)
+    texts = pd.Series(rest.ravel(), dtype=object).astype(str)
+    long_text = is_long_text(texts).to_numpy().reshape(rest.shape)
+    has_long = long_text.any(axis=1)
+    if not has_long.any():
+        return df
+
+    # 가장 긴 텍스트가 있는 열 선택 (길이가 같으면 왼쪽 열, argmax는 첫번째 최댓값을 반환)
+    lengths = np.where(long_text, texts.str.len().to_numpy().reshape(rest.shape), -1)
+    rows = col0_empty.nonzero()[0][has_long]
+    jmax = lengths[has_long].argmax(axis=1)
+    moved = texts.to_numpy().reshape(rest.shape)[has_long, jmax]
+    for j in set(jmax.tolist()):
+        target = jmax == j
+        df.iloc[rows[target], 0] = [text.strip() for text in moved[target]]
+        df.iloc[rows[target], j + 1] = ""  # 원래 위치 비우기
     return df
 
 def post_process_first_row(df: pd.DataFrame) -> pd.DataFrame:
@@ -140,6 +181,9 @@ def post_process_first_row(df: pd.DataFrame) -> pd.DataFrame:
     
     return df
 
+# float()로 변환 가능한 문자열(쉼표 제거 후). 마지막 글자가 숫자인 경우만 판별하면 되므로 inf/nan 표기는 고려하지 않음.
+float_like = re.compile(r"^\s*[+-]?(?:\d(?:_?\d)*(?:\.(?:\d(?:_?\d)*)?)?|\.\d(?:_?\d)*)(?:[eE][+-]?\d(?:_?\d)*)?\s*$")
+ASCII_DIGITS = list("0123456789")
 def eliminate_footnotes(df: pd.DataFrame) -> pd.DataFrame:
     # 표 내에 각주(footnote) 등이 포함되는 경우가 있음.
     # 이러한 각주 부분을 제거하기 위한 후처리 함수.
@@ -147,84 +191,470 @@ def eliminate_footnotes(df: pd.DataFrame) -> pd.DataFrame:
     # 따라서, 띄어쓰기로 구분된 마지막 단어의 마지막 한 문자 혹은 두 문자가 숫자라면, 해당 숫자만 제거. (주석이 100개가 넘는 상황은 가정하지 않음)
     if df.empty:
         return df.copy()
-    
-    def remove_footnote_from_cell(s: str) -> str:
-        if not isinstance(s, str) or not s:
-            return s
-        try:
-            float(s.replace(",","")) # 전체가 숫자인 경우는 그대로 반환
-        except ValueError:
-            last_word = s.rstrip().rsplit(" ",1)[-1]
-            if last_word[-1] >= '0' and last_word[-1] <= '9':
-                if len(last_word) >=2:
-                    if last_word[-2] >= '0' and last_word[-2] <= '9':
-                        # 마지막 단어의 마지막 두 글자가 숫자인 경우
-                        return s[:-2]
-                # 마지막 단어의 마지막 한 글자가 숫자인 경우
-                return s[:-1]
-            else:
-                return s
-        return s
-    df[0] = df[0].apply(remove_footnote_from_cell)
+
+    col = _str_cells(df[0])
+    stripped = col.str.rstrip()
+    candidate = stripped.str[-1:].isin(ASCII_DIGITS).to_numpy() # 마지막 단어의 마지막 글자가 숫자
+    if not candidate.any():
+        return df.copy()
+    is_number = col[candidate].str.replace(",", "").str.match(float_like).to_numpy(dtype=bool) # 전체가 숫자인 경우는 그대로 유지
+    two_digits = stripped[candidate].str[-2:-1].isin(ASCII_DIGITS).to_numpy()
+    rows = candidate.nonzero()[0][~is_number]
+    two_digits = two_digits[~is_number]
+    df = df.copy()
+    column = df.columns.get_loc(0)
+    # 마지막 두 글자가 숫자인 경우 두 글자, 한 글자만 숫자인 경우 한 글자 제거
+    df.iloc[rows[two_digits], column] = col.iloc[rows[two_digits]].str[:-2].to_numpy()
+    df.iloc[rows[~two_digits], column] = col.iloc[rows[~two_digits]].str[:-1].to_numpy()
     return df 
 
-def post_process_tables(tables: camelot.core.TableList) -> list[pd.DataFrame]:
+def post_process_tables(tables: list[pd.DataFrame]) -> list[pd.DataFrame]:
     processed_tables = []
-    for table in tables:
-        df = table.df
+    for df in tables:
         df = spillback_to_col0(df)
         df = post_process_first_row(df)
         df = eliminate_footnotes(df)
-        # CUSIP -> 자연어로 replace
-        if API_KEYS.OPENFIGI != "your_openfigi_api_key": # api key가 설정이 된 경우 진행
-            df = df.map(replace_cusip_openfigi)
+        # CUSIP -> 자연어 치환은 모든 표의 CUSIP을 모아 한 번에 요청하도록 openfigi_api.resolve_cusips_in_tables에서 처리
         processed_tables.append(df)
         
     return processed_tables
 
-def get_tables_from_pdf(pdf_path: str, stablecoin: str) -> list[pd.DataFrame]:
+# Camelot flavor별 추출 파라미터. 페이지 캐시 키에 포함되므로 값을 바꾸면 자동으로 다시 파싱됨.
+CAMELOT_PARAMS: dict[str, dict] = {
+    "lattice": {
+        "strip_text": '\n',
+    },
+    "hybrid": {
+        "strip_text": '\n', # 셀 내부의 줄바꿈 문자가 계속 포함되는 문제가 있어 제거
+        "split_text": False, # 셀 내부의 텍스트가 여러 셀로 분리되는 문제 방지, 기본값이지만 명시
+        "row_tol": 14, # 기본값은 2, 너무 낮은 경우에는 같은 행에 있는 Pdf의 텍스트가 df의 다른 행으로 분리되는 현상이 발생할 수 있음.
+        "column_tol": 8,
+        "layout_kwargs": {
+            "word_margin": 1.0,   # 단어 간 거리 허용 ↑
+            "line_margin": 1.5,   # 줄 병합 여유 ↑
+            # "boxes_flow": -1      # 수평 정렬(표형 데이터)에 가중치
+        },
+    },
+}
+CAMELOT_PARAMS["stream"] = CAMELOT_PARAMS["hybrid"] # stream 모드는 지양하지만 hybrid와 같은 파라미터로 지원
+
+# ============== 추출 엔진 ==============
+# Camelot(특히 lattice)은 페이지를 이미지로 렌더링하여 선을 찾으므로 CPU만 있는 서버에서 가장 느린 단계임.
+# PyMuPDF의 page.find_tables()는 PDF의 벡터 선과 글자 위치로 바로 표를 찾으므로 렌더링이 필요 없음.
+# 엔진은 flavor 이름으로 구분하여 페이지 캐시, 표 artifact, flavor 자동 선택 기록, layout template 키에 그대로 포함되도록 함.
+# 어느 엔진으로 추출하든 같은 filter_valid_tables, post_process_tables를 거침.
+CAMELOT_ENGINE, PYMUPDF_ENGINE, AUTO_ENGINE = "camelot", "pymupdf", "auto"
+PYMUPDF_PARAMS: dict[str, dict] = {
+    "pymupdf_lines": {"strategy": "lines_strict"}, # "lines"는 배경/페이지 테두리 사각형까지 표로 인식하여 라벨 열이 밀림
+    "pymupdf_text": {"strategy": "text"},
+}
+# 같은 방식의 다른 엔진 flavor (선으로 구분된 표 / 텍스트 정렬로 구분된 표)
+PYMUPDF_FLAVOR_OF = {"lattice": "pymupdf_lines", "hybrid": "pymupdf_text", "stream": "pymupdf_text"}
+CAMELOT_FLAVOR_OF = {"pymupdf_lines": "lattice", "pymupdf_text": "hybrid"}
+
+def extraction_engine(flavor: str) -> str:
+    return PYMUPDF_ENGINE if flavor in PYMUPDF_PARAMS else CAMELOT_ENGINE
+
+def extraction_params(flavor: str) -> dict:
+    if flavor in PYMUPDF_PARAMS:
+        return PYMUPDF_PARAMS[flavor] | {"max_drawings": EXTRACTION.PYMUPDF_MAX_DRAWINGS}
+    if flavor in CAMELOT_PARAMS:
+        return CAMELOT_PARAMS[flavor]
+    raise NotImplementedError(f"Extraction flavor {flavor} not supported now.")
+
+def flavor_for_engine(flavor: str, engine: str) -> str:
+    if engine == PYMUPDF_ENGINE:
+        return PYMUPDF_FLAVOR_OF.get(flavor, flavor)
+    return CAMELOT_FLAVOR_OF.get(flavor, flavor)
+
+PAGE_CACHE_DIR = MOUNTED_DIR / "page_tables"
+TABLE_ARTIFACT_DIR = MOUNTED_DIR / "table_artifacts"
+# 필터/후처리 로직이 바뀌어 같은 PDF에서 다른 표가 나오게 되면 올려서 기존 표 artifact를 무효화
+TABLE_PIPELINE_VERSION = 1
+
+def hash_pdf_file(pdf_path) -> str:
+    digest = sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def touch_cache_file(path: Path):
+    # 페이지 캐시와 표 artifact는 mtime을 마지막 사용 시각으로 사용 (cache_manager가 오래 사용되지 않은 파일부터 삭제)
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def remove_superseded(current: Path, pattern: str):
+    # 추출 설정이 바뀌어 같은 pdf_hash(와 페이지, flavor)에 대해 새 키로 저장하면 이전 설정의 파일은 다시 읽히지 않으므로 삭제
+    for path in current.parent.glob(pattern):
+        if path != current:
+            path.unlink(missing_ok=True)
+
+def page_cache_path(pdf_hash: str, page: int, flavor: str) -> Path:
+    # 캐시 키: (pdf_hash, page_no, camelot_flavor, extraction_params)
+    params_digest = sha256(json.dumps(extraction_params(flavor), sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return PAGE_CACHE_DIR / f"{pdf_hash}_p{page}_{flavor}_{params_digest}.json"
+
+def load_page_cache(pdf_hash: str, page: int, flavor: str) -> list[pd.DataFrame] | None:
+    cache_file = page_cache_path(pdf_hash, page, flavor)
+    if not cache_file.exists():
+        return None
+    try:
+        cached = json.loads(cache_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None # 깨진 캐시는 무시하고 다시 파싱
+    touch_cache_file(cache_file)
+    tables = []
+    for entry in cached:
+        df = pd.DataFrame(entry["rows"], columns=entry["columns"]) # Camelot 열 번호는 연속적이지 않을 수 있으므로 그대로 복원
+        df.attrs.update(page=entry["page"], bbox=entry["bbox"], flavor=flavor)
+        tables.append(df)
+    return tables
+
+def save_page_cache(pdf_hash: str, page: int, flavor: str, tables: list[pd.DataFrame]):
+    cache_file = page_cache_path(pdf_hash, page, flavor)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    payload = [
+        {"page": df.attrs.get("page"), "bbox": df.attrs.get("bbox"), "columns": df.columns.tolist(), "rows": df.values.tolist()}
+        for df in tables
+    ]
+    tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+    tmp_file.write_text(json.dumps(payload), encoding="utf-8")
+    os.replace(tmp_file, cache_file) # 여러 워커가 같은 페이지를 써도 반쯤 쓰인 파일이 보이지 않도록 함
+    remove_superseded(cache_file, f"{pdf_hash}_p{page}_{flavor}_*.json")
+
+def read_pymupdf_tables(pdf_path, page: int, flavor: str, area: str | None = None) -> list[pd.DataFrame]:
+    # PyMuPDF로 한 페이지(area가 있으면 해당 영역만)의 표를 찾음. bbox는 Camelot과 같은 PDF 좌표(왼쪽, 아래, 오른쪽, 위)로 기록.
+    with fitz.open(pdf_path) as doc:
+        pdf_page = doc[page - 1]
+        n_drawings = len(pdf_page.get_cdrawings())
+        if n_drawings <= EXTRACTION.PYMUPDF_MAX_DRAWINGS:
+            height = pdf_page.rect.height
+            clip = None
+            if area is not None:
+                left, top, right, bottom = (float(v) for v in area.split(","))
+                clip = fitz.Rect(left, height - top, right, height - bottom)
+            found = pdf_page.find_tables(clip=clip, **PYMUPDF_PARAMS[flavor])
+            result = []
+            for table in found.tables:
+                rows = table.extract()
+                if table.header.external: # 표 바로 위에서 찾은 머리글 행은 extract()에 포함되지 않음
+                    rows = [table.header.names] + rows
+                # Camelot과 같이 빈 셀은 "", 셀 안의 줄바꿈은 공백으로 합치고, 병합 셀 때문에 생긴 빈 행/열은 제거
+                df = pd.DataFrame([["" if cell is None else " ".join(cell.split()) for cell in row] for row in rows], dtype=object)
+                df = df.loc[df.ne("").any(axis=1), df.ne("").any(axis=0)].reset_index(drop=True)
+                df.columns = range(df.shape[1])
+                x0, y0, x1, y1 = table.bbox
+                df.attrs.update(page=page, bbox=[float(x0), float(height - y1), float(x1), float(height - y0)], flavor=flavor)
+                result.append(df)
+            return result
+    # 벡터 도형이 매우 많은 페이지(TUSD 보고서 등)는 find_tables가 수십 초 걸리므로 같은 방식의 Camelot flavor로 추출
+    logger.info(f"Page {page} of {Path(pdf_path).name} has {n_drawings} drawings, using Camelot {CAMELOT_FLAVOR_OF[flavor]} instead of {flavor}")
+    if area is not None:
+        return read_area_tables(pdf_path, page, CAMELOT_FLAVOR_OF[flavor], area)
+    return read_page_tables(pdf_path, page, CAMELOT_FLAVOR_OF[flavor])
+
+def read_page_tables(pdf_path, page: int, flavor: str) -> list[pd.DataFrame]:
+    # 한 페이지만 파싱. 필터링/후처리 이전의 원본 표를 반환하며, 위치 정보는 df.attrs에 기록.
+    if extraction_engine(flavor) == PYMUPDF_ENGINE:
+        return read_pymupdf_tables(pdf_path, page, flavor)
+    if flavor not in CAMELOT_PARAMS:
+        raise NotImplementedError(f"Camelot mode {flavor} not supported now.")
+    import camelot # matplotlib, opencv 등을 함께 불러와 import만 0.5초 이상 걸리므로 실제로 파싱할 때 import
+    tables = camelot.read_pdf(str(pdf_path), pages=str(page), flavor=flavor, **CAMELOT_PARAMS[flavor])
+    result = []
+    for table in tables:
+        df = table.df
+        bbox = getattr(table, "_bbox", None)
+        df.attrs.update(page=page, bbox=[float(v) for v in bbox] if bbox else None, flavor=flavor)
+        result.append(df)
+    return result
+
+def read_area_tables(pdf_path, page: int, flavor: str, area: str) -> list[pd.DataFrame]:
+    # 한 페이지의 지정한 영역("왼쪽,위,오른쪽,아래", PDF 좌표)만 파싱. 발행사별 layout template로 추출할 때 사용.
+    if extraction_engine(flavor) == PYMUPDF_ENGINE:
+        return read_pymupdf_tables(pdf_path, page, flavor, area)
+    if flavor not in CAMELOT_PARAMS:
+        raise NotImplementedError(f"Camelot mode {flavor} not supported now.")
+    import camelot
+    tables = camelot.read_pdf(str(pdf_path), pages=str(page), flavor=flavor, table_areas=[area], **CAMELOT_PARAMS[flavor])
+    result = []
+    for table in tables:
+        df = table.df
+        df.columns = range(df.shape[1]) # 영역을 지정하면 열 번호가 1부터 시작하는 경우가 있어 후처리(df[0])를 위해 다시 매김
+        bbox = getattr(table, "_bbox", None)
+        df.attrs.update(page=page, bbox=[float(v) for v in bbox] if bbox else None, flavor=flavor)
+        result.append(df)
+    return result
+
+def get_page_tables(pdf_path, pdf_hash: str, page: int, flavor: str) -> list[pd.DataFrame]:
+    # 페이지 캐시를 먼저 확인하고, 없을 때만 파싱. 필터링 조건이 바뀌거나 LLM 단계에서 실패 후 재시도해도 다시 파싱하지 않음.
+    cached = load_page_cache(pdf_hash, page, flavor)
+    if cached is not None:
+        return cached
+    tables = read_page_tables(pdf_path, page, flavor)
+    save_page_cache(pdf_hash, page, flavor, tables)
+    return tables
+
+def plan_extraction(pdf_path) -> list[int]:
+    # 추출 전 단계: PDF 형식 확인 후 파싱할 페이지 결정
     try:
         pdf_format = get_pdf_style(pdf_path)
     except Exception as e:
         raise RuntimeError(f"Failed to determine PDF style for {pdf_path}: {e}") from e
-    if pdf_format == "text":
-        try:
-            if CAMELOT_MODE[stablecoin] == "lattice":
-                tables = camelot.read_pdf(
-                    pdf_path,
-                    pages = '2-end',
-                    flavor = CAMELOT_MODE[stablecoin],
-                    strip_text='\n',
-                )
-            elif CAMELOT_MODE[stablecoin] == "hybrid" or CAMELOT_MODE[stablecoin] == "stream":  # hybrid or stream 모드 -> stream 모든 지양.
-                tables = camelot.read_pdf(
-                    pdf_path, 
-                    pages='2-end', 
-                    flavor= CAMELOT_MODE[stablecoin],
-                    strip_text='\n', # 셀 내부의 줄바꿈 문자가 계속 포함되는 문제가 있어 제거
-                    split_text=False, # 셀 내부의 텍스트가 여러 셀로 분리되는 문제 방지, 기본값이지만 명시
-                    row_tol=14, # 기본값은 2, 너무 낮은 경우에는 같은 행에 있는 Pdf의 텍스트가 df의 다른 행으로 분리되는 현상이 발생할 수 있음.
-                    column_tol=8,
-                    layout_kwargs={
-                        "word_margin": 1.0,   # 단어 간 거리 허용 ↑
-                        "line_margin": 1.5,   # 줄 병합 여유 ↑
-                        # "boxes_flow": -1      # 수평 정렬(표형 데이터)에 가중치
-                    }
-                )
-            else: # Maybe hybrid mode
-                raise NotImplementedError(f"Camelot mode {CAMELOT_MODE[stablecoin]} not supported now.")
-        except Exception as e:
-            raise RuntimeError(f"Camelot failed to extract tables from {pdf_path}: {e}") from e
-        try:
-            tables = filter_valid_tables(tables)
-        except Exception as e:
-            raise RuntimeError(f"Filtering valid tables failed for {pdf_path}: {e}") from e
-        try:
-            tables = post_process_tables(tables)
-        except Exception as e:
-            raise RuntimeError(f"Post-processing tables failed for {pdf_path}: {e}") from e
-        return tables
-    elif pdf_format == "image":
+    if pdf_format == "image":
         raise NotImplementedError("Image-based PDF parsing not implemented yet.")
-    else:
+    elif pdf_format != "text":
         raise ValueError(f"Unknown PDF format for {pdf_path}: {pdf_format}")
+    try:
+        return select_pages(pdf_path)
+    except Exception as e:
+        raise RuntimeError(f"Page pre-screening failed for {pdf_path}: {e}") from e
+
+def finalize_tables(tables: list[pd.DataFrame], pdf_path) -> list[pd.DataFrame]:
+    # 페이지별로 모은 원본 표를 필터링 후 후처리
+    try:
+        tables = filter_valid_tables(tables)
+    except Exception as e:
+        raise RuntimeError(f"Filtering valid tables failed for {pdf_path}: {e}") from e
+    try:
+        tables = post_process_tables(tables)
+    except Exception as e:
+        raise RuntimeError(f"Post-processing tables failed for {pdf_path}: {e}") from e
+    return tables
+
+# ============== 내용 기반 PDF fingerprint ==============
+# 같은 증명 보고서를 DocuSign envelope, 메타데이터 시각, CDN 재인코딩만 바꾸어 다시 게시하면 파일 sha256이 달라져 전체 분석이 다시 실행됨.
+# 준비금 페이지(select_pages와 같은 키워드 점수)의 텍스트만 정규화하여 해시하면 내용이 같은 보고서를 찾을 수 있음.
+VOLATILE_TOKENS = [
+    re.compile(r"docusign envelope id:?\s*\S+", re.IGNORECASE),
+    re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE), # UUID
+    re.compile(r"\b[0-9a-f]{16,}\b", re.IGNORECASE), # 문서 ID 등 긴 16진수 토큰
+]
+
+def normalize_page_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text) # 합자(ﬁ) 등 인코딩 차이 제거
+    for token in VOLATILE_TOKENS:
+        text = token.sub(" ", text)
+    return " ".join(text.lower().split())
+
+def content_fingerprint(pdf_path) -> str | None:
+    # 준비금 후보 페이지 텍스트의 정규화 해시. 텍스트가 없는 PDF(이미지 기반)는 서로 구별할 수 없으므로 None.
+    with fitz.open(pdf_path) as doc:
+        texts = [page.get_text("text") for page in doc]
+    first_page = 1 if len(texts) > 1 else 0
+    scores = [(score_page(texts[i]), i) for i in range(first_page, len(texts))]
+    top = sorted([(score, i) for score, i in scores if score > 0], reverse=True)[:EXTRACTION.TOP_PAGES]
+    pages = sorted(i for _, i in top) or range(len(texts))
+    normalized = "\n".join(normalize_page_text(texts[i]) for i in pages)
+    if not normalized.strip():
+        return None
+    return sha256(normalized.encode("utf-8")).hexdigest()
+
+# ============== 후처리된 표 artifact ==============
+# 페이지 캐시는 Camelot 원본 표만 보관하므로 페이지 선정, 필터링, 후처리는 매번 다시 실행됨.
+# 후처리까지 끝난 표를 (pdf_hash, extraction_config_hash) 단위로 Parquet 파일 하나에 저장하여,
+# 프롬프트/모델/투표 방식만 바뀐 경우 PDF를 열지 않고 LLM 단계부터 다시 실행할 수 있도록 함.
+# - 모든 표를 하나로 이어 붙이고 "table" 열로 구분. 셀은 열 위치에 따라 c0, c1, ...(문자열)에 저장
+# - 표마다 다른 열 이름과 위치 정보(page, bbox, flavor)는 Parquet schema metadata에 JSON으로 저장
+def extraction_config_hash(flavor: str) -> str:
+    # 추출 결과에 영향을 주는 설정만 키에 포함. 설정이 바뀌면 새로운 artifact로 저장됨.
+    config = {
+        "flavor": flavor,
+        "camelot_params": extraction_params(flavor),
+        "page_prescreen": EXTRACTION.PAGE_PRESCREEN,
+        "top_pages": EXTRACTION.TOP_PAGES,
+        "pipeline_version": TABLE_PIPELINE_VERSION,
+    }
+    return sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def table_artifact_path(pdf_hash: str, flavor: str) -> Path:
+    return TABLE_ARTIFACT_DIR / f"{pdf_hash}_{extraction_config_hash(flavor)}.parquet"
+
+def save_table_artifact(pdf_hash: str, flavor: str, tables: list[pd.DataFrame]) -> Path:
+    import pyarrow as pa, pyarrow.parquet as pq # 서버 시작 시간에 영향을 주지 않도록 실제로 읽고 쓸 때 import
+    n_cols = max((df.shape[1] for df in tables), default=0)
+    table_ids: list[int] = []
+    cells: list[list] = [[] for _ in range(n_cols)]
+    meta = []
+    for table_id, df in enumerate(tables):
+        table_ids.extend([table_id] * len(df))
+        values = df.to_numpy(dtype=object)
+        for col in range(n_cols):
+            cells[col].extend(values[:, col].tolist() if col < df.shape[1] else [None] * len(df))
+        meta.append({
+            "page": df.attrs.get("page"), "bbox": df.attrs.get("bbox"), "flavor": df.attrs.get("flavor", flavor),
+            "columns": df.columns.tolist(), "rows": len(df),
+        })
+    arrays = {"table": pa.array(table_ids, type=pa.int32())}
+    for col in range(n_cols): # 후처리 후 셀은 모두 문자열이며, 표마다 열 개수가 달라 빈 위치만 null
+        arrays[f"c{col}"] = pa.array([None if cell is None else str(cell) for cell in cells[col]], type=pa.string())
+    artifact = pa.table(arrays).replace_schema_metadata({
+        "rfr_pdf_hash": pdf_hash,
+        "rfr_config_hash": extraction_config_hash(flavor),
+        "rfr_tables": json.dumps(meta),
+    })
+    artifact_file = table_artifact_path(pdf_hash, flavor)
+    artifact_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = artifact_file.with_suffix(f".{os.getpid()}.tmp")
+    pq.write_table(artifact, tmp_file, compression="zstd")
+    os.replace(tmp_file, artifact_file)
+    remove_superseded(artifact_file, f"{pdf_hash}_*.parquet")
+    return artifact_file
+
+def read_table_artifact(artifact_file: Path) -> list[pd.DataFrame]:
+    import pyarrow.parquet as pq
+    artifact = pq.read_table(artifact_file)
+    meta = json.loads(artifact.schema.metadata[b"rfr_tables"])
+    columns = {name: artifact.column(name).to_pylist() for name in artifact.column_names}
+    tables = []
+    offset = 0
+    for entry in meta:
+        rows = entry["rows"]
+        values = [columns[f"c{col}"][offset:offset + rows] for col in range(len(entry["columns"]))]
+        df = pd.DataFrame(list(zip(*values)), columns=entry["columns"]) # 열 이름이 중복될 수 있으므로 행 단위로 복원
+        df.attrs.update(page=entry["page"], bbox=entry["bbox"], flavor=entry["flavor"])
+        tables.append(df)
+        offset += rows
+    return tables
+
+def load_table_artifact(pdf_hash: str, flavor: str) -> list[pd.DataFrame] | None:
+    artifact_file = table_artifact_path(pdf_hash, flavor)
+    if not artifact_file.exists():
+        return None
+    try:
+        tables = read_table_artifact(artifact_file)
+    except Exception:
+        return None # 깨진 artifact는 무시하고 다시 추출
+    touch_cache_file(artifact_file)
+    return tables
+
+def list_table_artifacts() -> list[tuple[str, str, Path]]:
+    # (pdf_hash, extraction_config_hash, 파일 경로) 목록. 최근에 저장된 것부터.
+    if not TABLE_ARTIFACT_DIR.exists():
+        return []
+    artifacts = sorted(TABLE_ARTIFACT_DIR.glob("*_*.parquet"), key=lambda path: path.stat().st_mtime, reverse=True)
+    return [(*path.stem.split("_", 1), path) for path in artifacts]
+
+def finalize_and_save_tables(tables: list[pd.DataFrame], pdf_path, pdf_hash: str, flavor: str) -> list[pd.DataFrame]:
+    tables = finalize_tables(tables, pdf_path)
+    try:
+        save_table_artifact(pdf_hash, flavor, tables)
+    except Exception as e: # artifact 저장에 실패해도 이번 분석 결과는 그대로 사용
+        logger.warning(f"Failed to save table artifact for {pdf_hash}: {e}")
+    return tables
+
+# ============== Camelot flavor 자동 선택 ==============
+# CAMELOT_MODE는 코인별로 고정되어 있어 새로운 코인은 KeyError가 발생하고, 발행사가 보고서 양식을 바꾸면 조용히 품질이 떨어짐.
+# "auto"(또는 CAMELOT_MODE에 없는 코인, 엔진이 "auto"인 코인)는 auto_flavors를 모두 실행하여 후처리된 표의 점수가 가장 높은 flavor를 사용하고,
+# 발행사별로 선택 결과를 캐시 인덱스에 기록하여 다음부터는 비교 없이 바로 사용. 기록된 flavor로 유효한 표가 하나도 나오지 않으면 다시 비교.
+AUTO_FLAVOR = "auto"
+TOTAL_ROW = re.compile(r"\btotal\b", re.IGNORECASE)
+
+def engine_for(stablecoin: str) -> str:
+    return EXTRACTION.ENGINES.get(stablecoin, EXTRACTION.ENGINE)
+
+def configured_flavor(stablecoin: str) -> str:
+    # CAMELOT_MODE의 flavor를 코인의 엔진에 맞게 바꾼 값. 엔진이 "auto"이면 두 엔진을 비교해야 하므로 AUTO_FLAVOR.
+    flavor = (CAMELOT_MODE or {}).get(stablecoin, AUTO_FLAVOR)
+    engine = engine_for(stablecoin)
+    if flavor == AUTO_FLAVOR or engine == AUTO_ENGINE:
+        return AUTO_FLAVOR
+    return flavor_for_engine(flavor, engine)
+
+def auto_flavors(stablecoin: str) -> list[str]:
+    # 자동 선택 시 비교할 flavor. CAMELOT_MODE에 flavor가 있으면 그 방식만, 없으면 AUTO_FLAVORS를 코인의 엔진(auto이면 두 엔진 모두)으로 실행.
+    flavor = (CAMELOT_MODE or {}).get(stablecoin, AUTO_FLAVOR)
+    base = EXTRACTION.AUTO_FLAVORS if flavor == AUTO_FLAVOR else [flavor]
+    engine = engine_for(stablecoin)
+    engines = [PYMUPDF_ENGINE, CAMELOT_ENGINE] if engine == AUTO_ENGINE else [engine] # 점수가 같으면 더 빠른 PyMuPDF를 선택하도록 앞에 둠
+    return list(dict.fromkeys(flavor_for_engine(flavor, engine) for engine in engines for flavor in base))
+
+def _numeric_cells(cells: pd.Series) -> pd.Series:
+    # 금액/숫자 셀 여부. "$", "-" 만 있는 셀은 제외
+    return cells.str.match(num_like, na=False) & cells.str.contains(r"\d", na=False)
+
+def _has_total_row(df: pd.DataFrame) -> bool:
+    # 첫 열에 "total"이 있고 같은 행의 다른 열에 숫자가 있는 행
+    if df.shape[1] < 2:
+        return False
+    label = _str_cells(df.iloc[:, 0].to_numpy()).str.contains(TOTAL_ROW, na=False)
+    amount = pd.concat([_numeric_cells(_str_cells(df.iloc[:, col].to_numpy())) for col in range(1, df.shape[1])], axis=1).any(axis=1)
+    return bool((label & amount).any())
+
+def score_tables(raw_tables: list[pd.DataFrame], tables: list[pd.DataFrame]) -> float:
+    # 세 항목의 합(0~3): 필터 통과율 + 비어있지 않은 셀 중 숫자 셀 비율 + 합계(total) 행 존재 여부
+    if not raw_tables or not tables:
+        return 0.0
+    pass_rate = len(filter_valid_tables(raw_tables)) / len(raw_tables)
+    cells = pd.concat([_all_cells(df) for df in tables]).dropna().str.strip()
+    cells = cells[cells != ""]
+    numeric_density = float(_numeric_cells(cells).mean()) if len(cells) else 0.0
+    has_total_row = any(_has_total_row(df) for df in tables)
+    return round(pass_rate + numeric_density + float(has_total_row), 4)
+
+def finalize_and_score(raw_tables: list[pd.DataFrame], pdf_path) -> tuple[list[pd.DataFrame], float]:
+    tables = finalize_tables(raw_tables, pdf_path)
+    return tables, score_tables(raw_tables, tables)
+
+def pick_flavor(scores: dict[str, float]) -> str:
+    # 점수가 같으면 auto_flavors에 먼저 나온 flavor (두 엔진을 비교하는 경우 PyMuPDF)
+    return max(scores, key=lambda flavor: scores[flavor])
+
+def remembered_flavor(issuer: str, stablecoin: str) -> str | None:
+    # issuer는 Provenance.report_issuer. 같은 발행사의 다른 코인 보고서도 같은 양식이므로 발행사 단위로 기록하고,
+    # 비교 대상 설정(flavor, 엔진)은 코인별이므로 이번 코인의 auto_flavors에 없으면 다시 비교
+    with cache_index.connect() as conn:
+        row = conn.execute("SELECT flavor FROM flavor_choices WHERE issuer = ?", (cache_index.issuer_key(issuer),)).fetchone()
+    if row is None or row[0] not in auto_flavors(stablecoin):
+        return None
+    return row[0]
+
+def remember_flavor(issuer: str, flavor: str, scores: dict[str, float]):
+    with cache_index.connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO flavor_choices (issuer, flavor, scores_json, chosen_at) VALUES (?, ?, ?, ?)",
+            (cache_index.issuer_key(issuer), flavor, json.dumps(scores), time.time()),
+        )
+    logger.info(f"Selected Camelot flavor {flavor} for {issuer}: {scores}")
+
+def resolve_flavor(stablecoin: str, issuer: str | None = None) -> str:
+    # 고정 flavor, 발행사별로 기록된 자동 선택 결과, 또는 아직 비교하지 않은 경우(발행사를 모르는 경우 포함) AUTO_FLAVOR
+    flavor = configured_flavor(stablecoin)
+    if flavor == AUTO_FLAVOR and issuer is not None:
+        flavor = remembered_flavor(issuer, stablecoin) or AUTO_FLAVOR
+    return flavor
+
+def _read_pages(pdf_path, pdf_hash: str, pages: list[int], flavor: str) -> list[pd.DataFrame]:
+    tables: list[pd.DataFrame] = []
+    try:
+        for page in pages:
+            tables.extend(get_page_tables(pdf_path, pdf_hash, page, flavor))
+    except Exception as e:
+        raise RuntimeError(f"{extraction_engine(flavor)} failed to extract tables from {pdf_path}: {e}") from e
+    return tables
+
+def get_tables_from_pdf(pdf_path: str, stablecoin: str, pdf_hash: str | None = None, issuer: str | None = None) -> list[pd.DataFrame]:
+    # 동기 버전. 서버에서는 extraction_executor.extract_tables로 페이지와 flavor를 병렬 파싱함.
+    if pdf_hash is None:
+        pdf_hash = hash_pdf_file(pdf_path)
+    flavor = resolve_flavor(stablecoin, issuer)
+    if flavor != AUTO_FLAVOR:
+        cached = load_table_artifact(pdf_hash, flavor)
+        if cached is not None:
+            return cached
+    pages = plan_extraction(pdf_path)
+    if flavor != AUTO_FLAVOR:
+        tables = finalize_and_save_tables(_read_pages(pdf_path, pdf_hash, pages, flavor), pdf_path, pdf_hash, flavor)
+        if tables or configured_flavor(stablecoin) != AUTO_FLAVOR:
+            return tables
+        logger.info(f"No valid tables with remembered flavor {flavor} for {stablecoin}, comparing flavors again")
+    results = {flavor: finalize_and_score(_read_pages(pdf_path, pdf_hash, pages, flavor), pdf_path) for flavor in auto_flavors(stablecoin)}
+    scores = {flavor: score for flavor, (_, score) in results.items()}
+    winner = pick_flavor(scores)
+    if issuer is not None:
+        remember_flavor(issuer, winner, scores)
+    save_table_artifact(pdf_hash, winner, results[winner][0])
+    return results[winner][0]
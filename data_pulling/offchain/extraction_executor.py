@@ -0,0 +1,137 @@
+# PDF 표 추출(Camelot, PyMuPDF, pandas 후처리)은 CPU 작업이기 때문에 event loop에서 직접 실행하면
+# 추출이 끝날 때까지 FastMCP 서버 전체(다른 온체인 요청 포함)가 멈춤.
+# 따라서 추출 작업은 프로세스 풀에서 실행하고, async 파이프라인은 그 결과를 await 하도록 함.
+from common.settings import EXTRACTION
+from common.tracing import span, traced
+from data_pulling.offchain.dataframe_process import (
+    plan_extraction, get_page_tables, load_page_cache, load_table_artifact, save_table_artifact, finalize_and_save_tables,
+    AUTO_FLAVOR, configured_flavor, resolve_flavor, auto_flavors, finalize_and_score, pick_flavor, remember_flavor, extraction_engine,
+)
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+import asyncio, logging, multiprocessing
+import pandas as pd
+from pathlib import Path
+
+logger = logging.getLogger("RunFromRun.Analyze.Offchain.Extraction")
+logger.setLevel(logging.DEBUG)
+
+_executor: ProcessPoolExecutor | None = None
+_slots: asyncio.Semaphore | None = None
+
+def get_extraction_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # fork는 event loop와 스레드 상태까지 복제하므로, 서버 프로세스에서는 spawn으로 워커를 생성
+        _executor = ProcessPoolExecutor(
+            max_workers=EXTRACTION.MAX_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logger.info(f"Extraction process pool started with {EXTRACTION.MAX_WORKERS} workers")
+    return _executor
+
+def _get_slots() -> asyncio.Semaphore:
+    # 실행 중인 작업(MAX_WORKERS) + 대기 작업(QUEUE_SIZE)만큼만 executor에 제출 => bounded queue
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(EXTRACTION.MAX_WORKERS + EXTRACTION.QUEUE_SIZE)
+    return _slots
+
+async def run_in_extraction_pool(fn: Callable, *args) -> Any:
+    # fn과 args는 워커 프로세스로 전달되므로 모듈 최상위 함수와 pickle 가능한 인자만 사용해야 함.
+    slots = _get_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout=EXTRACTION.QUEUE_TIMEOUT)
+    except TimeoutError as e:
+        raise RuntimeError(f"Extraction queue is full: waited {EXTRACTION.QUEUE_TIMEOUT} seconds for {fn.__name__}") from e
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_extraction_executor(), fn, *args)
+    except BrokenProcessPool as e:
+        # 워커가 비정상 종료(OOM 등)되면 풀 전체가 사용 불가능해지므로 다음 요청을 위해 새로 생성
+        logger.error(f"Extraction worker died while running {fn.__name__}: {e}")
+        shutdown_extraction_executor()
+        raise RuntimeError(f"Extraction worker died while running {fn.__name__}") from e
+    finally:
+        slots.release()
+
+def shutdown_extraction_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        logger.info("Extraction process pool shut down")
+
+async def _parse_pages(pdf_path: Path, pdf_hash: str, pages: list[int], flavor: str) -> list[pd.DataFrame]:
+    # 후보 페이지를 페이지 단위 작업으로 나누어 워커 프로세스에 분산 => 코어 수에 비례하여 추출 시간 단축
+    tables_per_page: dict[int, list[pd.DataFrame]] = {}
+    to_parse: list[int] = []
+    # 캐시 파일 읽기와 JSON 파싱은 마운트된 볼륨에서 느릴 수 있으므로 스레드에서 실행 (CPU 작업이 아니므로 워커 대기열은 거치지 않음)
+    cached_pages = await asyncio.gather(*[asyncio.to_thread(load_page_cache, pdf_hash, page, flavor) for page in pages])
+    for page, cached in zip(pages, cached_pages):
+        if cached is not None:
+            tables_per_page[page] = cached
+        else:
+            to_parse.append(page)
+    logger.debug(f"{pdf_path.name}: {len(pages) - len(to_parse)} {flavor} pages from cache, parsing pages {to_parse}")
+
+    engine = extraction_engine(flavor) # span 이름은 엔진별로 "camelot", "pymupdf"
+    with span(engine, flavor=flavor, pages=len(pages), cached_pages=len(pages) - len(to_parse), cache_hit=not to_parse):
+        try:
+            parsed = await asyncio.gather(*[
+                traced(f"{engine}.page", run_in_extraction_pool(get_page_tables, pdf_path, pdf_hash, page, flavor), page=page, flavor=flavor)
+                for page in to_parse
+            ])
+        except Exception as e:
+            raise RuntimeError(f"{engine} failed to extract tables from {pdf_path}: {e}") from e
+    tables_per_page.update(zip(to_parse, parsed))
+    return [df for page in pages for df in tables_per_page[page]]
+
+async def _select_flavor(pdf_path: Path, stablecoin: str, pdf_hash: str, pages: list[int], issuer: Optional[str]) -> list[pd.DataFrame]:
+    # auto_flavors를 동시에 파싱/후처리하여 점수가 가장 높은 flavor(엔진 포함)의 표를 사용하고, 발행사별로 기록
+    async def parse_and_score(flavor: str) -> tuple[list[pd.DataFrame], float]:
+        raw_tables = await _parse_pages(pdf_path, pdf_hash, pages, flavor)
+        return await run_in_extraction_pool(finalize_and_score, raw_tables, pdf_path)
+
+    flavors = auto_flavors(stablecoin)
+    with span("flavor_selection", flavors=flavors) as selection_span:
+        results = dict(zip(flavors, await asyncio.gather(*[parse_and_score(flavor) for flavor in flavors])))
+        scores = {flavor: score for flavor, (_, score) in results.items()}
+        winner = pick_flavor(scores)
+        selection_span.set(winner=winner, **{f"score.{flavor}": score for flavor, score in scores.items()})
+    tables = results[winner][0]
+    try:
+        if issuer is not None:
+            await asyncio.to_thread(remember_flavor, issuer, winner, scores)
+        await asyncio.to_thread(save_table_artifact, pdf_hash, winner, tables)
+    except Exception as e: # 기록에 실패하면 다음 요청에서 다시 비교할 뿐이므로 이번 결과는 그대로 사용
+        logger.warning(f"Failed to record flavor selection for {issuer or stablecoin}: {e}")
+    return tables
+
+async def extract_tables(pdf_path: Path, stablecoin: str, pdf_hash: str, issuer: Optional[str] = None) -> list[pd.DataFrame]:
+    # issuer(Provenance.report_issuer)가 있으면 자동 선택한 flavor를 발행사별로 기록하고 다음 보고서에 사용
+    flavor: str = await asyncio.to_thread(resolve_flavor, stablecoin, issuer) # 고정 flavor, 기록된 자동 선택 결과, 또는 AUTO_FLAVOR
+    if flavor != AUTO_FLAVOR:
+        # 같은 설정으로 후처리까지 끝낸 표가 있으면 PDF를 열지 않고 바로 반환
+        with span("table_artifact.lookup", flavor=flavor) as artifact_span:
+            artifact = await asyncio.to_thread(load_table_artifact, pdf_hash, flavor)
+            artifact_span.set(cache_hit=artifact is not None)
+        if artifact is not None:
+            logger.debug(f"{pdf_path.name}: loaded {len(artifact)} post-processed tables from table artifact")
+            return artifact
+
+    with span("pdf.select_pages") as select_span:
+        pages: list[int] = await run_in_extraction_pool(plan_extraction, pdf_path)
+        select_span.set(pages=len(pages))
+
+    if flavor != AUTO_FLAVOR:
+        tables = await _parse_pages(pdf_path, pdf_hash, pages, flavor)
+        with span("postprocess", tables=len(tables)) as postprocess_span:
+            finalized = await run_in_extraction_pool(finalize_and_save_tables, tables, pdf_path, pdf_hash, flavor)
+            postprocess_span.set(valid_tables=len(finalized))
+        if finalized or configured_flavor(stablecoin) != AUTO_FLAVOR:
+            return finalized
+        # 발행사가 보고서 양식을 바꾸어 기록된 flavor로는 표가 나오지 않는 경우
+        logger.info(f"No valid tables with remembered flavor {flavor} for {stablecoin}, comparing flavors again")
+    return await _select_flavor(pdf_path, stablecoin, pdf_hash, pages, issuer)
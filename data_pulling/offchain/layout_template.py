@@ -0,0 +1,197 @@
+# 발행사별 보고서 양식(layout) 템플릿.
+# Tether, Circle, Paxos 등은 매달 구조가 같은 보고서를 게시하지만, 매번 PDF 형식 확인, 전체 페이지 점수 계산, flavor 선택, 필터링, LLM 투표를 다시 실행함.
+# 전체 분석이 끝나면 최종 금액이 나온 표의 위치(페이지, bbox, flavor, Camelot table_areas)와 행 이름 → AmountsOnly 필드 대응을
+# (Provenance.report_issuer, coin) 단위로 캐시 인덱스에 기록함. 다음 보고서는 해당 페이지의 해당 영역만 Camelot으로 한 번 읽고 기록된 대응으로 금액을 구함.
+# 항목 합이 합계와 맞지 않거나 표를 찾지 못하면(양식 변경) 기존 전체 파이프라인으로 분석하고 그 결과로 템플릿을 다시 학습함.
+from common import metrics
+from common.schema import AmountsOnly, AssetTable
+from common.settings import EXTRACTION
+from data_pulling.offchain import cache_index
+from data_pulling.offchain.dataframe_process import finalize_tables, read_area_tables
+from data_pulling.offchain.rule_extractor import (
+    FIELD_PHRASES, TOTAL_LABEL, SUBTOTAL_LABEL, ISSUANCE_LABEL, match_field, parse_money, table_scale, period_date, latest_period,
+)
+from dataclasses import asdict, dataclass
+from typing import Optional
+import json, logging, math, re, time
+import pandas as pd
+
+logger = logging.getLogger("RunFromRun.Analyze.Offchain.Layout_Template")
+logger.setLevel(logging.DEBUG)
+
+FIELDS = [field for field, _ in FIELD_PHRASES]
+
+@dataclass
+class LayoutTemplate:
+    page: int
+    bbox: list[float]           # Camelot table._bbox (왼쪽, 아래, 오른쪽, 위)
+    flavor: str
+    area: str                   # Camelot table_areas 형식 "왼쪽,위,오른쪽,아래"
+    column: int                 # 금액 열 위치 (날짜별 열이 여러 개인 경우)
+    row_fields: dict[str, str]  # 정규화한 행 이름 → AmountsOnly 필드
+    total_label: str
+    cusip_appearance: bool
+    latest_column: bool = False # 금액 열이 날짜별 열 중 머리글의 기준일이 가장 최근인 열이었는지 (보고서마다 날짜가 바뀌므로 머리글 문자열 대신 기록)
+
+# "Total USDC reserve assets as of September 30, 2025"처럼 행 이름에 보고 기준일이 들어가는 경우 날짜 부분은 비교에서 제외
+AS_OF = re.compile(r"\s+as\s+(?:of|at)\b.*$")
+
+def normalize_label(label) -> str:
+    if not isinstance(label, str):
+        return ""
+    label = " ".join(label.lower().replace("*", " ").split())
+    return AS_OF.sub("", label).strip(" :.,")
+
+def table_area(bbox: list[float], flavor: str, margin: float) -> str:
+    # hybrid/stream은 텍스트 위치로 표를 찾으므로 행이 조금 늘어나도 들어오도록 여유를 둠.
+    # lattice는 영역 안의 선으로 격자를 다시 그리므로 여유를 두면 표 밖의 선까지 잡혀 빈 행/열이 생김 => bbox 그대로 사용
+    if flavor == "lattice":
+        margin = 0.0
+    x1, y1, x2, y2 = bbox
+    return f"{x1 - margin},{y2 + margin},{x2 + margin},{max(0.0, y1 - margin)}"
+
+def _same_amount(a: float, b: float) -> bool:
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=0.5)
+
+def _column_rows(df: pd.DataFrame, column: int, scale: float) -> list[tuple[str, float]]:
+    rows = []
+    for label, cell in zip(df.iloc[:, 0], df.iloc[:, column]):
+        amount = parse_money(cell)
+        name = normalize_label(label)
+        if amount is not None and name:
+            rows.append((name, amount * scale))
+    return rows
+
+def _is_total_row(label: str) -> bool:
+    return bool(TOTAL_LABEL.match(label)) and not SUBTOTAL_LABEL.match(label) and not ISSUANCE_LABEL.search(label)
+
+def map_rows(rows: list[tuple[str, float]], amounts: dict[str, float]) -> Optional[tuple[dict[str, str], str]]:
+    # 분석 결과(amounts)의 각 항목이 이 열의 어느 행에서 나왔는지 찾음. 모든 항목과 합계를 설명할 수 있을 때만 (행 이름 → 필드, 합계 행 이름) 반환.
+    # 1) 금액이 같은 행 하나 (행 이름이 해당 필드의 문구와 맞는 행 우선)  2) 필드 문구와 맞는 행들의 합
+    total_rows = [label for label, amount in rows if _is_total_row(label) and _same_amount(amount, amounts["total"])]
+    if not total_rows:
+        return None
+    total_label = total_rows[-1]
+    row_fields: dict[str, str] = {}
+    for field in FIELDS:
+        value = amounts.get(field, 0.0)
+        if not value:
+            continue
+        same = [label for label, amount in rows if _same_amount(amount, value) and label != total_label and label not in row_fields]
+        if same:
+            preferred = [label for label in same if match_field(label) == field]
+            row_fields[(preferred or same)[0]] = field
+            continue
+        matched = [(label, amount) for label, amount in rows if match_field(label) == field and label not in row_fields and not TOTAL_LABEL.match(label)]
+        if matched and _same_amount(sum(amount for _, amount in matched), value):
+            row_fields.update({label: field for label, _ in matched})
+            continue
+        return None
+    return row_fields, total_label
+
+def _latest_period_column(df: pd.DataFrame) -> Optional[int]:
+    # 날짜별 금액 열이 여러 개인 표에서 머리글의 기준일이 가장 최근인 열. 날짜별 열이 아니거나 정할 수 없으면 None.
+    columns = [column for column in range(1, df.shape[1]) if any(parse_money(cell) is not None for cell in df.iloc[:, column])]
+    if len(columns) < 2:
+        return None
+    latest = latest_period([period_date(df, column) for column in columns])
+    return None if latest is None else columns[latest]
+
+def learn_template(tables: list[pd.DataFrame], asset_table: AssetTable, cusip_appearance: bool) -> Optional[LayoutTemplate]:
+    # 분석 결과의 금액을 모두 설명하는 열에서 학습. 이전 기준일 열이 같은 금액을 내는 경우처럼 여러 열이 맞으면
+    # 머리글의 기준일이 가장 최근인 열을 사용하고, 정할 수 없으면 학습하지 않음(열 위치로 추측하지 않음).
+    amounts = {field: getattr(asset_table, field).amount for field in FIELDS + ["total"]}
+    if amounts["total"] <= 0:
+        return None
+    matches = []
+    for df in tables:
+        page, bbox, flavor = df.attrs.get("page"), df.attrs.get("bbox"), df.attrs.get("flavor")
+        if page is None or not bbox or flavor is None or df.shape[1] < 2:
+            continue
+        scale = table_scale(df)
+        for column in range(1, df.shape[1]):
+            mapped = map_rows(_column_rows(df, column, scale), amounts)
+            if mapped is not None:
+                matches.append((df, column, mapped))
+    if len(matches) > 1:
+        latest = latest_period([period_date(df, column) for df, column, _ in matches])
+        if latest is None:
+            logger.debug(f"{len(matches)} columns match the analysis result and their report dates are unknown; not learning a template")
+            return None
+        matches = [matches[latest]]
+    if not matches:
+        return None
+    (df, column, (row_fields, total_label)), = matches
+    page, bbox, flavor = df.attrs["page"], df.attrs["bbox"], df.attrs["flavor"]
+    return LayoutTemplate(
+        page=int(page), bbox=[float(v) for v in bbox], flavor=flavor, area=table_area(bbox, flavor, EXTRACTION.LAYOUT_AREA_MARGIN),
+        column=column, row_fields=row_fields, total_label=total_label, cusip_appearance=cusip_appearance,
+        latest_column=_latest_period_column(df) == column,
+    )
+
+def apply_template(template: LayoutTemplate, tables: list[pd.DataFrame], tolerance: Optional[float] = None) -> Optional[AmountsOnly]:
+    # 기록된 열만 확인. 날짜별 열 중 최근 기준일 열에서 학습했으면 이번 보고서에서도 머리글의 기준일이 가장 최근인 열을 사용
+    # (이전 기준일 열도 자체 합계와 맞으므로 다른 열로 대신하지 않음). 항목 합이 합계와 맞지 않으면 None.
+    # 기준일별로 같은 양식의 표가 여러 페이지에 있을 수 있으므로 기록된 페이지의 표만 사용.
+    tolerance = EXTRACTION.RULE_TOLERANCE if tolerance is None else tolerance
+    for df in tables:
+        if df.shape[1] < 2 or df.attrs.get("page", template.page) != template.page:
+            continue
+        latest = _latest_period_column(df) if template.latest_column else None
+        column = template.column if latest is None else latest
+        if column >= df.shape[1]:
+            continue
+        rows = _column_rows(df, column, table_scale(df))
+        totals = [amount for label, amount in rows if label == template.total_label]
+        amounts: dict[str, float] = {}
+        for label, amount in rows:
+            if label in template.row_fields:
+                field = template.row_fields[label]
+                amounts[field] = amounts.get(field, 0.0) + amount
+        if not totals or not amounts or max(totals) <= 0:
+            continue
+        total = max(totals)
+        if abs(sum(amounts.values()) - total) / total <= tolerance:
+            return AmountsOnly.model_validate({field: 0.0 for field in FIELDS} | amounts | {"total": total})
+    return None
+
+def extract_with_template(pdf_path, template: LayoutTemplate) -> list[pd.DataFrame]:
+    # 프로세스 풀에서 실행. 템플릿의 페이지와 영역만 파싱하고 기존과 같은 필터링/후처리를 거침.
+    return finalize_tables(read_area_tables(pdf_path, template.page, template.flavor, template.area), pdf_path)
+
+# ============== 캐시 인덱스 ==============
+_stats = {"hits": 0, "misses": 0, "learned": 0, "forgotten": 0}
+
+def load_template(issuer: str, coin: str) -> Optional[LayoutTemplate]:
+    with cache_index.connect() as conn:
+        row = conn.execute(
+            "SELECT template_json FROM layout_templates WHERE issuer = ? AND coin = ?", (cache_index.issuer_key(issuer), coin)
+        ).fetchone()
+    if row is None:
+        return None
+    try:
+        return LayoutTemplate(**json.loads(row[0]))
+    except (TypeError, ValueError): # 템플릿 형식이 바뀐 경우 다시 학습
+        return None
+
+def update_template(issuer: str, coin: str, tables: list[pd.DataFrame], asset_table: AssetTable, cusip_appearance: bool, pdf_hash: str) -> Optional[LayoutTemplate]:
+    # 전체 분석 결과로 템플릿을 다시 학습. 결과를 설명하는 표가 없으면 기존 템플릿은 더 이상 맞지 않으므로 삭제.
+    template = learn_template(tables, asset_table, cusip_appearance)
+    with cache_index.connect() as conn:
+        if template is None:
+            deleted = conn.execute("DELETE FROM layout_templates WHERE issuer = ? AND coin = ?", (cache_index.issuer_key(issuer), coin)).rowcount
+            _stats["forgotten"] += deleted
+        else:
+            conn.execute(
+                "INSERT OR REPLACE INTO layout_templates (issuer, coin, template_json, learned_from, learned_at) VALUES (?, ?, ?, ?, ?)",
+                (cache_index.issuer_key(issuer), coin, json.dumps(asdict(template)), pdf_hash, time.time()),
+            )
+            _stats["learned"] += 1
+    if template is not None:
+        logger.info(f"Learned layout template for {issuer} {coin}: page {template.page}, {template.flavor}, {len(template.row_fields)} rows")
+    return template
+
+def record_template_result(hit: bool):
+    _stats["hits" if hit else "misses"] += 1
+
+metrics.register_collector("layout_templates", lambda: dict(_stats))
@@ -0,0 +1,90 @@
+# LLM 응답 캐시.
+# AssetTable 캐시가 없어진 경우나 OLLAMASETTINGS.MODELS에 모델을 추가한 경우, 프롬프트가 완전히 같아도 모든 모델을 다시 호출하였음.
+# 모델의 응답 원문을 (모델 이름, 모델 digest, sha256(system + user prompt), options) 키로 캐시 인덱스에 저장하여
+# 응답이 없는 모델만 호출하도록 함. 같은 이름이라도 모델을 다시 pull하면 digest가 바뀌므로 이전 응답은 사용되지 않음.
+# 응답마다 digest와 함께 digest를 뺀 prompt_key(프롬프트, options)도 저장하여, 모델을 호출하지 않고 다시 투표할 때(reanalyze --revote)는
+# Ollama 없이 (모델, prompt_key)의 가장 최근 응답을 사용함.
+from common import metrics
+from data_pulling.offchain import cache_index
+from hashlib import sha256
+from ollama import AsyncClient, Options
+import json, logging, time
+
+logger = logging.getLogger("RunFromRun.Analyze.Offchain.LLM_Cache")
+logger.setLevel(logging.DEBUG)
+
+_stats = {"hits": 0, "misses": 0, "saved_seconds": 0.0}
+
+def llm_cache_stats() -> dict:
+    return _stats | {"hit_ratio": metrics.ratio(_stats["hits"], _stats["hits"] + _stats["misses"])}
+
+metrics.register_collector("llm_response_cache", llm_cache_stats)
+
+async def get_model_digests(ollama_client: AsyncClient) -> dict[str, str]:
+    # 모델 이름 -> digest. 조회에 실패하면 빈 dict를 반환하며, digest를 모르는 모델은 캐시를 사용하지 않음.
+    try:
+        response = await ollama_client.list()
+    except Exception as e:
+        logger.warning(f"Failed to list Ollama models, LLM response cache disabled for this request: {e}")
+        return {}
+    digests = {}
+    for model in response.models:
+        if model.model and model.digest:
+            digests[model.model] = model.digest
+            if model.model.endswith(":latest"): # 설정에는 태그 없이 적는 경우가 많음 (예: 'phi4')
+                digests[model.model.removesuffix(":latest")] = model.digest
+    return digests
+
+def _prompt_parts(system_prompt: str, user_prompt: str, options: Options) -> tuple[str, str]:
+    prompt_digest = sha256((system_prompt + user_prompt).encode("utf-8")).hexdigest()
+    options_json = json.dumps(options.model_dump(exclude_none=True), sort_keys=True)
+    return prompt_digest, options_json
+
+def response_cache_key(model: str, digest: str, system_prompt: str, user_prompt: str, options: Options) -> str:
+    prompt_digest, options_json = _prompt_parts(system_prompt, user_prompt, options)
+    return sha256(json.dumps([model, digest, prompt_digest, options_json]).encode("utf-8")).hexdigest()
+
+def prompt_key(system_prompt: str, user_prompt: str, options: Options) -> str:
+    # 모델 digest와 무관한 키. 모델 이름과 함께 조회.
+    return sha256(json.dumps(_prompt_parts(system_prompt, user_prompt, options)).encode("utf-8")).hexdigest()
+
+def load_cached_responses(cache_keys: dict[str, str]) -> dict[str, str]:
+    # 모델 이름 -> 캐시 키를 받아 응답 원문이 있는 모델만 반환
+    if not cache_keys:
+        return {}
+    cached: dict[str, str] = {}
+    with cache_index.connect() as conn:
+        for model, cache_key in cache_keys.items():
+            row = conn.execute("SELECT content, latency FROM llm_responses WHERE cache_key = ?", (cache_key,)).fetchone()
+            if row is None:
+                _stats["misses"] += 1
+                continue
+            content, latency = row
+            cached[model] = content
+            _stats["hits"] += 1
+            _stats["saved_seconds"] += latency
+    return cached
+
+def load_latest_responses(prompt_keys: dict[str, str]) -> dict[str, tuple[str, str]]:
+    # 모델 이름 -> prompt_key를 받아, digest와 관계없이 가장 최근 응답이 있는 모델의 (응답 원문, digest)를 반환. Ollama를 조회하지 않음.
+    cached: dict[str, tuple[str, str]] = {}
+    with cache_index.connect() as conn:
+        for model, key in prompt_keys.items():
+            row = conn.execute(
+                "SELECT content, digest, latency FROM llm_responses WHERE model = ? AND prompt_key = ? ORDER BY created_at DESC LIMIT 1", (model, key)
+            ).fetchone()
+            if row is None:
+                _stats["misses"] += 1
+                continue
+            content, digest, latency = row
+            cached[model] = (content, digest)
+            _stats["hits"] += 1
+            _stats["saved_seconds"] += latency
+    return cached
+
+def store_response(cache_key: str, model: str, digest: str, prompt_key: str, content: str, latency: float):
+    with cache_index.connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_responses (cache_key, model, digest, prompt_key, content, latency, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (cache_key, model, digest, prompt_key, content, latency, time.time()),
+        )
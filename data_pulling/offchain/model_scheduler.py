@@ -0,0 +1,164 @@
+# Ollama 모델 스케줄러.
+# 메모리가 부족한 서버에서는 Ollama가 모델을 호출할 때마다 내렸다가 다시 올리기 때문에, 추론보다 로딩 시간이 더 긴 경우가 많음.
+# 1) 서버 시작 시 keep_alive로 모델을 미리 올려두고 (warm-up)
+# 2) Ollama의 실행 중인 모델 목록(ps)을 조회하여 이미 올라가 있는 모델부터 호출하며
+# 3) 여러 분석 요청이 동시에 들어오면 모델별 대기열에 모아서, 한 번 올라간 모델이 대기 중인 프롬프트를 모두 처리한 뒤 다음 모델로 넘어감.
+# 동시에 사용하는 모델 수는 OLLAMASETTINGS.MAX_PARALLEL_MODELS로 제한.
+from common import metrics
+from common.settings import OLLAMASETTINGS
+from collections import deque
+from contextvars import Context, copy_context
+from dataclasses import dataclass, field
+from ollama import AsyncClient
+from typing import Any, Awaitable, Callable, Optional
+import asyncio, logging, time
+
+logger = logging.getLogger("RunFromRun.Analyze.Offchain.Model_Scheduler")
+logger.setLevel(logging.DEBUG)
+
+RESIDENCY_TTL = 5.0 # 초, 이 시간 안에 조회한 ps 결과는 다시 조회하지 않음
+
+@dataclass
+class _Job:
+    fn: Callable[[AsyncClient, str], Awaitable[Any]]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    context: Context = field(default_factory=copy_context) # 제출한 요청의 context (tracing span 등)에서 실행하기 위함
+    task: Optional[asyncio.Task] = None
+
+class ModelScheduler:
+    def __init__(self, host: str, max_active_models: int):
+        self.client = AsyncClient(host=host)
+        self.max_active_models = max(1, max_active_models)
+        self._queues: dict[str, deque[_Job]] = {}
+        self._active: set[str] = set()
+        self._resident: set[str] = set()
+        self._drainers: set[asyncio.Task] = set() # event loop는 task를 약한 참조로만 가지므로 실행 중인 drain task를 보관
+        self._residency_checked_at = 0.0
+        self._stats = {"jobs": 0, "batches": 0, "resident_hits": 0, "warmed_up": 0}
+
+    # ============== 모델 상주 여부 ==============
+    async def refresh_residency(self, force: bool = False) -> set[str]:
+        if not force and time.monotonic() - self._residency_checked_at < RESIDENCY_TTL:
+            return self._resident
+        try:
+            response = await self.client.ps()
+        except Exception as e:
+            logger.warning(f"Failed to query running Ollama models: {e}")
+            return self._resident
+        resident = set()
+        for model in response.models:
+            resident.add(model.model)
+            resident.add(model.model.removesuffix(":latest")) # 설정에는 태그 없이 적는 경우가 많음 (예: 'phi4')
+        self._resident = resident
+        self._residency_checked_at = time.monotonic()
+        return resident
+
+    def order_by_residency(self, models: list[str]) -> list[str]:
+        # 이미 올라가 있는 모델을 먼저, 나머지는 설정 순서대로
+        return sorted(models, key=lambda model: model not in self._resident)
+
+    async def warm_up(self, models: list[str]):
+        # 빈 프롬프트로 generate를 호출하면 추론 없이 모델만 올라감. 메모리를 두고 경쟁하지 않도록 하나씩 올림.
+        for model in models:
+            start = time.time()
+            try:
+                await self.client.generate(model=model, prompt="", keep_alive=OLLAMASETTINGS.KEEP_ALIVE)
+            except Exception as e:
+                logger.warning(f"Warm-up failed for {model}: {e}")
+                continue
+            self._stats["warmed_up"] += 1
+            logger.info(f"Warmed up {model} in {time.time() - start:.2f} seconds (keep_alive={OLLAMASETTINGS.KEEP_ALIVE})")
+        resident = await self.refresh_residency(force=True)
+        logger.info(f"Resident models after warm-up: {sorted(resident)}")
+
+    # ============== 모델별 대기열 ==============
+    async def submit(self, model: str, fn: Callable[[AsyncClient, str], Awaitable[Any]]) -> Any:
+        # fn(client, model)을 모델의 대기열에 넣고 결과를 기다림. 기다리는 쪽이 취소되면 대기 중인 작업은 빼고, 실행 중인 작업은 취소.
+        job = _Job(fn=fn, future=asyncio.get_running_loop().create_future())
+        self._queues.setdefault(model, deque()).append(job)
+        self._stats["jobs"] += 1
+        self._dispatch()
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            if job.task is not None:
+                job.task.cancel()
+            else:
+                try:
+                    self._queues[model].remove(job)
+                except ValueError:
+                    pass
+            raise
+
+    def _next_model(self) -> Optional[str]:
+        # 대기 중인 모델 중 상주 모델 우선, 그다음 가장 오래 기다린 작업이 있는 모델
+        waiting = [model for model, queue in self._queues.items() if queue and model not in self._active]
+        if not waiting:
+            return None
+        return min(waiting, key=lambda model: (model not in self._resident, self._queues[model][0].enqueued_at))
+
+    def _dispatch(self):
+        while len(self._active) < self.max_active_models:
+            model = self._next_model()
+            if model is None:
+                return
+            self._active.add(model)
+            if model in self._resident:
+                self._stats["resident_hits"] += 1
+            drainer = asyncio.create_task(self._drain(model))
+            self._drainers.add(drainer)
+            drainer.add_done_callback(self._drain_done)
+
+    def _drain_done(self, drainer: asyncio.Task):
+        self._drainers.discard(drainer)
+        if not drainer.cancelled() and drainer.exception() is not None:
+            logger.error(f"Model queue drain failed: {drainer.exception()!r}")
+
+    async def _drain(self, model: str):
+        # 모델이 올라가 있는 동안 대기열에 쌓인 작업을 모두 처리. 처리 중에 새로 들어온 작업도 이어서 처리.
+        queue = self._queues[model]
+        try:
+            while queue:
+                jobs = list(queue)
+                queue.clear()
+                self._stats["batches"] += 1
+                if len(jobs) > 1:
+                    logger.debug(f"{model} serving {len(jobs)} queued prompts in one batch")
+                for job in jobs:
+                    job.task = asyncio.create_task(job.fn(self.client, model), context=job.context)
+                await asyncio.gather(*(job.task for job in jobs), return_exceptions=True)
+                for job in jobs:
+                    if job.future.done():
+                        continue
+                    if job.task.cancelled():
+                        job.future.cancel()
+                    elif job.task.exception() is not None:
+                        job.future.set_exception(job.task.exception())
+                    else:
+                        job.future.set_result(job.task.result())
+                self._resident.add(model)
+        finally:
+            self._active.discard(model)
+            self._dispatch()
+
+    def stats(self) -> dict:
+        return self._stats | {
+            "active_models": sorted(self._active),
+            "queued_jobs": {model: len(queue) for model, queue in self._queues.items() if queue},
+            "resident_models": sorted(self._resident),
+        }
+
+_scheduler: Optional[ModelScheduler] = None
+_scheduler_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_model_scheduler() -> ModelScheduler:
+    # AsyncClient와 Future는 event loop에 묶이므로 loop가 바뀌면(스크립트에서 asyncio.run을 여러 번 호출하는 경우) 새로 생성
+    global _scheduler, _scheduler_loop
+    loop = asyncio.get_running_loop()
+    if _scheduler is None or _scheduler_loop is not loop:
+        _scheduler = ModelScheduler(OLLAMASETTINGS.HOST, OLLAMASETTINGS.MAX_PARALLEL_MODELS)
+        _scheduler_loop = loop
+    return _scheduler
+
+metrics.register_collector("model_scheduler", lambda: _scheduler.stats() if _scheduler else {})
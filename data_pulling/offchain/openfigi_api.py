@@ -1,7 +1,14 @@
-import json, re
-import urllib.request
+import asyncio, httpx, logging, math, re, time
+import pandas as pd
+from collections import deque
 
-from common.settings import API_KEYS, API_URLS
+from common import metrics
+from common.tracing import span
+from common.settings import API_KEYS, API_URLS, CACHE
+from data_pulling.offchain import cache_index
+
+logger = logging.getLogger("RunFromRun.Analyze.Offchain.OpenFIGI")
+logger.setLevel(logging.DEBUG)
 
 # CUSIP은 9자, I, O를 제외한 알파벳과 숫자 조합으로 공백이 없고, 마지막 한 글자는 체크 디지트로 숫자가 오게됨.
 # CUSIP_RE = re.compile(r'\b[A-HJ-NP-Z0-9]{8}[0-9]\b')
@@ -18,6 +25,8 @@ CUSIP_CORE = r'(?<![A-Z0-9])[A-HJ-NP-Z0-9]{8}[0-9](?![A-Z0-9])'  # I,O 제외 +
 # 우측: 문자열 끝 $ 또는 SEPS
 CUSIP_BOUNDED = re.compile(rf"(^|{SEPS})({CUSIP_CORE})(?=$|{SEPS})", flags=re.ASCII)
 
+UNVALID_CUSIP = "UNVALID CUSIP" # OpenFIGI에 등록되지 않은 CUSIP의 치환 결과
+
 def _char_val(ch: str) -> int:
     if ch.isdigit():
         return ord(ch) - ord('0')
@@ -51,43 +60,228 @@ def find_cusips(text: str) -> list[str]:
             seen.add(tok)
     return out
 
-def openfigi_api_call(data: dict | None = None, method: str = "POST") -> str:
-    api_key = API_KEYS.OPENFIGI
-    url = API_URLS.OPENFIGI_MAPPING_API_URL
+def describe_mapping(job_result: dict) -> str:
+    # mapping 응답의 job 하나를 자연어 설명으로 변환. 결과가 없으면 "UNVALID CUSIP"
+    try:
+        final_result = job_result["data"][0]
+        return final_result["name"] + " : " + final_result["securityType"] + " " + final_result["securityType2"]
+    except (KeyError, IndexError, TypeError):
+        return UNVALID_CUSIP
+
+# ============== Batched mapping ==============
+# 셀마다 CUSIP 하나씩 동기 POST를 보내면 CUSIP이 수백 개인 보고서는 수백 번의 왕복이 순차적으로 발생.
+# 모든 표에서 CUSIP을 먼저 모아 중복을 제거하고, 한 번의 POST에 여러 job을 담아 비동기로 요청한 뒤 한 번에 치환함.
+# OpenFIGI 제한 (https://www.openfigi.com/api/documentation#rate-limits):
+#   API key 있음: 요청당 100 jobs, 6초당 25 요청 / API key 없음: 요청당 10 jobs, 1분당 25 요청
+MAX_RETRIES_ON_429 = 3
+
+def _mapping_limits() -> tuple[int, int, float]:
+    if API_KEYS.OPENFIGI:
+        return 100, 25, 6.0
+    return 10, 25, 60.0
+
+class _RateLimiter:
+    # 슬라이딩 윈도우 방식: window초 안에 max_requests개까지만 요청을 보냄
+    def __init__(self, max_requests: int, window: float):
+        self.max_requests = max_requests
+        self.window = window
+        self._sent: deque[float] = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                while self._sent and now - self._sent[0] >= self.window:
+                    self._sent.popleft()
+                if len(self._sent) < self.max_requests:
+                    self._sent.append(now)
+                    return
+                await asyncio.sleep(self._sent[0] + self.window - now)
+
+_limiter: _RateLimiter | None = None
+
+def _get_limiter() -> _RateLimiter:
+    # 동시에 분석 중인 보고서들이 같은 제한을 공유하도록 프로세스 단위로 하나만 사용
+    global _limiter
+    if _limiter is None:
+        _, max_requests, window = _mapping_limits()
+        _limiter = _RateLimiter(max_requests, window)
+    return _limiter
+
+def collect_cusips(tables: list[pd.DataFrame]) -> list[str]:
+    # 모든 표의 문자열 셀에서 CUSIP을 찾아 등장 순서(표 순서, 표 안에서는 행 우선)대로 중복 없이 반환
+    cells: dict[str, None] = {} # 같은 셀은 한 번만 검사하되 처음 등장한 순서를 유지
+    for df in tables:
+        for value in pd.unique(df.to_numpy().ravel()):
+            if isinstance(value, str) and value:
+                cells[value] = None
+    found: dict[str, None] = {}
+    for cell in cells:
+        for cusip in find_cusips(cell):
+            found[cusip] = None
+    return list(found)
+
+# ============== Persistent CUSIP cache ==============
+# 같은 국채 CUSIP이 USDT, USDC, FDUSD 보고서에 매달 반복되므로 해석 결과를 캐시 인덱스(SQLite)에 저장.
+# "UNVALID CUSIP"도 저장하여(negative caching) 매번 다시 묻지 않되, 나중에 등록될 수 있으므로 TTL을 짧게 둠.
+SQL_CHUNK = 500 # SQLite 바인딩 변수 개수 제한을 넘지 않도록 나누어 조회
+
+_cache_stats = {"hits": 0, "misses": 0, "requests_made": 0, "requests_avoided": 0, "rounds_avoided": 0}
+# 요청 묶음들은 gather로 동시에 보내므로 절약한 시간은 요청 수가 아니라 라운드(rate limit 안에서 함께 보내는 요청들) 수로 추정.
+# 라운드 1회의 지연시간(지수이동평균)은 재시작 후 첫 요청 전까지 모르므로, 절약한 라운드 수를 기록해두고 조회 시점에 시간으로 환산.
+_round_latency_ema: float | None = None
+
+def _record_round_latency(latency: float, alpha: float = 0.3):
+    global _round_latency_ema
+    _round_latency_ema = latency if _round_latency_ema is None else alpha * latency + (1 - alpha) * _round_latency_ema
 
+def batch_rounds(n_cusips: int) -> int:
+    # n_cusips개를 해석하는 데 필요한 라운드 수. 한 window에 max_requests개의 요청만 보낼 수 있고, 나머지는 다음 window까지 기다림.
+    jobs_per_request, max_requests, _ = _mapping_limits()
+    return math.ceil(math.ceil(n_cusips / jobs_per_request) / max_requests)
+
+def cusip_cache_stats() -> dict:
+    lookups = _cache_stats["hits"] + _cache_stats["misses"]
+    return _cache_stats | {
+        "hit_ratio": metrics.ratio(_cache_stats["hits"], lookups),
+        "round_latency_ema": _round_latency_ema,
+        "saved_seconds": None if _round_latency_ema is None else _cache_stats["rounds_avoided"] * _round_latency_ema,
+    }
+
+metrics.register_collector("openfigi.cusip_cache", cusip_cache_stats)
+
+def load_cached_descriptions(cusips: list[str], expire: bool = True) -> dict[str, str]:
+    # TTL이 지나지 않은 항목만 반환하고(expire=False이면 TTL과 관계없이 모두), 반환한 항목의 last_access를 갱신
+    now = time.time()
+    positive_cutoff = now - CACHE.CUSIP_TTL_DAYS * 86400 if expire else -math.inf
+    negative_cutoff = now - CACHE.CUSIP_NEGATIVE_TTL_DAYS * 86400 if expire else -math.inf
+    cached: dict[str, str] = {}
+    with cache_index.connect() as conn:
+        for i in range(0, len(cusips), SQL_CHUNK):
+            chunk = cusips[i:i + SQL_CHUNK]
+            rows = conn.execute(
+                f"SELECT cusip, description, resolved_at FROM cusip_descriptions WHERE cusip IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for cusip, description, resolved_at in rows:
+                cutoff = negative_cutoff if description == UNVALID_CUSIP else positive_cutoff
+                if resolved_at >= cutoff:
+                    cached[cusip] = description
+        conn.executemany("UPDATE cusip_descriptions SET last_access = ? WHERE cusip = ?", [(now, cusip) for cusip in cached])
+    return cached
+
+def store_descriptions(resolved: dict[str, str]):
+    if not resolved:
+        return
+    now = time.time()
+    with cache_index.connect() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO cusip_descriptions (cusip, description, resolved_at, last_access) VALUES (?, ?, ?, ?)",
+            [(cusip, description, now, now) for cusip, description in resolved.items()],
+        )
+        # 최대 항목 수를 넘으면 가장 오래 사용되지 않은 항목부터 삭제
+        overflow = conn.execute("SELECT COUNT(*) FROM cusip_descriptions").fetchone()[0] - CACHE.CUSIP_MAX_ENTRIES
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM cusip_descriptions WHERE cusip IN (SELECT cusip FROM cusip_descriptions ORDER BY last_access LIMIT ?)",
+                (overflow,),
+            )
+            logger.debug(f"Evicted {overflow} least recently used CUSIPs from cache")
+
+async def _post_mapping_batch(client: httpx.AsyncClient, cusips: list[str]) -> dict[str, str]:
     headers = {"Content-Type": "application/json"}
-    if api_key:
-        headers |= {"X-OPENFIGI-APIKEY": api_key}
-
-    request = urllib.request.Request(
-        url=url,
-        data=data and bytes(json.dumps(data), encoding="utf-8"),
-        headers=headers,
-        method=method
-    )
-
-    with urllib.request.urlopen(request) as response:
-        json_response_as_string = response.read().decode("utf-8")
-        json_obj:list[dict] = json.loads(json_response_as_string)
+    if API_KEYS.OPENFIGI:
+        headers |= {"X-OPENFIGI-APIKEY": API_KEYS.OPENFIGI}
+    jobs = [{"idType": "ID_CUSIP", "idValue": cusip} for cusip in cusips]
+    for attempt in range(MAX_RETRIES_ON_429 + 1):
+        await _get_limiter().acquire()
+        response = await client.post(API_URLS.OPENFIGI_MAPPING_API_URL, headers=headers, json=jobs)
+        _cache_stats["requests_made"] += 1
+        if response.status_code == 429 and attempt < MAX_RETRIES_ON_429:
+            retry_after = float(response.headers.get("ratelimit-reset", _mapping_limits()[2]))
+            logger.warning(f"OpenFIGI rate limit hit, retrying in {retry_after} seconds")
+            await asyncio.sleep(retry_after)
+            continue
+        response.raise_for_status()
+        break
+    job_results: list[dict] = response.json() # 응답은 요청한 job 순서와 같음
+    return {cusip: describe_mapping(job_result) for cusip, job_result in zip(cusips, job_results)}
+
+async def resolve_cusips(cusips: list[str]) -> dict[str, str]:
+    # CUSIP → 자연어 설명. 요청에 실패한 묶음의 CUSIP은 결과에서 빠지며 원래 코드 그대로 남음.
+    jobs_per_request, _, _ = _mapping_limits()
+    batches = [cusips[i:i + jobs_per_request] for i in range(0, len(cusips), jobs_per_request)]
+    start_time = time.time()
+    async with httpx.AsyncClient(timeout=60) as client:
+        results = await asyncio.gather(*[_post_mapping_batch(client, batch) for batch in batches], return_exceptions=True)
+    if not any(isinstance(result, Exception) for result in results):
+        _record_round_latency((time.time() - start_time) / batch_rounds(len(cusips)))
+    resolved: dict[str, str] = {}
+    for batch, result in zip(batches, results):
+        if isinstance(result, Exception):
+            logger.warning(f"OpenFIGI mapping failed for {len(batch)} CUSIPs, keeping codes as-is: {result}")
+            continue
+        resolved.update(result)
+    return resolved
+
+def substitute_cusips(tables: list[pd.DataFrame], resolved: dict[str, str]) -> list[pd.DataFrame]:
+    # 모든 CUSIP을 하나의 alternation 정규식으로 묶어 문자열 열마다 한 번만 치환 (CUSIP 수만큼 표를 다시 훑지 않음)
+    if not resolved:
+        return tables
+    pattern = re.compile(r"(?<![A-Z0-9])(?:" + "|".join(map(re.escape, resolved)) + r")(?![A-Z0-9])")
+    describe = lambda match: resolved[match.group(0)] # 함수로 치환하므로 설명 안의 역슬래시가 그룹 참조로 해석되지 않음
+    substituted = []
+    for df in tables:
+        df = df.copy()
+        for col in range(df.shape[1]):
+            column = df.iloc[:, col]
+            is_str = column.map(lambda value: isinstance(value, str)) # None/NaN 셀은 그대로 둠
+            if is_str.any():
+                df.iloc[is_str.to_numpy(), col] = column[is_str].str.replace(pattern, describe, regex=True)
+        substituted.append(df)
+    return substituted
+
+async def resolve_cusips_in_tables(tables: list[pd.DataFrame], offline: bool = False) -> list[pd.DataFrame]:
+    # offline이면 OpenFIGI에 요청하지 않고 캐시에 있는 설명만으로 치환 (TTL과 관계없이 이전 분석 때와 같은 설명을 사용)
+    with span("openfigi", offline=offline) as openfigi_span:
+        cusips = collect_cusips(tables)
+        if not cusips:
+            openfigi_span.set(cusips=0, cache_hit=True)
+            return tables
+        if offline:
+            resolved = await asyncio.to_thread(load_cached_descriptions, cusips, False)
+            openfigi_span.set(cusips=len(cusips), cached=len(resolved), cache_hit=len(resolved) == len(cusips))
+            logger.debug(f"Resolved {len(resolved)}/{len(cusips)} unique CUSIPs from cache without OpenFIGI requests")
+            return substitute_cusips(tables, resolved)
         try:
-            result = json_obj[0]["data"]
-            final_result = result[0]
-            final_result = final_result["name"] + " : " + final_result["securityType"] + " " + final_result["securityType2"]  
-        except KeyError:
-            final_result = "UNVALID CUSIP"
-        return final_result
-
-def replace_cusip_openfigi(target_str: str) -> str:
-    # OPENFIGI를 이용하여 CUSIP으로 표기된 자산을 자연어 설명으로 변경
-    # See https://www.openfigi.com/api for more information.
-
-    candidates = find_cusips(target_str)
-
-    for cusip_code in candidates:
-        mapping_request = [
-            {"idType": "ID_CUSIP", "idValue": f"{cusip_code}"},
-        ]
-        response = openfigi_api_call(data=mapping_request,method="POST")
-        target_str = target_str.replace(f"{cusip_code}",response)
-    
-    return target_str
+            resolved = load_cached_descriptions(cusips)
+        except Exception as e: # 캐시 오류로 분석이 실패하지 않도록 OpenFIGI 요청으로 대체
+            logger.warning(f"CUSIP cache lookup failed, resolving all CUSIPs with OpenFIGI: {e}")
+            resolved = {}
+        missing = [cusip for cusip in cusips if cusip not in resolved]
+        _cache_stats["hits"] += len(resolved)
+        _cache_stats["misses"] += len(missing)
+        openfigi_span.set(cusips=len(cusips), cached=len(cusips) - len(missing), cache_hit=not missing)
+
+        jobs_per_request = _mapping_limits()[0]
+        requests_avoided = math.ceil(len(cusips) / jobs_per_request) - math.ceil(len(missing) / jobs_per_request)
+        rounds_avoided = batch_rounds(len(cusips)) - batch_rounds(len(missing))
+        _cache_stats["requests_avoided"] += requests_avoided
+        _cache_stats["rounds_avoided"] += rounds_avoided
+
+        if missing:
+            fetched = await resolve_cusips(missing)
+            openfigi_span.set(requests=math.ceil(len(missing) / jobs_per_request), fetched=len(fetched))
+            try:
+                store_descriptions(fetched)
+            except Exception as e:
+                logger.warning(f"Failed to store {len(fetched)} CUSIP descriptions in cache: {e}")
+            resolved |= fetched
+        logger.debug(
+            f"Resolved {len(resolved)}/{len(cusips)} unique CUSIPs: {len(cusips) - len(missing)} from cache, "
+            f"{math.ceil(len(missing) / jobs_per_request)} OpenFIGI requests ({requests_avoided} requests, {rounds_avoided} batch rounds avoided). "
+            f"Cache hit ratio {cusip_cache_stats()['hit_ratio']:.2%}, {_cache_stats['rounds_avoided']} batch rounds avoided in total."
+        )
+        return substitute_cusips(tables, resolved)
@@ -0,0 +1,38 @@
+# 스트리밍 중인 LLM 응답(JSON)을 중간에 검사하여, 끝까지 받아도 AmountsOnly로 검증될 수 없는 응답을 조기에 중단하기 위한 함수.
+# 최종 판단은 응답이 끝난 뒤 AmountsOnly.model_validate_json으로 하며, 여기서는 "확실히 실패하는 경우"만 골라냄.
+from common.schema import AmountsOnly
+from pydantic_core import from_json
+from typing import Any, Optional
+import re
+
+AMOUNT_FIELDS = frozenset(AmountsOnly.model_fields)
+# float으로 변환 가능한 문자열의 접두사 (pydantic lax mode는 "12", "1e3" 같은 문자열도 float으로 변환함)
+numeric_prefix = re.compile(r"^\s*[+-]?[0-9_]*\.?[0-9_]*(?:[eE][+-]?[0-9_]*)?\s*$")
+
+def _field_error(name: str, value: Any) -> Optional[str]:
+    # 값이 끝까지 들어와도 검증에 실패할 수밖에 없는 경우의 사유. 숫자, bool, 숫자 문자열(의 앞부분)은 허용.
+    if value is None:
+        return "total must not be null" if name == "total" else None
+    if isinstance(value, (dict, list)):
+        return f"{name} is a JSON {type(value).__name__}, not a number"
+    if isinstance(value, str) and not numeric_prefix.match(value):
+        return f"{name}={value!r} is not a number"
+    if name == "total" and isinstance(value, (int, float)) and not isinstance(value, bool) and value < 0:
+        return f"total={value} is negative"
+    return None
+
+def partial_amounts_error(text: str) -> Optional[str]:
+    # 지금까지 받은 응답으로 AmountsOnly 검증이 불가능해졌으면 그 사유를, 아직 가능하면 None을 반환
+    if not text.strip():
+        return None
+    try:
+        partial = from_json(text, allow_partial="trailing-strings") # 마지막의 끝나지 않은 문자열/숫자까지 포함하여 파싱
+    except ValueError as e:
+        return f"malformed JSON: {e}"
+    if not isinstance(partial, dict):
+        return f"top-level JSON is a {type(partial).__name__}, not an object"
+    for name in AMOUNT_FIELDS.intersection(partial): # AmountsOnly에 없는 key는 무시되므로 검사하지 않음
+        error = _field_error(name, partial[name])
+        if error:
+            return error
+    return None
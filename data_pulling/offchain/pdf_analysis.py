@@ -1,19 +1,34 @@
-from common.settings import OLLAMASETTINGS, SYSTEM_PROMPT, USER_PROMPT_TEMPLATE, LLM_OPTION
-from common.schema import AssetTable, AmountsOnly, Asset
-from data_pulling.offchain.pdf_fetch_caching import download_and_hash_pdf, search_log, get_AssetTable_from_cache, cache_result
-from data_pulling.offchain.dataframe_process import get_tables_from_pdf
+from common.settings import OLLAMASETTINGS, EXTRACTION, CACHE, SYSTEM_PROMPT, USER_PROMPT_TEMPLATE, LLM_OPTION, API_KEYS
+from common.schema import AssetTable, AmountsOnly
+from common.profiling import get_profiling_sink
+from common.tracing import span
+from data_pulling.offchain.pdf_fetch_caching import download_and_hash_pdf, search_cache, get_AssetTable_from_cache, cache_result, find_by_fingerprint, record_fingerprint, record_alias, touch_pdf
+from data_pulling.offchain.cache_manager import pinned
+from data_pulling.offchain.extraction_executor import extract_tables, run_in_extraction_pool
+from data_pulling.offchain.dataframe_process import content_fingerprint
+from data_pulling.offchain.openfigi_api import resolve_cusips_in_tables
+from data_pulling.offchain.prompt_compaction import compact_tables, squeeze_markdown, select_within_budget, token_budget, estimate_tokens, record_prefill_rate, report_saved_latency
+from data_pulling.offchain.llm_cache import get_model_digests, response_cache_key, prompt_key, load_cached_responses, load_latest_responses, store_response
+from data_pulling.offchain.model_scheduler import get_model_scheduler
+from data_pulling.offchain.partial_validation import partial_amounts_error
+from data_pulling.offchain.rule_extractor import extract_amounts_by_rules
+from data_pulling.offchain.layout_template import load_template, extract_with_template, apply_template, update_template, record_template_result
+from data_pulling.offchain.single_flight import SingleFlight
 from ollama import AsyncClient, ChatResponse, Options
+from contextlib import aclosing
 from typing import Optional
-import matplotlib.pyplot as plt
 import pandas as pd
 from  pathlib import Path
-import json, logging, time 
+import asyncio, json, logging, math, sqlite3, time
 
 # ollama client의 경우 default로 os.getenv('OLLAMA)
 
 logger = logging.getLogger("RunFromRun.Analyze.Offchain")
 logger.setLevel(logging.DEBUG)
 
+SYSTEM_PROMPT_WITH_SCHEMA = SYSTEM_PROMPT.replace("__json_schema__", json.dumps(AmountsOnly.model_json_schema()))
+LLM_OPTIONS = Options(temperature=0.0)
+
 # 토큰 제한 확인
 # from transformers import AutoTokenizer
 # tokenizer = AutoTokenizer.from_pretrained("meta-llama/Llama-3.1-8B")
@@ -57,6 +72,32 @@ def complete_user_prompt(str_tables_list: list[str], template: str) -> str:
     
     return user_prompt
 
+ASSET_NAMES = [
+    "cash_bank_deposits", "us_treasury_bills", "gov_mmf", "other_deposits",
+    "repo_overnight_term", "non_us_treasury_bills", "us_treasury_other_notes_bonds",
+    "corporate_bonds", "precious_metals", "digital_assets",
+    "secured_loans", "other_investments", "custodial_concentrated_asset", "total"
+]
+
+def _median_vote(asset_amounts: list[float]) -> float:
+    valid_votes_num = len(asset_amounts)
+    asset_amounts = sorted(asset_amounts)
+    if valid_votes_num == 0:
+        return 0.0
+    elif valid_votes_num == 1: # 하나의 모델이라도 잡은 경우, 이유가 있기 때문에 해당값을 채택 TODO: 유효 개수가 1이라면 신뢰도가 낮은 값일 가능성도 존재함. 추후 보완 필요.
+        # deprecated: return asset_amounts[0]
+        return 0.0 # 더 보수적으로 판단하는 것이 맞다고 여겨짐.
+    else:
+        return asset_amounts[(valid_votes_num - 1) // 2] # n이 짝수여도 같은 방식 적용 : 더 작은 값을 선택하여 더 보수적으로 접근
+
+def _valid_votes(amounts_list: list[AmountsOnly], asset_name: str) -> list[float]:
+    asset_amounts: list[float] = []
+    for amounts in amounts_list:
+        val: Optional[float] = getattr(amounts, asset_name)
+        if val is not None:
+            asset_amounts.append(float(val))
+    return asset_amounts
+
 def llm_vote_amounts(amounts_list: list[AmountsOnly], cusip_appearance: bool, pdf_hash: str) -> AssetTable:
     # 홀수 개의 모델의 응답을 받아 해당 자산별로 중간값(median) 산출
     # 기본적으로 명확하지 않은 value에 대해서는 보수적으로 접근하여 더 작은 값을 선택하도록 함.
@@ -66,34 +107,15 @@ def llm_vote_amounts(amounts_list: list[AmountsOnly], cusip_appearance: bool, pd
     # 0.0은 해당 자산이 없다는 의미이나, None은 모델이 해당 자산에 대해 판단하지 못했다는 의미이기 때문.
     if amounts_list is None or len(amounts_list) == 0:
         raise RuntimeError("LLM did not return any valid AmountsOnly responses")
-    ASSET_NAMES = [
-        "cash_bank_deposits", "us_treasury_bills", "gov_mmf", "other_deposits",
-        "repo_overnight_term", "non_us_treasury_bills", "us_treasury_other_notes_bonds",
-        "corporate_bonds", "precious_metals", "digital_assets",
-        "secured_loans", "other_investments", "custodial_concentrated_asset", "total"
-    ] 
     voted_assets = {}
     asset_sum = 0.0
 
     # Voting by median
     for asset_name in ASSET_NAMES:
-        asset_amounts:list[float] = []
-        for amounts in amounts_list:
-            val:Optional[float] = getattr(amounts, asset_name)
-            if val is not None:
-                asset_amounts.append(float(val))
-
-        valid_votes_num = len(asset_amounts)        
-        asset_amounts.sort()
-        logger.debug(f"Asset: {asset_name}, Valid votes: {valid_votes_num}, Values: {asset_amounts}")
-        if valid_votes_num == 0:
-            median_amount = 0.0
-        elif valid_votes_num == 1: # 하나의 모델이라도 잡은 경우, 이유가 있기 때문에 해당값을 채택 TODO: 유효 개수가 1이라면 신뢰도가 낮은 값일 가능성도 존재함. 추후 보완 필요.
-            # deprecated: median_amount = asset_amounts[0]
-            median_amount = 0.0 # 더 보수적으로 판단하는 것이 맞다고 여겨짐.
-        else:
-            median_amount = asset_amounts[(valid_votes_num - 1) // 2] # n이 짝수여도 같은 방식 적용 : 더 작은 값을 선택하여 더 보수적으로 접근
-        
+        asset_amounts: list[float] = _valid_votes(amounts_list, asset_name)
+        logger.debug(f"Asset: {asset_name}, Valid votes: {len(asset_amounts)}, Values: {sorted(asset_amounts)}")
+        median_amount = _median_vote(asset_amounts)
+
         voted_assets[asset_name] = median_amount
         if asset_name != "total":
             asset_sum += median_amount 
@@ -104,59 +126,261 @@ def llm_vote_amounts(amounts_list: list[AmountsOnly], cusip_appearance: bool, pd
 
     return result
 
+def votes_settled(amounts_list: list[AmountsOnly], pending_num: int) -> bool:
+    # 아직 응답하지 않은 모델(pending_num개)이 어떤 값을 내더라도(None 포함) llm_vote_amounts의 자산별 중간값이 바뀌지 않으면 True.
+    # 중간값은 추가되는 값에 대해 단조적이므로, 남은 응답 k개(0 < k <= pending_num)가 전부 -inf 혹은 전부 +inf인 두 극단만 확인하면 충분함.
+    # total은 자산별 중간값과 total 중간값으로 결정되므로 별도로 확인할 필요 없음.
+    if pending_num <= 0:
+        return True
+    for asset_name in ASSET_NAMES:
+        asset_amounts = _valid_votes(amounts_list, asset_name)
+        current = _median_vote(asset_amounts)
+        for extra in range(1, pending_num + 1):
+            if _median_vote(asset_amounts + [-math.inf] * extra) != current:
+                return False
+            if _median_vote(asset_amounts + [math.inf] * extra) != current:
+                return False
+    return True
+
 def delay_dict_to_list(delay_dict: dict[str,float]) -> list[(str,float)]:
     result = []
     for key, value in delay_dict.items():
         result.append((key, value))
     return result
 
-# Analysis 결과 시각화 함수
-def plotit_asset_tables(stablecoin:str, asset_table: AssetTable):
-    asset_list: list[(str,Asset)] = asset_table.to_list()
-    asset_names = []
-    asset_values = []
-    for tup in asset_list:
-        asset_names.append(tup[0])
-        asset_values.append(tup[1].amount)
-    plt.figure(figsize=(10, 6))
-    plt.bar(asset_names, asset_values)
-    plt.title(f'Asset proportion : {stablecoin}')
-    plt.xlabel('Asset')
-    plt.ylabel('US Dollar')
-    plt.xticks(rotation=30, ha='right')
-    plt.tight_layout()   # 라벨 잘림 방지
-    plt.savefig(f'{stablecoin}_pdf_analysis_assets.png')
-        
-def plotit_delay(stablecoin: str,delay_tup_list: list[(str,float)], model_nums: int):
-    delay_name=[]
-    delay_time=[]
-    COLOR = ['blue'] + ['green'] * model_nums + ['orange','red']
-    for tup in delay_tup_list:
-        delay_name.append(tup[0])
-        delay_time.append(tup[1])
-    plt.figure(figsize=(10, 6))
-    plt.bar(delay_name, delay_time, color=COLOR)
-    plt.title(f'Delay proportion : {stablecoin} PDF analysis in RTX 5070')
-    plt.xlabel('Job')
-    plt.ylabel('Seconds')
-    plt.xticks(rotation=30, ha='right')
-    plt.tight_layout()   # 라벨 잘림 방지
-    plt.savefig(f'{stablecoin}_pdf_analysis_delay.png')
+# 모델별 직전 응답 지연시간. early quorum으로 취소된 모델이 얼마나 더 걸렸을지 추정하는 데 사용.
+_last_model_latency: dict[str, float] = {}
+
+def model_deadline(model: str) -> float:
+    return OLLAMASETTINGS.DEADLINES.get(model, OLLAMASETTINGS.DEADLINE_SECONDS)
+
+async def query_model(ollama_client: AsyncClient, model: str, user_prompt: str, pdf_name: str, delay_dict: dict[str,float], digest: Optional[str] = None) -> Optional[AmountsOnly]:
+    # 모델 하나를 호출하고 응답을 AmountsOnly로 검증. 실패한 모델은 None을 반환하여 투표에서 제외.
+    # 응답을 스트리밍으로 받으며, 모델별 제한 시간을 넘기거나 중간 결과가 더 이상 AmountsOnly로 검증될 수 없으면 중단.
+    # digest를 알고 있으면 검증된 응답을 LLM 응답 캐시에 저장.
+    with span("llm", model=model, cache_hit=False, deadline=model_deadline(model)) as llm_span:
+        logger.debug(f"Calling LLM model **{model}** for PDF: {pdf_name}")
+        model_start_time = time.time()
+        deadline = model_deadline(model)
+        chunks: list[str] = []
+        final_part: Optional[ChatResponse] = None
+        try:
+            async with asyncio.timeout(deadline):
+                stream = await ollama_client.chat(
+                    model=model,
+                    format = "json",
+                    messages = [
+                        {"role": "system", "content": SYSTEM_PROMPT_WITH_SCHEMA},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    options = LLM_OPTIONS,
+                    keep_alive = OLLAMASETTINGS.KEEP_ALIVE,
+                    stream = True
+                )
+                async with aclosing(stream): # 중단하면 연결을 닫아 Ollama도 생성을 멈추도록 함
+                    async for part in stream:
+                        chunks.append(part.message.content or "")
+                        if part.done:
+                            final_part = part
+                            break
+                        error = partial_amounts_error("".join(chunks))
+                        if error:
+                            logger.warning(f"Aborted {model} on PDF {pdf_name} after {time.time() - model_start_time:.2f} seconds: {error}")
+                            llm_span.set(outcome="aborted", reason=error)
+                            logger.debug(f"Partial response content:\n{''.join(chunks)}")
+                            return None
+        except TimeoutError:
+            logger.warning(f"{model} exceeded its {deadline} seconds deadline on PDF {pdf_name}. Voting without it.")
+            llm_span.set(outcome="timeout")
+            return None
+        except Exception as e:
+            logger.error(f"LLM call failed for model {model} on PDF {pdf_name}: {e}")
+            llm_span.record_error(e)
+            return None
+        delay_dict[model] = time.time() - model_start_time
+        _last_model_latency[model] = delay_dict[model]
+        if final_part is not None:
+            record_prefill_rate(model, final_part)
+            llm_span.set(prompt_tokens=final_part.prompt_eval_count, output_tokens=final_part.eval_count)
+        logger.info(f"{model} latency: {delay_dict[model]:.4f} seconds.")
+        content = "".join(chunks).strip()
+        if not content:
+            logger.warning(f"Empty response from model {model}. Skipping.")
+            llm_span.set(outcome="empty")
+            return None
+
+        try:
+            amounts_only = AmountsOnly.model_validate_json(content)
+        except Exception as e:
+            logger.error(f"Invalid JSON from model {model}: {e}")
+            llm_span.set(outcome="invalid")
+            logger.debug(f"Raw response content:\n{content}")
+            return None
+        logger.info(f"\n=== From {model} ===\n{content}")
+        llm_span.set(outcome="ok")
+        if digest:
+            try:
+                cache_key = response_cache_key(model, digest, SYSTEM_PROMPT_WITH_SCHEMA, user_prompt, LLM_OPTIONS)
+                store_response(cache_key, model, digest, prompt_key(SYSTEM_PROMPT_WITH_SCHEMA, user_prompt, LLM_OPTIONS), content, delay_dict[model])
+            except Exception as e:
+                logger.warning(f"Failed to cache response of {model}: {e}")
+        return amounts_only
+
+# 아래 두 함수는 models만 호출하며, amounts_list에는 캐시에서 가져온 응답이 미리 들어있을 수 있음 (quorum 판단에 포함).
+# 모델 호출은 ModelScheduler를 거치므로 다른 분석 요청의 같은 모델 호출과 묶여서 처리됨.
+async def collect_amounts_sequentially(models: list[str], user_prompts: dict[str,str], pdf_name: str, delay_dict: dict[str,float], digests: dict[str,str], amounts_list: list[AmountsOnly]) -> list[AmountsOnly]:
+    amounts_list = list(amounts_list)
+    if OLLAMASETTINGS.EARLY_QUORUM and models and votes_settled(amounts_list, len(models)):
+        logger.info(f"Early quorum reached with cached responses. Skipping {models}")
+        return amounts_list
+    scheduler = get_model_scheduler()
+    for idx, model in enumerate(models):
+        amounts_only = await scheduler.submit(
+            model, lambda client, model: query_model(client, model, user_prompts[model], pdf_name, delay_dict, digests.get(model))
+        )
+        if amounts_only is not None:
+            amounts_list.append(amounts_only)
+        remaining = len(models) - idx - 1
+        if OLLAMASETTINGS.EARLY_QUORUM and remaining > 0 and votes_settled(amounts_list, remaining):
+            logger.info(f"Early quorum reached. Skipping {models[idx+1:]}")
+            break
+    return amounts_list
+
+async def collect_amounts_concurrently(models: list[str], user_prompts: dict[str,str], pdf_name: str, delay_dict: dict[str,float], digests: dict[str,str], amounts_list: list[AmountsOnly]) -> list[AmountsOnly]:
+    # 모델들을 MAX_PARALLEL_MODELS개까지 동시에 호출하고(스케줄러가 서버 전체에서 제한), 응답이 도착할 때마다 투표 결과가 확정되었는지 확인.
+    # 확정되면 남은 모델(straggler)은 취소하고, 기다리지 않아서 절약한 시간을 delay_dict["early_exit_saved"]에 기록.
+    amounts_list = list(amounts_list)
+    if OLLAMASETTINGS.EARLY_QUORUM and models and votes_settled(amounts_list, len(models)):
+        logger.info(f"Early quorum reached with cached responses. Skipping {models}")
+        return amounts_list
+    scheduler = get_model_scheduler()
+    model_start_times: dict[str, float] = {}
+
+    async def start_query(client: AsyncClient, model: str) -> Optional[AmountsOnly]:
+        model_start_times[model] = time.time()
+        return await query_model(client, model, user_prompts[model], pdf_name, delay_dict, digests.get(model))
+
+    async def limited_query(model: str) -> Optional[AmountsOnly]:
+        return await scheduler.submit(model, start_query)
+
+    task_to_model: dict[asyncio.Task, str] = {
+        asyncio.create_task(limited_query(model)): model for model in models
+    }
+    pending: set[asyncio.Task] = set(task_to_model)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                amounts_only = task.result()
+                if amounts_only is not None:
+                    amounts_list.append(amounts_only)
+            if OLLAMASETTINGS.EARLY_QUORUM and pending and votes_settled(amounts_list, len(pending)):
+                quorum_time = time.time()
+                stragglers = [task_to_model[task] for task in pending]
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                pending = set()
+                delay_dict["early_exit_saved"] = estimate_saved_time(stragglers, model_start_times, quorum_time, delay_dict)
+                logger.info(
+                    f"Early quorum reached with {len(amounts_list)} responses. Cancelled {stragglers}, "
+                    f"saved about {delay_dict['early_exit_saved']:.4f} seconds."
+                )
+    finally:
+        for task in pending: # 호출한 쪽에서 취소된 경우에도 모델 호출이 남지 않도록 정리
+            task.cancel()
+    return amounts_list
+
+def estimate_saved_time(stragglers: list[str], model_start_times: dict[str,float], quorum_time: float, delay_dict: dict[str,float]) -> float:
+    # 취소된 모델이 끝까지 실행되었다면 걸렸을 시간의 추정치.
+    # 직전 호출의 지연시간을 사용하고, 기록이 없으면 이번에 응답한 모델 중 가장 느린 값을 사용.
+    finished_latencies = [delay_dict[model] for model in OLLAMASETTINGS.MODELS if model in delay_dict]
+    fallback_latency = max(finished_latencies, default=0.0)
+    saved = 0.0
+    for model in stragglers:
+        expected_latency = _last_model_latency.get(model, fallback_latency)
+        started = model_start_times.get(model, quorum_time) # 세마포어 대기 중이던 모델은 지금 시작했다고 가정
+        saved = max(saved, started + expected_latency - quorum_time)
+    return saved
 
 # Main PDF 분석 함수
-async def analyze_pdf_api_call(pdf_path: Path, stablecoin: str) -> AssetTable:
+async def analyze_pdf_api_call(pdf_path: Path, stablecoin: str, issuer: Optional[str] = None) -> AssetTable:
     raise NotImplementedError("API call method is not implemented yet.")
 
-async def analyze_pdf_local_llm(pdf_hash: str, pdf_path: Path, stablecoin: str) -> AssetTable:
-    # ============== 1. PDF에서 데이터프레임 추출 ==============
+async def analyze_with_template(issuer: str, pdf_hash: str, pdf_path: Path, stablecoin: str, delay_dict: dict[str,float], e2e_start_time: float) -> Optional[AssetTable]:
+    # 발행사의 이전 보고서에서 학습한 layout template가 있으면 해당 페이지의 표 영역만 추출하여 기록된 행 이름 대응으로 금액을 구함.
+    # 템플릿이 없거나 항목 합이 합계와 맞지 않으면 None을 반환하여 전체 파이프라인으로 진행.
+    template_start_time = time.time()
+    with span("layout_template") as template_span:
+        template = await asyncio.to_thread(load_template, issuer, stablecoin)
+        template_span.set(cache_hit=template is not None)
+        if template is None:
+            return None
+        try:
+            tables: list[pd.DataFrame] = await run_in_extraction_pool(extract_with_template, pdf_path, template)
+            amounts: Optional[AmountsOnly] = apply_template(template, tables)
+        except Exception as e: # 페이지 수가 줄어든 경우 등
+            logger.warning(f"Layout template extraction failed for {pdf_path.name}: {e}")
+            amounts = None
+        template_span.set(page=template.page, flavor=template.flavor, reconciled=amounts is not None)
+    delay_dict["layout_template"] = time.time() - template_start_time
+    record_template_result(hit=amounts is not None)
+    if amounts is None:
+        logger.info(f"Layout template of {issuer} did not reconcile for PDF: {pdf_path.name}, falling back to full extraction")
+        return None
+    logger.info(f"Extracted amounts with the layout template of {issuer} (page {template.page}) for PDF: {pdf_path.name}")
+    asset_table = amounts.to_asset_table(cusip_appearance=template.cusip_appearance, pdf_hash=pdf_hash)
+    record_analysis(stablecoin, asset_table, delay_dict, e2e_start_time)
+    return asset_table
+
+async def analyze_pdf_local_llm(pdf_hash: str, pdf_path: Path, stablecoin: str, issuer: Optional[str] = None) -> AssetTable:
     delay_dict: dict[str,float] = {}
     e2e_start_time = time.time()
+    use_template = EXTRACTION.LAYOUT_TEMPLATES and issuer is not None
+    if use_template:
+        asset_table = await analyze_with_template(issuer, pdf_hash, pdf_path, stablecoin, delay_dict, e2e_start_time)
+        if asset_table is not None:
+            return asset_table
+    # ============== 1. PDF에서 데이터프레임 추출 ==============
     try:
-        tables: list[pd.DataFrame] = get_tables_from_pdf(pdf_path, stablecoin)
+        # CPU 작업이므로 프로세스 풀에서 페이지 단위로 나누어 실행하여 event loop가 멈추지 않도록 함
+        tables: list[pd.DataFrame] = await extract_tables(pdf_path, stablecoin, pdf_hash, issuer)
     except Exception as e:
         logger.error(f"Error extracting tables from PDF {pdf_path.name}: {e}")
         raise RuntimeError(f"PDF table extraction failed for {pdf_path.name}") from e
     logger.debug(f"Extracted {len(tables)} tables from PDF: {pdf_path.name}")
+    asset_table = await analyze_tables(tables, pdf_hash, pdf_path.name, stablecoin, delay_dict, e2e_start_time)
+    if use_template: # 다음 보고서를 위해 이번 결과가 나온 표의 위치와 행 이름 대응을 기록
+        try:
+            await asyncio.to_thread(update_template, issuer, stablecoin, tables, asset_table, cusip_check(markdownize_tables(tables)), pdf_hash)
+        except Exception as e:
+            logger.warning(f"Failed to learn layout template for {issuer} {stablecoin}: {e}")
+    return asset_table
+
+async def analyze_tables(tables: list[pd.DataFrame], pdf_hash: str, pdf_name: str, stablecoin: str, delay_dict: dict[str,float], e2e_start_time: float, query_models: bool = True) -> AssetTable:
+    # 후처리된 표부터 LLM 투표까지. 표 artifact로 다시 실행할 때(reanalyze)는 PDF 없이 이 함수만 호출됨.
+    # query_models=False이면 모델을 호출하지 않고 LLM 응답 캐시에 있는 응답만으로 투표
+    # ============== 1-1. 규칙 기반 추출 (fast path) ==============
+    # 행 이름으로 추출한 금액이 보고서 합계와 맞으면 CUSIP 해석, 프롬프트 생성, LLM 투표를 모두 건너뜀
+    if EXTRACTION.RULE_FAST_PATH:
+        rule_start_time = time.time()
+        with span("rule_extraction") as rule_span:
+            rule_amounts: Optional[AmountsOnly] = extract_amounts_by_rules(tables)
+            rule_span.set(reconciled=rule_amounts is not None)
+        delay_dict["rule_extraction"] = time.time() - rule_start_time
+        if rule_amounts is not None:
+            asset_table = rule_amounts.to_asset_table(cusip_appearance=cusip_check(markdownize_tables(tables)), pdf_hash=pdf_hash)
+            logger.info(f"Rule-based amounts reconcile with the reported total, skipping LLM voting for PDF: {pdf_name}")
+            record_analysis(stablecoin, asset_table, delay_dict, e2e_start_time)
+            return asset_table
+        logger.debug(f"Rule-based amounts did not reconcile for PDF: {pdf_name}, falling back to LLM voting")
+
+    # CUSIP -> 자연어로 replace. 모든 표의 CUSIP을 모아 중복 제거 후 묶음 요청
+    # 표 artifact는 CUSIP 치환 이전의 표이므로, 모델을 호출하지 않는 경우에도 같은 프롬프트를 만들기 위해 치환하되 OpenFIGI 요청 없이 캐시만 사용
+    if API_KEYS.OPENFIGI != "your_openfigi_api_key": # api key가 설정이 된 경우 진행
+        openfigi_start_time = time.time()
+        tables = await resolve_cusips_in_tables(tables, offline=not query_models)
+        delay_dict["openfigi"] = time.time() - openfigi_start_time
     
     # ============== 2. 데이터프레임들을 LLM 입력용 JSON 혹은 Mardown으로 변환 ==============
     # => 일반적으로 Markdown 형식이 더 안정적임. LLM 학습 시에 표 형식을 markdown 형태로 많이 접했을 가능성이 높음.
@@ -164,106 +388,179 @@ async def analyze_pdf_local_llm(pdf_hash: str, pdf_path: Path, stablecoin: str)
         #json_tables_str: list[str] = jsonize_tables(tables)
         markdown_tables_list: list[str] = markdownize_tables(tables)
     except Exception as e:
-        logger.error(f"Error converting tables to Markdown(or JSON) for PDF {pdf_path.name}: {e}")
-        raise RuntimeError(f"Dataframe to Markdown(or JSON) conversion failed for {pdf_path.name}") from e
+        logger.error(f"Error converting tables to Markdown(or JSON) for PDF {pdf_name}: {e}")
+        raise RuntimeError(f"Dataframe to Markdown(or JSON) conversion failed for {pdf_name}") from e
     logger.debug(f"Converted tables to Markdown(or JSON) format for LLM input.")
 
     # ============== 3. Table에 CUSIP 포함되어 있는지 확인 ==============
     cusip_appearance = cusip_check(markdown_tables_list)
 
     # ============== 4. User Prompt에 string으로 변환된 표 주입 ==============
+    # 중복 표와 숫자 없는 행을 제거한 뒤, 모델별 토큰 예산 안에서 관련도가 높은 표만 넣음
     #user_prompt = complete_user_prompt(json_tables_str, USER_PROMPT_TEMPLATE)
-    user_prompt = complete_user_prompt(markdown_tables_list, USER_PROMPT_TEMPLATE)
-    logger.debug(f"Constructed user prompt for LLM.")  
+    tokens_before = estimate_tokens(complete_user_prompt(markdown_tables_list, USER_PROMPT_TEMPLATE))
+    compacted_tables_list: list[str] = [squeeze_markdown(table) for table in markdownize_tables(compact_tables(tables))]
+    user_prompts: dict[str,str] = {}
+    for model in OLLAMASETTINGS.MODELS:
+        user_prompts[model] = complete_user_prompt(select_within_budget(compacted_tables_list, token_budget(model)), USER_PROMPT_TEMPLATE)
+    logger.debug(f"Constructed user prompts for LLM: {tokens_before} tokens before compaction, {[estimate_tokens(p) for p in user_prompts.values()]} after.")
     delay_dict["preprocess_delay"] = time.time() - e2e_start_time
 
 
     # ============== 5. LLM 호출 및 응답 수집 ==============
-    amounts_list: list[AmountsOnly] = []
     try:
-        ollama_client = AsyncClient(host=OLLAMASETTINGS.HOST)
+        scheduler = get_model_scheduler()
     except Exception as e:
         logger.error(f"Failed to Initiate Ollama Client. {e}")
         raise RuntimeError(f"Ollama Initiate Failed from Host: {OLLAMASETTINGS.HOST}") from e
-        
-    for model in OLLAMASETTINGS.MODELS:
-        logger.debug(f"Calling LLM model **{model}** for PDF: {pdf_path.name}")
-        model_start_time = time.time()
-        try:
-            response: ChatResponse = await ollama_client.chat(
-                model=model,
-                format = "json",
-                messages = [
-                    {"role": "system", "content": SYSTEM_PROMPT.replace("__json_schema__", json.dumps(AmountsOnly.model_json_schema()))},
-                    {"role": "user", "content": user_prompt}
-                ],
-                options = Options(temperature=0.0)
-            )
-        except Exception as e:
-            logger.error(f"LLM call failed for model {model} on PDF {pdf_path.name}: {e}")
-            continue
-        delay_dict[model] = time.time() - model_start_time
-        logger.info(f"{model} latency: {delay_dict[model]:.4f} seconds.")
-        content = response.message.content.strip()
-        if not content:
-            logger.warning(f"Empty response from model {model}. Skipping.")
-            continue
+    ollama_client = scheduler.client
 
-        # ============== 6. JSON 응답을 pydantic model 리스트에 append ==============
+    # 프롬프트가 같은 이전 응답이 있는 모델은 호출하지 않음. 모델 하나를 추가하면 그 모델만 호출됨.
+    # 모델을 호출하지 않는 경우(reanalyze --revote)는 Ollama에 digest를 묻지 않고 (모델, 프롬프트)의 가장 최근 응답을 사용
+    with span("llm.cache_lookup", offline=not query_models) as llm_cache_span:
+        digests: dict[str,str] = await get_model_digests(ollama_client) if query_models else {}
         try:
-            amounts_only = AmountsOnly.model_validate_json(content)
+            if query_models:
+                cache_keys = {
+                    model: response_cache_key(model, digests[model], SYSTEM_PROMPT_WITH_SCHEMA, user_prompts[model], LLM_OPTIONS)
+                    for model in OLLAMASETTINGS.MODELS if model in digests
+                }
+                cached_responses: dict[str,str] = await asyncio.to_thread(load_cached_responses, cache_keys)
+            else:
+                prompt_keys = {model: prompt_key(SYSTEM_PROMPT_WITH_SCHEMA, user_prompts[model], LLM_OPTIONS) for model in OLLAMASETTINGS.MODELS}
+                latest = await asyncio.to_thread(load_latest_responses, prompt_keys)
+                cached_responses = {model: content for model, (content, _) in latest.items()}
+                logger.debug(f"Cached responses by model digest: { {model: digest[:19] for model, (_, digest) in latest.items()} }")
         except Exception as e:
-            logger.error(f"Invalid JSON from model {model}: {e}")
-            logger.debug(f"Raw response content:\n{content}")
-            continue
-        logger.info(f"\n=== From {model} ===\n{response.message.content}")
-        amounts_list.append(amounts_only)
+            logger.warning(f"LLM response cache lookup failed, querying all models: {e}")
+            cached_responses = {}
+        llm_cache_span.set(cached_models=sorted(cached_responses), cache_hit=len(cached_responses) == len(OLLAMASETTINGS.MODELS))
+    cached_amounts: list[AmountsOnly] = []
+    for model, content in list(cached_responses.items()):
+        try:
+            cached_amounts.append(AmountsOnly.model_validate_json(content))
+        except Exception as e: # 스키마가 바뀐 경우 등은 다시 호출
+            logger.warning(f"Cached response of {model} is no longer valid, querying again: {e}")
+            cached_responses.pop(model)
+    # 이미 메모리에 올라가 있는 모델부터 호출
+    models_to_query = [model for model in OLLAMASETTINGS.MODELS if model not in cached_responses]
+    if query_models:
+        await scheduler.refresh_residency()
+        models_to_query = scheduler.order_by_residency(models_to_query)
+    else:
+        logger.info(f"Voting only with cached LLM responses, skipping {models_to_query}")
+        models_to_query = []
+    if cached_responses:
+        logger.info(f"Reusing cached LLM responses of {list(cached_responses)}, querying {models_to_query}")
+
+    # ============== 6. JSON 응답을 pydantic model 리스트로 수집 ==============
+    if OLLAMASETTINGS.VOTING_MODE == "concurrent":
+        amounts_list: list[AmountsOnly] = await collect_amounts_concurrently(models_to_query, user_prompts, pdf_name, delay_dict, digests, cached_amounts)
+    else: # VOTING_MODE == "sequential"
+        amounts_list: list[AmountsOnly] = await collect_amounts_sequentially(models_to_query, user_prompts, pdf_name, delay_dict, digests, cached_amounts)
+    report_saved_latency(pdf_name, tokens_before, {model: estimate_tokens(user_prompts[model]) for model in OLLAMASETTINGS.MODELS if model in delay_dict})
     
     # ============== 7. LLM 응답 결과로 최종 결과물 산출 (voting) ==============
     voting_time_start = time.time()
-    try:
-        asset_table: AssetTable = llm_vote_amounts(amounts_list=amounts_list,cusip_appearance=cusip_appearance,pdf_hash=pdf_hash)
-    except Exception as e:
-        logger.error(f"Error during LLM voting for PDF {pdf_path.name}: {e}")
-        raise RuntimeError(f"LLM voting failed for {pdf_path.name}") from e
+    with span("voting", votes=len(amounts_list)):
+        try:
+            asset_table: AssetTable = llm_vote_amounts(amounts_list=amounts_list,cusip_appearance=cusip_appearance,pdf_hash=pdf_hash)
+        except Exception as e:
+            logger.error(f"Error during LLM voting for PDF {pdf_name}: {e}")
+            raise RuntimeError(f"LLM voting failed for {pdf_name}") from e
     
     # ============== 8. Record delays and log results ==============
     delay_dict["voting_delay"] = time.time() - voting_time_start
-    delay_dict["e2e_delay"] = time.time() - e2e_start_time
     logger.info(f"LLM voting completed in {delay_dict['voting_delay']:.4f} seconds.")
+    logger.info(f"Completed LLM voting for PDF: {pdf_name}")
+    record_analysis(stablecoin, asset_table, delay_dict, e2e_start_time)
+    return asset_table
+
+def record_analysis(stablecoin: str, asset_table: AssetTable, delay_dict: dict[str,float], e2e_start_time: float):
+    delay_dict["e2e_delay"] = time.time() - e2e_start_time
     logger.info(f"End-to-end processing time: {delay_dict['e2e_delay']:.4f} seconds")
-    logger.info(f"Completed LLM voting for PDF: {pdf_path.name}")
     logger.info(f"\n{asset_table}")
     delay_list = delay_dict_to_list(delay_dict)
     logger.info(f"Delay breakdown: {delay_list}")
 
-    # Comment it out if plotting is not desired
-    plotit_delay(stablecoin, delay_list, len(OLLAMASETTINGS.MODELS))
+    profiling_sink = get_profiling_sink() # 기본값은 아무것도 하지 않으며, PROFILING_SINK="plot"이면 별도 스레드에서 그림 저장
+    profiling_sink.record_delays(stablecoin, delay_dict)
+    profiling_sink.record_asset_table(stablecoin, asset_table)
 
+async def analyze_and_cache(id: str, pdf_hash: str, pdf_path: Path, report_pdf_url: str, stablecoin: str, fingerprint: Optional[str] = None, issuer: Optional[str] = None) -> AssetTable:
+    if not pdf_path.exists(): # URL 캐시로 본문 없이 확인했지만 컨테이너의 PDF 풀에 파일이 없는 경우 다시 받음
+        pdf_hash, pdf_path = await download_and_hash_pdf(report_pdf_url=report_pdf_url, stablecoin=stablecoin, revalidate=False)
+    if LLM_OPTION == "local":
+        asset_table = await analyze_pdf_local_llm(pdf_hash=pdf_hash,pdf_path=pdf_path, stablecoin=stablecoin, issuer=issuer)
+    else: # LLM_OPTION == "api"
+        asset_table = await analyze_pdf_api_call(pdf_hash=pdf_hash,pdf_path=pdf_path, stablecoin=stablecoin, issuer=issuer)
+    # 캐시 인덱스(SQLite)는 WAL 쓰기 잠금을 최대 30초까지 기다리므로 event loop를 막지 않도록 스레드에서 실행
+    await asyncio.to_thread(cache_result, id=id, pdf_hash=pdf_hash, asset_table=asset_table, stablecoin=stablecoin, report_pdf_url=report_pdf_url)
+    if fingerprint is not None:
+        await asyncio.to_thread(record_fingerprint, fingerprint=fingerprint, pdf_hash=pdf_hash)
     return asset_table
 
-async def analyze_pdf(id: str, report_pdf_url: Path, stablecoin: str) -> AssetTable:
-    pdf_hash, pdf_path = download_and_hash_pdf(report_pdf_url=report_pdf_url, stablecoin=stablecoin)
-    try:
-        cached: bool = search_log(pdf_hash=pdf_hash)
-    except FileNotFoundError as e:
-        logger.error(f"Something gone wrong while searching cache directory: {e}")
-        cached = False
-    if not cached: # 이전에 분석한 적이 없는 pdf의 경우
-        if LLM_OPTION == "local":
-            asset_table = await analyze_pdf_local_llm(pdf_hash=pdf_hash,pdf_path=pdf_path, stablecoin=stablecoin)
-        else: # LLM_OPTION == "api"
-            asset_table = await analyze_pdf_api_call(pdf_hash=pdf_hash,pdf_path=pdf_path, stablecoin=stablecoin)
-        cache_result(id=id,pdf_hash=pdf_hash,asset_table=asset_table)
-        return asset_table
-    else: # log에 이미 분석한 적이 있다는 기록이 있는 경우. 새로운 id여도 로그 크기의 폭발적 증가를 막기 위해 새로 기록하지는 않음
+async def get_by_fingerprint(pdf_hash: str, pdf_path: Path) -> tuple[Optional[AssetTable], Optional[str]]:
+    # 파일 해시로 찾지 못한 PDF의 내용 fingerprint를 계산하여, 같은 내용을 분석한 결과가 있으면 alias로 기록하고 재사용.
+    # (AssetTable 또는 None, fingerprint) 반환. fingerprint는 새로 분석한 결과를 기록할 때 사용.
+    with span("pdf.fingerprint") as fingerprint_span:
         try:
-            asset_table = get_AssetTable_from_cache(pdf_hash=pdf_hash)
+            fingerprint: Optional[str] = await run_in_extraction_pool(content_fingerprint, pdf_path)
+            canonical_hash = await asyncio.to_thread(find_by_fingerprint, fingerprint) if fingerprint else None
+        except Exception as e: # fingerprint를 구하지 못하면 기존처럼 전체 분석
+            logger.warning(f"Content fingerprint lookup failed for {pdf_path.name}: {e}")
+            return None, None
+        fingerprint_span.set(cache_hit=canonical_hash is not None)
+        if canonical_hash is None or canonical_hash == pdf_hash:
+            return None, fingerprint
+        try:
+            asset_table = await asyncio.to_thread(get_AssetTable_from_cache, pdf_hash=canonical_hash)
         except FileNotFoundError as e:
             logger.error(f"There is not cached file. {e}")
-            if LLM_OPTION == "local":
-                asset_table = await analyze_pdf_local_llm(pdf_hash=pdf_hash,pdf_path=pdf_path, stablecoin=stablecoin)
-            else: # LLM_OPTION == "api"
-                asset_table = await analyze_pdf_api_call(pdf_hash=pdf_hash,pdf_path=pdf_path, stablecoin=stablecoin)
-            cache_result(id=id,pdf_hash=pdf_hash,asset_table=asset_table)
-        return asset_table
\ No newline at end of file
+            return None, fingerprint
+        await asyncio.to_thread(record_alias, pdf_hash=pdf_hash, canonical_hash=canonical_hash, fingerprint=fingerprint)
+    return asset_table, fingerprint
+
+async def get_or_analyze(id: str, pdf_hash: str, pdf_path: Path, report_pdf_url: str, stablecoin: str, issuer: Optional[str] = None) -> AssetTable:
+    with span("pdf.cache_lookup", pdf_hash=pdf_hash) as lookup_span:
+        try:
+            cached: bool = await asyncio.to_thread(search_cache, pdf_hash=pdf_hash) # SQLite 조회는 잠금 대기가 있을 수 있으므로 스레드에서 실행
+        except sqlite3.Error as e:
+            logger.error(f"Something gone wrong while searching cache index: {e}")
+            cached = False
+        asset_table = None
+        if cached: # 캐시 인덱스에 이미 분석한 적이 있다는 기록이 있는 경우. 새로운 id여도 새로 기록하지는 않음
+            try:
+                asset_table = await asyncio.to_thread(get_AssetTable_from_cache, pdf_hash=pdf_hash)
+            except FileNotFoundError as e:
+                logger.error(f"There is not cached file. {e}")
+        lookup_span.set(cache_hit=asset_table is not None)
+    fingerprint = None
+    if asset_table is None and CACHE.CONTENT_FINGERPRINT and pdf_path.exists(): # 파일은 다르지만 내용이 같은 보고서를 분석한 적이 있는 경우
+        asset_table, fingerprint = await get_by_fingerprint(pdf_hash=pdf_hash, pdf_path=pdf_path)
+    if asset_table is None: # 이전에 분석한 적이 없거나 캐시된 결과를 읽지 못한 pdf의 경우
+        asset_table = await analyze_and_cache(id=id, pdf_hash=pdf_hash, pdf_path=pdf_path, report_pdf_url=report_pdf_url, stablecoin=stablecoin, fingerprint=fingerprint, issuer=issuer)
+    return asset_table
+
+async def download_and_analyze(id: str, report_pdf_url: str, stablecoin: str, issuer: Optional[str] = None) -> AssetTable:
+    pdf_hash, pdf_path = await download_and_hash_pdf(report_pdf_url=report_pdf_url, stablecoin=stablecoin)
+    # 분석이 끝날 때까지 cache_manager가 이 PDF와 AssetTable을 삭제하지 않도록 잡아둠
+    with pinned(pdf_hash):
+        touch_pdf(pdf_path)
+        # URL이 달라도 내용이 같은 PDF라면 pdf_hash 기준으로 다시 한 번 병합
+        return await _flight_by_hash.do(
+            f"{stablecoin}:{pdf_hash}",
+            lambda: get_or_analyze(id=id, pdf_hash=pdf_hash, pdf_path=pdf_path, report_pdf_url=report_pdf_url, stablecoin=stablecoin, issuer=issuer),
+        )
+
+# 같은 보고서에 대한 동시 analyze_pdf 호출은 진행 중인 분석 하나를 기다려 같은 AssetTable을 공유
+# 먼저 URL로 병합하고, 다운로드 이후에는 pdf_hash로 병합
+_flight_by_url = SingleFlight("analyze_pdf.url")
+_flight_by_hash = SingleFlight("analyze_pdf.pdf_hash")
+
+async def analyze_pdf(id: str, report_pdf_url: Path, stablecoin: str, issuer: Optional[str] = None) -> AssetTable:
+    # issuer(Provenance.report_issuer)가 있으면 발행사별 layout template를 사용하고 학습함
+    return await _flight_by_url.do(
+        f"{stablecoin}:{report_pdf_url}",
+        lambda: download_and_analyze(id=id, report_pdf_url=report_pdf_url, stablecoin=stablecoin, issuer=issuer),
+    )
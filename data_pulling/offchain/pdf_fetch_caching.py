@@ -1,89 +1,208 @@
 # Download PDF via Given URL
-from common.settings import MOUNTED_DIR
+from common.settings import MOUNTED_DIR, CACHE
 from common.schema import AssetTable
-import os, requests, logging
-from datetime import datetime
+from common.tracing import span
+from data_pulling.offchain import cache_index
+import httpx, json, os, logging, time
 from pathlib import Path
 from hashlib import sha256
-from urllib.parse import urlparse
+from uuid import uuid4
 
 BASE_DIR = Path(__file__).resolve().parent
 PDF_POOL_DIRECTORY = BASE_DIR / "pdf"
 PDF_POOL_DIRECTORY.mkdir(parents=True, exist_ok=True)
+DOWNLOAD_TIMEOUT = httpx.Timeout(120, connect=10)
 
 logger = logging.getLogger("RunFromRun.Analyze.Offchain.PDF_Fetch")
 logger.setLevel(logging.DEBUG)
 
-def download_and_hash_pdf(report_pdf_url: str, stablecoin: str) -> tuple[str,Path]: 
-    # PDF_POOL_DIRECTORY에 pdf 다운받고, 다운받은 pdf path 반환
-    # PDF는 마운트 디렉토리에 저장하지 않고, 컨테이너에 저장 => 마운트 디렉토리에는 로그 파일과 결과 파일만 저장.
+# URL 메타데이터 캐시: report_pdf_url별로 ETag, Last-Modified, Content-Length, pdf_hash를 마운트 디렉토리에 기록.
+# 같은 URL을 다시 분석할 때 서버가 304(또는 같은 크기)를 응답하면 본문을 받지 않고 곧바로 AssetTable 캐시로 넘어감.
+URL_META_DIRECTORY = MOUNTED_DIR / "url_meta"
+
+def _url_meta_path(report_pdf_url: str) -> Path:
+    return URL_META_DIRECTORY / f"{sha256(report_pdf_url.encode('utf-8')).hexdigest()}.json"
+
+def load_url_meta(report_pdf_url: str) -> dict | None:
+    meta_file = _url_meta_path(report_pdf_url)
+    if not meta_file.exists():
+        return None
+    try:
+        return json.loads(meta_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring broken url metadata {meta_file.name}: {e}")
+        return None
+
+def save_url_meta(report_pdf_url: str, headers: httpx.Headers, pdf_hash: str, content_length: int):
+    meta = {
+        "url": report_pdf_url,
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "content_length": content_length,
+        "pdf_hash": pdf_hash,
+    }
+    meta_file = _url_meta_path(report_pdf_url)
+    meta_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = meta_file.with_suffix(f".{uuid4().hex}.tmp")
+    tmp_file.write_text(json.dumps(meta), encoding="utf-8")
+    os.replace(tmp_file, meta_file)
+
+def _conditional_headers(meta: dict | None) -> dict:
+    headers = {}
+    if meta is None:
+        return headers
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+async def _same_size_as_cached(client: httpx.AsyncClient, report_pdf_url: str, meta: dict) -> bool:
+    # ETag/Last-Modified를 주지 않는 서버는 HEAD 요청의 Content-Length로만 비교
     try:
-        resp = requests.get(report_pdf_url, stream=True)
-        resp.raise_for_status()
+        resp = await client.head(report_pdf_url)
     except Exception as e:
-        logger.error(f"Exception occured while downloading pdf: {e}")
-        raise RuntimeError(f"Failed to download pdf via requests: {e}")
-        
-    content_type = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
-    if content_type not in ("application/pdf", "application/octet-stream"):
-        raise ValueError(f"URL is not for valid PDF file: Content-Type={content_type!r}")
-    
-    file_name = stablecoin.upper() + "-" + str(datetime.now()).split()[0] + ".pdf"
-    pdf_path:Path = PDF_POOL_DIRECTORY / file_name
-
-    with open(pdf_path, "wb") as f:
-        for chunk in resp.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
-    
-    pdf_bytes:bytes = Path(pdf_path).read_bytes()
-    pdf_hash:str = sha256(pdf_bytes).hexdigest()
-
-    return (pdf_hash, pdf_path)
-
-def cache_result(id:str, pdf_hash:str, asset_table:AssetTable):
-    # Log file에 hash-id 기록
-    # 현재 구현으로는 id는 필요 없으나, 이후 구현을 고려하여 id도 추가
-    # 예를 들어, 이후 데이터 양이 많아져 DB 도입하는 경우 id 필요할 가능성 높아짐
-    log_file:Path = MOUNTED_DIR / "pdfHash_id.log"
-    log_line: str = pdf_hash + "_" + id + "\n"
-    with open(log_file, "a", encoding="utf-8") as f:
-        f.write(log_line)
-
-    # asset_tables 디렉토리에 (hash).json으로 asset_table 기록
-    asset_table_file:Path = MOUNTED_DIR / "asset_tables" / f"{pdf_hash}.json"
-    asset_table_json_str: str = asset_table.model_dump_json()
-    with open(asset_table_file, "w", encoding="utf-8") as f:
-        f.write(asset_table_json_str)
-    
-    logger.info(
-        f"Cached AssetTable for pdf_hash={pdf_hash}, id={id} "
-        f"to {asset_table_file} and logged to {log_file}" 
-    )
-
-def search_log(pdf_hash: str) -> bool:
-    # log file에 pdf_hash가 기록되어 있으면 True 반환
-    log_file:Path = MOUNTED_DIR / "pdfHash_id.log"
-    if not log_file.exists():
+        logger.debug(f"HEAD request failed, falling back to full download: {e}")
         return False
-    
-    with log_file.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            hash_part = line.split("_",1)[0]
-            if hash_part == pdf_hash:
-                return True
-    return False
+    if resp.status_code != 200 or resp.headers.get("Content-Length") is None:
+        return False
+    try:
+        content_length = int(resp.headers["Content-Length"])
+    except ValueError: # 잘못된 Content-Length는 비교할 수 없으므로 전체 다운로드
+        logger.debug(f"Malformed Content-Length {resp.headers['Content-Length']!r}, falling back to full download")
+        return False
+    return content_length == meta.get("content_length")
+
+async def download_and_hash_pdf(report_pdf_url: str, stablecoin: str, revalidate: bool = True) -> tuple[str,Path]: 
+    # PDF_POOL_DIRECTORY에 pdf 다운받고, 다운받은 pdf path 반환
+    # PDF는 마운트 디렉토리에 저장하지 않고, 컨테이너에 저장 => 마운트 디렉토리에는 캐시 인덱스와 결과만 저장.
+    # 다운로드 중인 청크로 sha256을 바로 계산하고, 완료되면 pdf/<sha256>.pdf 로 원자적으로 이동 (content-addressed store).
+    # 같은 코인에 대한 동시 요청이 서로의 파일을 덮어쓰지 않으며, 같은 내용의 PDF는 한 번만 저장됨.
+    # 이전에 받은 URL이 변경되지 않았다면(304 또는 크기 일치) 본문 없이 캐시된 pdf_hash를 반환.
+    # 이 경우 컨테이너 재시작 등으로 반환된 pdf_path가 없을 수 있으므로, 파일이 필요한 쪽에서 revalidate=False로 다시 받아야 함.
+    # 해시는 다운로드 중에 청크 단위로 계산하므로 별도 단계가 아니라 pdf.download span의 hash_seconds로 기록
+    with span("pdf.download", revalidate=revalidate, cache_hit=False) as download_span:
+        meta = load_url_meta(report_pdf_url) if (revalidate and CACHE.URL_REVALIDATE) else None
+        tmp_path: Path = PDF_POOL_DIRECTORY / f".{uuid4().hex}.part"
+        pdf_digest = sha256()
+        content_length = 0
+        hash_seconds = 0.0
+        try:
+            async with httpx.AsyncClient(timeout=DOWNLOAD_TIMEOUT, follow_redirects=True) as client:
+                if meta is not None and not _conditional_headers(meta) and CACHE.URL_SIZE_MATCH:
+                    if await _same_size_as_cached(client, report_pdf_url, meta):
+                        logger.info(f"{stablecoin} report unchanged (same Content-Length), skipping download")
+                        download_span.set(cache_hit=True, revalidated_by="content_length")
+                        return (meta["pdf_hash"], PDF_POOL_DIRECTORY / f"{meta['pdf_hash']}.pdf")
+
+                async with client.stream("GET", report_pdf_url, headers=_conditional_headers(meta)) as resp:
+                    if resp.status_code == 304:
+                        logger.info(f"{stablecoin} report not modified (304), skipping download")
+                        download_span.set(cache_hit=True, revalidated_by="304")
+                        return (meta["pdf_hash"], PDF_POOL_DIRECTORY / f"{meta['pdf_hash']}.pdf")
+                    try:
+                        resp.raise_for_status()
+                    except Exception as e:
+                        logger.error(f"Exception occured while downloading pdf: {e}")
+                        raise RuntimeError(f"Failed to download pdf via httpx: {e}")
+
+                    content_type = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+                    if content_type not in ("application/pdf", "application/octet-stream"):
+                        raise ValueError(f"URL is not for valid PDF file: Content-Type={content_type!r}")
+
+                    with open(tmp_path, "wb") as f:
+                        async for chunk in resp.aiter_bytes(chunk_size=65536):
+                            hash_start = time.perf_counter()
+                            pdf_digest.update(chunk)
+                            hash_seconds += time.perf_counter() - hash_start
+                            content_length += len(chunk)
+                            f.write(chunk)
+                    response_headers = resp.headers
+        except (RuntimeError, ValueError):
+            tmp_path.unlink(missing_ok=True)
+            raise
+        except Exception as e:
+            tmp_path.unlink(missing_ok=True)
+            logger.error(f"Exception occured while downloading pdf: {e}")
+            raise RuntimeError(f"Failed to download pdf via httpx: {e}")
+
+        pdf_hash: str = pdf_digest.hexdigest()
+        download_span.set(bytes=content_length, hash_seconds=hash_seconds)
+        pdf_path: Path = PDF_POOL_DIRECTORY / f"{pdf_hash}.pdf"
+        if pdf_path.exists(): # 이미 같은 내용의 PDF가 저장되어 있으면 새로 받은 파일은 버림
+            tmp_path.unlink(missing_ok=True)
+        else:
+            os.replace(tmp_path, pdf_path)
+        logger.debug(f"Downloaded {stablecoin} report to {pdf_path.name}")
+        try:
+            save_url_meta(report_pdf_url, response_headers, pdf_hash, content_length)
+        except OSError as e: # 메타데이터 기록 실패는 다음 요청에서 다시 받으면 되므로 분석은 계속 진행
+            logger.warning(f"Failed to record url metadata: {e}")
+
+        return (pdf_hash, pdf_path)
+
+def touch_pdf(pdf_path: Path):
+    # PDF 풀의 마지막 사용 시각은 파일 mtime으로 관리 (cache_manager가 오래된 파일부터 삭제)
+    try:
+        os.utime(pdf_path)
+    except FileNotFoundError:
+        pass
+
+def cache_result(id:str, pdf_hash:str, asset_table:AssetTable, stablecoin: str | None = None, report_pdf_url: str | None = None):
+    # 캐시 인덱스에 pdf_hash → (id, coin, url, 분석 시각, AssetTable JSON)을 하나의 트랜잭션으로 기록
+    # 같은 pdf_hash를 다시 분석한 경우(캐시 파일 손실 등)에는 최신 결과로 교체
+    with cache_index.connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO asset_tables (pdf_hash, id, coin, url, analysis_time, asset_table_json, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (pdf_hash, id, stablecoin, report_pdf_url, asset_table.pdf_analysis_time.isoformat(), asset_table.model_dump_json(), time.time()),
+        )
+    logger.info(f"Cached AssetTable for pdf_hash={pdf_hash}, id={id} to {cache_index.INDEX_DB_PATH}")
+
+# 내용 fingerprint가 같아 기존 분석 결과를 재사용한 PDF는 pdf_aliases에 (pdf_hash → 처음 분석한 pdf_hash)로 기록되며,
+# 이후 같은 pdf_hash 요청은 fingerprint 계산 없이 바로 기존 결과로 연결됨
+_RESOLVE_ALIAS = "COALESCE((SELECT canonical_hash FROM pdf_aliases WHERE pdf_hash = :pdf_hash), :pdf_hash)"
+
+def search_cache(pdf_hash: str) -> bool:
+    # 캐시 인덱스에 pdf_hash(또는 그 alias의 원본)가 기록되어 있으면 True 반환
+    with cache_index.connect() as conn:
+        row = conn.execute(f"SELECT 1 FROM asset_tables WHERE pdf_hash = {_RESOLVE_ALIAS}", {"pdf_hash": pdf_hash}).fetchone()
+    return row is not None
 
 def get_AssetTable_from_cache(pdf_hash: str) -> AssetTable:
-    asset_table_file:Path = MOUNTED_DIR / "asset_tables" / f"{pdf_hash}.json"
-    if not asset_table_file.exists():
+    with cache_index.connect() as conn:
+        row = conn.execute(f"SELECT asset_table_json FROM asset_tables WHERE pdf_hash = {_RESOLVE_ALIAS}", {"pdf_hash": pdf_hash}).fetchone()
+        if row is not None: # cache_manager가 오래 사용되지 않은 결과부터 삭제할 수 있도록 마지막 사용 시각 기록
+            conn.execute(f"UPDATE asset_tables SET last_access = :now WHERE pdf_hash = {_RESOLVE_ALIAS}", {"pdf_hash": pdf_hash, "now": time.time()})
+    if row is None:
         raise FileNotFoundError(f"Cached AssetTable not found for pdf_hash={pdf_hash}")
-    
-    json_str = asset_table_file.read_text(encoding="utf-8")
-    asset_table = AssetTable.model_validate_json(json_str)
+    asset_table = AssetTable.model_validate_json(row[0])
+
+    logger.info(f"Loaded AssetTable from cache for pdf_hash={pdf_hash}")
+    return asset_table
+
+def find_by_fingerprint(fingerprint: str) -> str | None:
+    # 내용 fingerprint가 같고 분석 결과가 남아 있는 PDF의 pdf_hash
+    with cache_index.connect() as conn:
+        row = conn.execute(
+            "SELECT f.pdf_hash FROM content_fingerprints f JOIN asset_tables a ON a.pdf_hash = f.pdf_hash WHERE f.fingerprint = ?",
+            (fingerprint,),
+        ).fetchone()
+    return row[0] if row else None
+
+def record_fingerprint(fingerprint: str, pdf_hash: str):
+    # 처음 분석한 PDF를 기준으로 유지. 결과가 삭제된 경우에만 새로 분석한 PDF로 교체.
+    with cache_index.connect() as conn:
+        conn.execute(
+            """INSERT INTO content_fingerprints (fingerprint, pdf_hash, created_at) VALUES (?, ?, ?)
+               ON CONFLICT(fingerprint) DO UPDATE SET pdf_hash = excluded.pdf_hash, created_at = excluded.created_at
+               WHERE NOT EXISTS (SELECT 1 FROM asset_tables WHERE pdf_hash = content_fingerprints.pdf_hash)""",
+            (fingerprint, pdf_hash, time.time()),
+        )
 
-    logger.info(f"Loaded AssetTable from cache for pdf_hash={pdf_hash} ({asset_table_file})")
-    return asset_table
\ No newline at end of file
+def record_alias(pdf_hash: str, canonical_hash: str, fingerprint: str):
+    with cache_index.connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO pdf_aliases (pdf_hash, canonical_hash, fingerprint, created_at) VALUES (?, ?, ?, ?)",
+            (pdf_hash, canonical_hash, fingerprint, time.time()),
+        )
+    logger.info(f"Recorded pdf_hash={pdf_hash} as an alias of pdf_hash={canonical_hash} (same content fingerprint)")
@@ -0,0 +1,125 @@
+# LLM 호출 전 프롬프트 압축 단계.
+# 기존에는 필터링을 통과한 모든 표를 그대로 USER_PROMPT_TEMPLATE에 넣었기 때문에 보고서가 클수록 프롬프트가 길어지고
+# 모델의 prefill 시간이 함께 늘어남. 투표에 필요한 것은 준비금 구성 표의 금액이므로,
+# 1) 같은 표는 한 번만 넣고 2) 숫자가 없는 행과 markdown 정렬용 공백을 제거하고 3) 관련도가 높은 표부터 모델별 토큰 예산 안에서만 넣음.
+from common import metrics
+from common.settings import OLLAMASETTINGS
+from data_pulling.offchain.dataframe_process import RESERVE_KEYWORDS, TOTAL_ROW
+from ollama import ChatResponse
+import logging, math, re
+import pandas as pd
+
+logger = logging.getLogger("RunFromRun.Analyze.Offchain.Prompt_Compaction")
+logger.setLevel(logging.DEBUG)
+
+CHARS_PER_TOKEN = 4 # 모델마다 tokenizer가 다르므로 영문 기준 근사치 사용
+has_digit = re.compile(r"[0-9]")
+# 숫자가 없어도 남겨야 하는 행: 단위 표기("in millions" 등)와 준비금 항목명(하위 행의 금액이 어떤 자산인지 알려주는 소제목)
+keep_without_digit = re.compile(
+    r"in (?:millions|thousands|billions)|usd|" + "|".join(re.escape(keyword) for keyword in RESERVE_KEYWORDS),
+    re.IGNORECASE,
+)
+
+padding = re.compile(r" {2,}")
+ruler = re.compile(r"(?<=[|:])-{4,}(?=[|:])")
+
+def squeeze_markdown(markdown_table: str) -> str:
+    # to_markdown은 열 너비를 맞추기 위해 공백과 '-'를 채우는데, LLM에는 의미가 없고 긴 셀이 있는 표에서는 토큰의 대부분을 차지함
+    return ruler.sub("---", padding.sub(" ", markdown_table))
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def token_budget(model: str) -> int:
+    return OLLAMASETTINGS.TOKEN_BUDGETS.get(model, OLLAMASETTINGS.TOKEN_BUDGET)
+
+def drop_non_numeric_rows(df: pd.DataFrame) -> pd.DataFrame:
+    # 첫 행(열 제목)은 항상 유지
+    if df.shape[0] <= 1:
+        return df
+    row_text = df.fillna("").astype(str).agg(" ".join, axis=1)
+    keep = row_text.str.contains(has_digit) | row_text.str.contains(keep_without_digit)
+    keep.iloc[0] = True
+    return df[keep].reset_index(drop=True)
+
+def compact_tables(tables: list[pd.DataFrame]) -> list[pd.DataFrame]:
+    # 모델과 무관한 압축: 숫자 없는 행 제거, 중복 표 제거, 표당 행 수 제한(MAX_ROWS_PER_TABLE)
+    compacted: list[pd.DataFrame] = []
+    seen: set[tuple] = set()
+    for df in tables:
+        df = drop_non_numeric_rows(df).head(OLLAMASETTINGS.MAX_ROWS_PER_TABLE)
+        # 같은 표가 여러 페이지에 반복되거나 다른 방식으로 두 번 추출된 경우, 공백만 다른 경우도 같은 표로 간주
+        key = tuple(" ".join(str(cell).split()) for cell in df.fillna("").to_numpy().ravel())
+        if key in seen:
+            continue
+        seen.add(key)
+        compacted.append(df)
+    return compacted
+
+def markdown_rows(markdown_table: str) -> list[list[str]]:
+    # to_markdown(index=False) 결과에서 열 번호 머리글과 구분선을 제외한 행의 셀 목록
+    return [[cell.strip() for cell in line.strip().strip("|").split("|")] for line in markdown_table.splitlines()[2:]]
+
+def has_total_row(markdown_table: str) -> bool:
+    # 첫 열에 "total"이 있고 같은 행에 숫자가 있는 행. 합계 행이 있는 표는 보고서의 준비금 구성 표일 가능성이 가장 높음.
+    return any(row and TOTAL_ROW.search(row[0]) and any(has_digit.search(cell) for cell in row[1:]) for row in markdown_rows(markdown_table))
+
+def table_relevance(markdown_table: str) -> int:
+    # 표 단위 관련도: 준비금 키워드 등장 횟수 + 숫자 셀 수.
+    # 페이지 점수(score_page)와 달리 금액 개수 기준이 없으므로 "in millions" 단위의 작은 표도 0점이 되지 않음.
+    lowered = markdown_table.lower()
+    keyword_hits = sum(lowered.count(keyword) for keyword in RESERVE_KEYWORDS)
+    numeric_cells = sum(1 for row in markdown_rows(markdown_table) for cell in row if has_digit.search(cell))
+    return keyword_hits + numeric_cells
+
+def select_within_budget(markdown_tables: list[str], budget: int) -> list[str]:
+    # 합계 행이 있는 표는 예산과 관계없이 항상 포함하고, 나머지는 관련도(table_relevance) 순으로 남은 예산 안에 들어가는 표만 선택.
+    # 합계 행이 있는 표가 없으면 가장 관련도가 높은 표는 예산을 넘더라도 포함하고, 선택된 표는 원래 순서대로 반환.
+    ranked = sorted(range(len(markdown_tables)), key=lambda i: table_relevance(markdown_tables[i]), reverse=True)
+    selected: list[int] = [i for i in ranked if has_total_row(markdown_tables[i])]
+    used = sum(estimate_tokens(markdown_tables[i]) for i in selected)
+    for i in ranked:
+        if i in selected:
+            continue
+        tokens = estimate_tokens(markdown_tables[i])
+        if selected and used + tokens > budget:
+            continue
+        selected.append(i)
+        used += tokens
+    return [markdown_tables[i] for i in sorted(selected)]
+
+# ============== 절약한 prefill 시간 추정 ==============
+# Ollama 응답의 prompt_eval_count / prompt_eval_duration으로 모델별 prefill 속도(tokens/s)를 기록하고,
+# 제거한 토큰 수를 이 속도로 나누어 절약한 시간을 추정.
+_prefill_rate: dict[str, float] = {}
+_stats = {"prompts": 0, "tokens_before": 0, "tokens_after": 0, "saved_seconds": 0.0}
+
+def record_prefill_rate(model: str, response: ChatResponse):
+    if response.prompt_eval_count and response.prompt_eval_duration:
+        _prefill_rate[model] = response.prompt_eval_count / (response.prompt_eval_duration / 1e9)
+
+def compaction_stats() -> dict:
+    return _stats | {
+        "removed_ratio": metrics.ratio(_stats["tokens_before"] - _stats["tokens_after"], _stats["tokens_before"]),
+        "prefill_tokens_per_second": dict(_prefill_rate),
+    }
+
+metrics.register_collector("prompt_compaction", compaction_stats)
+
+def report_saved_latency(pdf_name: str, tokens_before: int, tokens_after: dict[str, int]) -> float:
+    # 모델별 제거 토큰 수와 절약한 prefill 시간을 기록하고, 모든 모델에서 절약한 시간의 합을 반환
+    total_saved = 0.0
+    for model, after in tokens_after.items():
+        removed = tokens_before - after
+        rate = _prefill_rate.get(model)
+        saved = removed / rate if rate else 0.0
+        total_saved += saved
+        _stats["prompts"] += 1
+        _stats["tokens_before"] += tokens_before
+        _stats["tokens_after"] += after
+        _stats["saved_seconds"] += saved
+        logger.info(
+            f"{pdf_name} / {model}: prompt compacted {tokens_before} -> {after} tokens (removed {removed}), "
+            + (f"saved about {saved:.4f} seconds of prefill." if rate else "prefill rate unknown yet.")
+        )
+    return total_saved
@@ -0,0 +1,66 @@
+# 저장된 표 artifact로 LLM 단계만 다시 실행하는 CLI.
+# 프롬프트, 모델 목록, 투표 방식이 바뀌었을 때 PDF 다운로드, Camelot 추출 없이 캐시된 모든 보고서의 AssetTable을 다시 계산하여 캐시 인덱스를 갱신함.
+# - --revote: 모델을 호출하지 않고 LLM 응답 캐시에 있는 응답만으로 다시 투표 (투표 로직이 바뀐 경우). Ollama와 OpenFIGI 없이 동작
+# - --reprompt: 프롬프트를 다시 만들어 응답 캐시에 없는 모델만 호출 (프롬프트/모델이 바뀐 경우)
+# 사용 예: python -m data_pulling.offchain.reanalyze --revote --coin USDC
+from common.schema import AssetTable
+from common.tracing import trace
+from data_pulling.offchain import cache_index
+from data_pulling.offchain.dataframe_process import list_table_artifacts, read_table_artifact
+from data_pulling.offchain.pdf_analysis import analyze_tables
+from data_pulling.offchain.pdf_fetch_caching import cache_result
+from typing import Optional
+import argparse, asyncio, logging, sys, time
+
+logger = logging.getLogger("RunFromRun.Analyze.Offchain.Reanalyze")
+logger.setLevel(logging.DEBUG)
+
+def _indexed_report(pdf_hash: str) -> Optional[tuple[str, Optional[str], Optional[str], AssetTable]]:
+    # 캐시 인덱스에 기록된 (id, coin, url, 이전 AssetTable). 분석 도중 실패하여 결과가 없는 보고서는 None.
+    with cache_index.connect() as conn:
+        row = conn.execute("SELECT id, coin, url, asset_table_json FROM asset_tables WHERE pdf_hash = ?", (pdf_hash,)).fetchone()
+    if row is None:
+        return None
+    return row[0], row[1], row[2], AssetTable.model_validate_json(row[3])
+
+async def reanalyze(query_models: bool, coin: Optional[str] = None) -> dict[str, int]:
+    result = {"reanalyzed": 0, "skipped": 0, "failed": 0}
+    seen: set[str] = set()
+    for pdf_hash, config_hash, artifact_file in list_table_artifacts():
+        if pdf_hash in seen: # 추출 설정이 바뀌어 artifact가 여러 개인 경우 가장 최근 것만 사용
+            continue
+        seen.add(pdf_hash)
+        report = _indexed_report(pdf_hash)
+        if report is None or (coin is not None and report[1] != coin):
+            result["skipped"] += 1
+            continue
+        id, stablecoin, report_pdf_url, previous = report
+        start = time.time()
+        try:
+            with trace("reanalyze", id=id, coin=stablecoin, pdf_hash=pdf_hash, config_hash=config_hash):
+                tables = read_table_artifact(artifact_file)
+                asset_table = await analyze_tables(tables, pdf_hash, f"{pdf_hash}.pdf", stablecoin, {}, start, query_models=query_models)
+        except Exception as e:
+            logger.error(f"Reanalysis failed for {stablecoin} ({pdf_hash}): {e}")
+            result["failed"] += 1
+            continue
+        cache_result(id=id, pdf_hash=pdf_hash, asset_table=asset_table, stablecoin=stablecoin, report_pdf_url=report_pdf_url)
+        result["reanalyzed"] += 1
+        logger.info(f"{stablecoin} ({pdf_hash[:12]}): total {previous.total.amount} -> {asset_table.total.amount} in {time.time() - start:.3f} seconds")
+    return result
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Re-run the LLM stage over all cached table artifacts without touching any PDF.")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--revote", action="store_true", help="vote again with cached LLM responses only")
+    mode.add_argument("--reprompt", action="store_true", help="rebuild prompts and query models missing from the response cache")
+    parser.add_argument("--coin", help="only reanalyze reports of this stablecoin")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", stream=sys.stdout)
+    result = asyncio.run(reanalyze(query_models=args.reprompt, coin=args.coin))
+    logger.info(f"Reanalysis finished: {result}")
+    return 1 if result["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
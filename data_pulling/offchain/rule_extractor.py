@@ -0,0 +1,188 @@
+# 규칙 기반 금액 추출 (LLM 앙상블 이전의 fast path).
+# 대부분의 발행사 보고서는 준비금 행 이름이 정형화되어 있음("U.S. Treasury Bills", "Money Market Funds", "Cash & Bank Deposits" 등).
+# 행 이름을 미리 컴파일한 문구 목록으로 AmountsOnly 필드에 대응시키고, 금액 합이 보고서의 합계(total) 행과 허용 오차 안에서 맞으면
+# 그 결과를 그대로 사용하여 Ollama 호출과 llm_vote_amounts를 건너뜀. 합계가 맞지 않는 보고서만 기존 LLM 투표로 분석.
+# 문구 목록은 SYSTEM_PROMPT의 항목별 "Source Terms"를 따름.
+from common.schema import AmountsOnly
+from common.settings import EXTRACTION
+from dataclasses import dataclass
+from typing import Optional
+import logging, re
+import pandas as pd
+
+logger = logging.getLogger("RunFromRun.Analyze.Offchain.Rule_Extractor")
+logger.setLevel(logging.DEBUG)
+
+# (필드, 문구) 순서대로 먼저 맞는 필드를 사용. "Non-U.S. Treasury Bills", "U.S. Treasury Repurchase Agreements"처럼
+# 다른 필드의 문구를 포함하는 행이 있으므로 더 구체적인 필드를 앞에 둠.
+FIELD_PHRASES: list[tuple[str, tuple[str, ...]]] = [
+    ("non_us_treasury_bills", (r"non[- ]?u\.?s\.? treasury", r"sovereign bills?")),
+    ("repo_overnight_term", (r"repurchase agreements?", r"reverse repos?\b", r"\brepos?\b")),
+    ("custodial_concentrated_asset", (r"first digital trust",)),
+    ("us_treasury_other_notes_bonds", (r"treasury notes?", r"treasury bonds?", r"\btips\b")),
+    ("us_treasury_bills", (r"treasury bills?", r"\bt-?bills?\b", r"ust bills?", r"treasury securities", r"obligations of u\.?s\.? treasury")),
+    ("gov_mmf", (r"money market funds?", r"\bmmfs?\b", r"government cash reserves", r"cash held in circle reserve fund")),
+    ("other_deposits", (r"fixed deposits?", r"time deposits?", r"term deposits?")),
+    ("corporate_bonds", (r"corporate bonds?", r"commercial paper")),
+    ("precious_metals", (r"precious metals?", r"\bgold\b", r"bullion")),
+    ("digital_assets", (r"bitcoin", r"digital assets?", r"\bether\b", r"crypto")),
+    ("secured_loans", (r"secured loans?", r"collateralized lending")),
+    ("other_investments", (r"other investments?", r"private funds?", r"equity investments?")),
+    ("cash_bank_deposits", (r"\bcash\b", r"bank deposits?", r"u\.?s\.? dollars held")),
+]
+FIELD_MATCHERS: list[tuple[str, re.Pattern]] = [
+    (field, re.compile("|".join(phrases), re.IGNORECASE)) for field, phrases in FIELD_PHRASES
+]
+TOTAL_LABEL = re.compile(r"^\s*(?:sub)?total\b", re.IGNORECASE)
+SUBTOTAL_LABEL = re.compile(r"^\s*sub-?total\b", re.IGNORECASE)
+# 발행량 행은 합계처럼 보여도 자산이 아님 ("Total TrueUSD tokens issued")
+ISSUANCE_LABEL = re.compile(r"issued|issuance|outstanding|circulation|minted|tokens?\b", re.IGNORECASE)
+
+# 금액 셀: "$ 1,234", "US$1,234.56", "(124,294,056)", "-" 등. 날짜, 퍼센트, CUSIP은 None.
+MONEY = re.compile(r"^(?P<open>\()?\s*(?P<minus>-)?\s*(?:US\$|USD|\$)?\s*(?P<number>\d{1,3}(?:,\d{3})+|\d+)(?P<decimal>\.\d+)?\s*(?P<close>\))?$", re.IGNORECASE)
+DASHES = {"-", "–", "—", "−"}
+SCALE_HEADER = re.compile(r"in\s+(?:usd\s+|us\$\s*|\$\s*)?(thousands|millions|billions)|\$\s*'?000s?\b", re.IGNORECASE)
+SCALES = {"thousands": 1e3, "millions": 1e6, "billions": 1e9}
+
+# 보고 기준일: "September 30, 2025", "Sept. 30 2025", "14 September 2025", "9/30/2025", "2025-09-30".
+# 셀 너비 때문에 연도가 잘린 경우("AS OF SEPTEMBER 18, 20")는 연도 없이 월/일만 사용.
+MONTHS = ("january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december")
+_MONTH = r"(?P<month>" + "|".join(MONTHS + tuple(month[:3] for month in MONTHS) + ("sept",)) + r")\b\.?"
+DATE_PATTERNS = [
+    re.compile(r"\b" + _MONTH + r"\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?\b,?\s*(?P<year>\d{4})?", re.IGNORECASE),
+    re.compile(r"\b(?P<day>\d{1,2})(?:st|nd|rd|th)?\s+" + _MONTH + r",?\s*(?P<year>\d{4})?", re.IGNORECASE),
+    re.compile(r"\b(?P<month>\d{1,2})/(?P<day>\d{1,2})/(?P<year>\d{4})\b"),
+    re.compile(r"\b(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})\b"),
+]
+AS_OF_LABEL = re.compile(r"\bas\s+(?:of|at)\b", re.IGNORECASE)
+
+def parse_money(cell) -> Optional[float]:
+    # 금액이 아닌 셀은 None. 괄호는 음수, 대시만 있는 셀은 0.
+    if not isinstance(cell, str):
+        return None
+    text = cell.strip().replace("−", "-")
+    if not text:
+        return None
+    if text in DASHES:
+        return 0.0
+    match = MONEY.match(text)
+    if match is None or bool(match["open"]) != bool(match["close"]):
+        return None
+    value = float(match["number"].replace(",", "") + (match["decimal"] or ""))
+    return -value if (match["open"] or match["minus"]) else value
+
+def table_scale(df: pd.DataFrame) -> float:
+    # "In USD Millions", "(in thousands)" 등 표 안의 단위 표기. 단위는 표마다 다를 수 있음.
+    for cell in df.to_numpy(dtype=object).ravel():
+        if isinstance(cell, str) and (match := SCALE_HEADER.search(cell)):
+            return SCALES.get((match[1] or "").lower(), 1e3)
+    return 1.0
+
+def parse_date(cell) -> Optional[tuple[int, int, int]]:
+    # (연도, 월, 일). 연도가 없으면 0.
+    if not isinstance(cell, str):
+        return None
+    for pattern in DATE_PATTERNS:
+        if (match := pattern.search(cell)) is None:
+            continue
+        month = match["month"]
+        month = [m[:3] for m in MONTHS].index(month[:3].lower()) + 1 if not month.isdigit() else int(month)
+        day, year = int(match["day"]), int(match["year"] or 0)
+        if 1 <= month <= 12 and 1 <= day <= 31:
+            return year, month, day
+    return None
+
+def period_date(df: pd.DataFrame, column: int) -> Optional[tuple[int, int, int]]:
+    # 금액 열의 보고 기준일. 1) 열 머리글(금액이 아닌 셀)의 날짜  2) 표 전체가 한 기준일인 경우 행 이름의 "as of <날짜>"
+    for cell in df.iloc[:, column]:
+        if parse_money(cell) is None and (date := parse_date(cell)) is not None:
+            return date
+    dates = {parse_date(label) for label in df.iloc[:, 0] if isinstance(label, str) and AS_OF_LABEL.search(label)} - {None}
+    return dates.pop() if len(dates) == 1 else None
+
+def latest_period(dates: list[Optional[tuple[int, int, int]]]) -> Optional[int]:
+    # 가장 최근 기준일의 위치. 날짜를 모르는 열이 있거나, 연도 유무가 섞여 비교할 수 없거나, 최근 날짜가 겹치면 None.
+    if not dates or any(date is None for date in dates) or len({date[0] == 0 for date in dates}) > 1:
+        return None
+    latest = max(dates)
+    return dates.index(latest) if dates.count(latest) == 1 else None
+
+def match_field(label: str) -> Optional[str]:
+    for field, matcher in FIELD_MATCHERS:
+        if matcher.search(label):
+            return field
+    return None
+
+@dataclass
+class RuleCandidate:
+    table_index: int
+    column: int
+    amounts: dict[str, float]
+    total: float
+
+    @property
+    def gap(self) -> float:
+        # 합계 대비 항목 합의 차이 비율
+        return abs(sum(self.amounts.values()) - self.total) / self.total
+
+    def same_amounts(self, other: "RuleCandidate") -> bool:
+        fields = self.amounts.keys() | other.amounts.keys()
+        return abs(self.total - other.total) < 0.5 and all(abs(self.amounts.get(f, 0.0) - other.amounts.get(f, 0.0)) < 0.5 for f in fields)
+
+def column_candidate(df: pd.DataFrame, table_index: int, column: int, scale: float) -> Optional[RuleCandidate]:
+    # 표의 한 열을 금액 열로 보고 행 이름(0열)으로 항목별 금액과 합계를 구함.
+    # 항목별 소계 행("TOTAL U.S. TREASURY SECURITIES")이 있으면 개별 행(CUSIP별 보유 내역 등) 대신 소계를 사용.
+    rows: dict[str, float] = {}
+    subtotals: dict[str, float] = {}
+    totals: list[float] = []
+    for label, cell in zip(df.iloc[:, 0], df.iloc[:, column]):
+        amount = parse_money(cell)
+        if amount is None or not isinstance(label, str) or not label.strip():
+            continue
+        amount *= scale
+        if TOTAL_LABEL.match(label):
+            if SUBTOTAL_LABEL.match(label) or ISSUANCE_LABEL.search(label):
+                continue
+            field = match_field(TOTAL_LABEL.sub("", label))
+            if field is None:
+                totals.append(amount)
+            else:
+                subtotals[field] = subtotals.get(field, 0.0) + amount
+        elif (field := match_field(label)) is not None:
+            rows[field] = rows.get(field, 0.0) + amount
+    amounts = rows | subtotals
+    if not totals or not amounts or max(totals) <= 0:
+        return None
+    return RuleCandidate(table_index=table_index, column=column, amounts=amounts, total=max(totals)) # 여러 합계 중 가장 큰 값이 전체 합계
+
+def rule_candidates(tables: list[pd.DataFrame]) -> list[RuleCandidate]:
+    candidates = []
+    for table_index, df in enumerate(tables):
+        if df.shape[1] < 2:
+            continue
+        scale = table_scale(df)
+        for column in range(1, df.shape[1]):
+            candidate = column_candidate(df, table_index, column, scale)
+            if candidate is not None:
+                candidates.append(candidate)
+    return candidates
+
+def extract_amounts_by_rules(tables: list[pd.DataFrame], tolerance: Optional[float] = None) -> Optional[AmountsOnly]:
+    # 합계와 맞는 후보가 있으면 AmountsOnly, 없으면 None(LLM 투표로 진행).
+    # 날짜별로 여러 열/표가 있으면 이전 기준일의 열도 자체 합계와 맞음. 후보들의 금액이 서로 다르면 열 머리글의 기준일이 가장 최근인 후보를 사용하고,
+    # 기준일을 정할 수 없으면 열 순서로 추측하지 않고 None(LLM 투표로 진행).
+    tolerance = EXTRACTION.RULE_TOLERANCE if tolerance is None else tolerance
+    reconciled = [candidate for candidate in rule_candidates(tables) if candidate.gap <= tolerance]
+    if not reconciled:
+        return None
+    chosen = reconciled[0]
+    if any(not candidate.same_amounts(chosen) for candidate in reconciled[1:]):
+        latest = latest_period([period_date(tables[candidate.table_index], candidate.column) for candidate in reconciled])
+        if latest is None:
+            logger.debug(f"{len(reconciled)} reconciled columns disagree and their report dates are unknown; falling back to LLM voting")
+            return None
+        chosen = reconciled[latest]
+    logger.debug(f"Rule-based amounts reconciled from table {chosen.table_index}, column {chosen.column} (gap {chosen.gap:.6f}): {chosen.amounts}")
+    return AmountsOnly.model_validate(
+        {field: 0.0 for field, _ in FIELD_PHRASES} | chosen.amounts | {"total": chosen.total} # 보이지 않는 항목은 0 (SYSTEM_PROMPT와 동일)
+    )
@@ -0,0 +1,46 @@
+# Single-flight: 같은 key에 대한 동시 요청은 하나의 작업만 실행하고 나머지는 그 결과를 공유.
+# 예를 들어 디페그 뉴스 직후 여러 MCP 클라이언트가 같은 보고서를 동시에 요청하면,
+# PDF 다운로드와 Camelot + LLM 파이프라인을 한 번만 실행하고 모든 요청이 같은 AssetTable을 받음.
+from common import metrics
+from typing import Awaitable, Callable, TypeVar
+import asyncio, logging
+
+logger = logging.getLogger("RunFromRun.Analyze.Offchain.Single_Flight")
+logger.setLevel(logging.DEBUG)
+
+T = TypeVar("T")
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+        metrics.register_collector(f"single_flight.{name}", self.stats)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            # 작업은 별도 task로 실행하여, 처음 요청한 클라이언트가 연결을 끊어도(취소) 기다리는 다른 요청은 결과를 받음
+            task = asyncio.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        else:
+            self.coalesced += 1
+            logger.info(f"[{self.name}] Joined in-flight work for {key} (coalescing rate {self.stats()['coalescing_rate']:.2%})")
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception() # 모든 요청이 취소된 경우에도 "exception was never retrieved" 경고가 남지 않도록 확인 처리
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalescing_rate": metrics.ratio(self.coalesced, self.calls),
+            "in_flight": len(self._inflight),
+        }
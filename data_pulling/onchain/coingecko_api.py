@@ -1,5 +1,6 @@
 import httpx, logging, asyncio, math
 from common.settings import API_KEYS, API_URLS
+from common.tracing import span
 from rich import print
 
 
@@ -28,10 +29,12 @@ coingecko_network_id_dict: dict = {
 PRIORITY_STABLECOINS = ["USDC", "USDT", "FDUSD", "TUSD", "PYUSD", "USDP"]
 
 async def httpx_request_to_coingecko(url:str, headers:dict, querystring:dict | None) -> dict:
-    async with httpx.AsyncClient(timeout=120) as client:
-        response = await client.get(url, headers=headers, params=querystring)
-        response.raise_for_status()
-        data = response.json()
+    with span("coingecko", endpoint=httpx.URL(url).path) as coingecko_span: # path에는 API key가 없음
+        async with httpx.AsyncClient(timeout=120) as client:
+            response = await client.get(url, headers=headers, params=querystring)
+            coingecko_span.set(status_code=response.status_code)
+            response.raise_for_status()
+            data = response.json()
     return data
 
 def _get_target_quote_token(base_token:str, chain: str, coin_chain_info_all: dict) -> str:
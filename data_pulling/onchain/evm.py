@@ -1,7 +1,7 @@
 from common.settings import CHAIN_RPC_URLS
-from web3 import AsyncWeb3
 
 async def get_total_supply(chain: str, cfg: dict, ERC20_ABI: list) -> float:
+    from web3 import AsyncWeb3 # eth_account, py_ecc까지 불러와 import에 0.8초 가량 걸리므로 EVM 체인을 조회할 때 import
     rpc_url = getattr(CHAIN_RPC_URLS,chain.upper())
     w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(rpc_url))
     try:
@@ -1,6 +1,7 @@
 # For getting onchain data from API
 from common.settings import API_KEYS, API_URLS, CHAIN_RPC_URLS
 from common.schema import OnChainData
+from common.tracing import span, traced
 from data_pulling.onchain import evm, tron, solana, sui, coingecko_api, DEX_simulate
 import asyncio, yaml, logging
 
@@ -28,15 +29,16 @@ async def get_supply_each_chain(coin_chain_info:dict, ABI_dict: dict) -> dict[st
     for chain, cfg in coin_chain_info.items():
         # EVM 기반 체인 처리 - Ethereum, BSC, Arbitrum, Base
         if cfg['type'] == 'evm':
-            coros.append(evm.get_total_supply(chain, cfg, ABI_dict["ERC20"]))
+            coro = evm.get_total_supply(chain, cfg, ABI_dict["ERC20"])
         elif cfg['type'] == 'tron':
-            coros.append(tron.get_total_supply(chain, cfg))
+            coro = tron.get_total_supply(chain, cfg)
         elif cfg['type'] == 'solana':
-            coros.append(solana.get_total_supply(chain, cfg))
+            coro = solana.get_total_supply(chain, cfg)
         elif cfg['type'] == 'sui':
-            coros.append(sui.get_total_supply(chain, cfg))
+            coro = sui.get_total_supply(chain, cfg)
         else:
             raise NotImplementedError(f"Unsupported chain type: {cfg['type']}")
+        coros.append(traced("onchain.rpc", coro, chain=chain, chain_type=cfg['type']))
     
     # 병렬 실행으로 성능 향상
     logger.debug("Request to each chains RPC node.")
@@ -60,11 +62,12 @@ async def get_onchain_data(stablecoin: str) -> OnChainData:
     # variation_data는 dict[str,list] 형식임.
     # DEX simulate의 경우는 위 두 가지 변수에 dependency가 있기 때문에 이후에 접근.
     
-    slippage_per_chain = await coingecko_api.stablecoin_DEX_aggregator_simulation(
-        stablecoin=stablecoin,
-        coin_chain_info_all=coin_chain_info_all, 
-        stress_test_value=sum(supply_per_chain.values()) * 0.0001
-    )
+    with span("dex_simulation"):
+        slippage_per_chain = await coingecko_api.stablecoin_DEX_aggregator_simulation(
+            stablecoin=stablecoin,
+            coin_chain_info_all=coin_chain_info_all, 
+            stress_test_value=sum(supply_per_chain.values()) * 0.0001
+        )
     return OnChainData(
         supply_per_chain=supply_per_chain,
         variation_data=variation_data,
@@ -1,8 +1,6 @@
-import os
-from pathlib import Path
-from datetime import datetime
+from data_pulling.offchain.cache_manager import remove_pdfs_of
 
-def cleanup_pdf(stablecoin:str):
-    file_path = Path("../data_pulling/offchain/pdf") / stablecoin.upper() / "-" / str(datetime.now()).split()[0] / ".pdf"
-    if Path.exists(file_path):
-        os.remove(file_path)
\ No newline at end of file
+def cleanup_pdf(stablecoin: str) -> int:
+    # PDF 풀은 pdf/<sha256>.pdf 형태의 content-addressed store이므로 캐시 인덱스에서 해당 코인의 pdf_hash를 찾아 삭제
+    # 분석 중인 PDF는 삭제하지 않으며, 분석 결과(AssetTable)는 유지. 삭제한 파일 수 반환.
+    return remove_pdfs_of(stablecoin)
@@ -1,5 +1,6 @@
 from common.schema import Indices
 from common.settings import SLACK_WEBHOOK_URL
+from common.tracing import span
 import logging, requests
 from datetime import datetime
 
@@ -8,21 +9,24 @@ logger.setLevel(logging.DEBUG)
 
 
 def alarm_with_slack_webhook(decision_string: str):
-    if SLACK_WEBHOOK_URL == "your_slack_webhook_url":
-        logger.info("Valid slack webhook url not given")
-    else:
-        try:
-            decision_string = "Complete Time: " +str(datetime.now()) + "\n" + decision_string
-            resp = requests.post(
-                SLACK_WEBHOOK_URL,
-                json={"text": decision_string},
-                timeout=5,
-            )
-            resp.raise_for_status()
-            if resp.status_code >= 400:
-                logger.error("Slack webhook failed with status %s: %s", resp.status_code, resp.text)
-        except Exception as exc:
-            logger.exception("Failed to send Slack webhook: %s", exc)    
+    with span("slack_alarm", sent=False) as slack_span:
+        if SLACK_WEBHOOK_URL == "your_slack_webhook_url":
+            logger.info("Valid slack webhook url not given")
+        else:
+            try:
+                decision_string = "Complete Time: " +str(datetime.now()) + "\n" + decision_string
+                resp = requests.post(
+                    SLACK_WEBHOOK_URL,
+                    json={"text": decision_string},
+                    timeout=5,
+                )
+                resp.raise_for_status()
+                slack_span.set(sent=True)
+                if resp.status_code >= 400:
+                    logger.error("Slack webhook failed with status %s: %s", resp.status_code, resp.text)
+            except Exception as exc:
+                logger.exception("Failed to send Slack webhook: %s", exc)
+                slack_span.record_error(exc)    
 
 def check_thresholds_and_alarm(indices: Indices) -> str:
     decision_string_list: list[str] = []
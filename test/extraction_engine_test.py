@@ -0,0 +1,46 @@
+# Camelot과 PyMuPDF(find_tables) 추출 엔진의 지연시간과 정확도 비교.
+# test/report의 각 보고서를 CAMELOT_MODE의 flavor와 같은 방식으로 두 엔진에서 추출하고(페이지 캐시 없이), 같은 필터링/후처리를 거친 표에
+# 규칙 기반 추출(rule_extractor)을 적용하여 rule_extractor_test의 기대값과 맞는 항목 수를 비교함.
+from common.settings import CAMELOT_MODE
+from data_pulling.offchain.dataframe_process import (
+    CAMELOT_ENGINE, PYMUPDF_ENGINE, flavor_for_engine, plan_extraction, read_page_tables, finalize_tables,
+)
+from data_pulling.offchain.rule_extractor import extract_amounts_by_rules
+from test.rule_extractor_test import EXPECTED
+import importlib, time
+
+ENGINES = (CAMELOT_ENGINE, PYMUPDF_ENGINE)
+
+def extract(coin: str, engine: str) -> dict:
+    pdf_path = f"./test/report/{coin}.pdf"
+    flavor = flavor_for_engine(CAMELOT_MODE[coin], engine)
+    start = time.perf_counter()
+    pages = plan_extraction(pdf_path)
+    raw_tables = [df for page in pages for df in read_page_tables(pdf_path, page, flavor)]
+    tables = finalize_tables(raw_tables, pdf_path)
+    elapsed = time.perf_counter() - start
+
+    amounts = extract_amounts_by_rules(tables)
+    expected = EXPECTED.get(coin) or {}
+    matched = sum(1 for field, value in expected.items() if amounts is not None and abs(getattr(amounts, field) - value) < 0.01)
+    used = sorted({df.attrs.get("flavor") for df in raw_tables} - {flavor}) # 도형이 많아 Camelot으로 대신 추출한 페이지
+    return {"flavor": flavor, "seconds": elapsed, "tables": len(tables), "reconciled": amounts is not None, "matched": matched, "expected": len(expected), "fallback": used}
+
+def main():
+    importlib.import_module("camelot") # import 시간(0.5초 이상)이 첫 보고서의 Camelot 지연시간에 포함되지 않도록 미리 불러둠
+    results = {coin: {engine: extract(coin, engine) for engine in ENGINES} for coin in CAMELOT_MODE}
+
+    print(f"{'coin':<6} {'engine':<8} {'flavor':<14} {'seconds':>8} {'tables':>6} {'reconciled':>10} {'fields':>7}")
+    for coin, by_engine in results.items():
+        for engine, result in by_engine.items():
+            fields = f"{result['matched']}/{result['expected']}" if result["expected"] else "-"
+            note = f"  (Camelot {', '.join(result['fallback'])} on dense pages)" if result["fallback"] else ""
+            print(f"{coin:<6} {engine:<8} {result['flavor']:<14} {result['seconds']:>8.2f} {result['tables']:>6} {str(result['reconciled']):>10} {fields:>7}{note}")
+    for engine in ENGINES:
+        total = sum(by_engine[engine]["seconds"] for by_engine in results.values())
+        matched = sum(by_engine[engine]["matched"] for by_engine in results.values())
+        expected = sum(by_engine[engine]["expected"] for by_engine in results.values())
+        print(f"{engine}: {total:.2f} seconds in total, {matched}/{expected} expected amounts")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import asyncio
-from data_pulling.offchain.pdf_analysis import analyze_pdf, plotit_asset_tables
+from data_pulling.offchain.pdf_analysis import analyze_pdf
+from common.profiling import plotit_asset_tables
 
 async def main():
     id = "1"
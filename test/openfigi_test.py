@@ -1,5 +1,6 @@
-from data_pulling.offchain.openfigi_api import replace_cusip_openfigi
+from data_pulling.offchain.openfigi_api import resolve_cusips_in_tables
 from data_pulling.offchain.dataframe_process import get_tables_from_pdf
+import asyncio
 
 if __name__ == "__main__":
     USDC_PDF_PATH = "./test/report/USDC.pdf"
@@ -10,16 +11,12 @@ if __name__ == "__main__":
     USDP_PDF_PATH = "./test/report/USDP.pdf"
    
     df_list = get_tables_from_pdf(pdf_path=USDC_PDF_PATH, stablecoin="USDC")
-    result = []
-    for table in df_list:
+    # 서버와 같은 경로: 모든 표의 CUSIP을 모아 캐시 확인 후 묶음 요청으로 해석하고 한 번에 치환
+    df_out_list = asyncio.run(resolve_cusips_in_tables(df_list))
+    for table, table_out in zip(df_list, df_out_list):
         print(f"################before################")
         print(table)
         print(f"################before################")
-        table_out = table.map(replace_cusip_openfigi)
         print(f"################after################")
         print(table_out)
         print(f"################after################")
-    
-
-
-
@@ -0,0 +1,96 @@
+# 규칙 기반 추출(rule_extractor)이 금액 셀을 정확히 해석하고, test/report의 보고서에서 합계와 맞는 결과를 내는지 확인.
+# 합계가 맞지 않는 표(행 이름을 모르는 경우)는 None을 반환하여 LLM 투표로 넘어가야 함.
+from common.settings import CAMELOT_MODE
+from data_pulling.offchain.dataframe_process import get_tables_from_pdf
+from data_pulling.offchain.rule_extractor import parse_money, table_scale, extract_amounts_by_rules
+import pandas as pd
+import time
+
+MONEY_CASES = {
+    "$         74,290,695,677": 74290695677.0,
+    "US$501,933,900.88": 501933900.88,
+    "(124,294,056)": -124294056.0,
+    "$0.00": 0.0,
+    "-": 0.0,
+    "6,778": 6778.0,
+    "12": 12.0,
+    "": None,
+    "4.30%": None,
+    "7/31/2025": None,
+    "912797QV": None,
+    "September 30, 2025": None,
+    "(12,345": None,
+    "Total": None,
+}
+
+# 보고서별 기대값 (가장 최근 날짜 열 기준, 달러 단위). 표를 추출하지 못하는 FDUSD는 LLM 투표로 넘어감.
+EXPECTED = {
+    "USDC": {"total": 73814526973.0, "us_treasury_bills": 21761417417.0, "repo_overnight_term": 41619000000.0, "gov_mmf": 1003781600.0},
+    "USDT": {"total": 181223149214.0, "us_treasury_bills": 112417034272.0, "repo_overnight_term": 21047660467.0, "digital_assets": 9856011011.0},
+    "FDUSD": None,
+    "PYUSD": {"total": 1040131414.0, "cash_bank_deposits": 26662365.0, "repo_overnight_term": 1013469049.0},
+    "TUSD": {"total": 501933900.88, "custodial_concentrated_asset": 501850000.0, "cash_bank_deposits": 83900.88},
+    "USDP": {"total": 63284396.0, "cash_bank_deposits": 57361396.0, "repo_overnight_term": 5923000.0},
+}
+
+def test_parse_money():
+    for cell, expected in MONEY_CASES.items():
+        assert parse_money(cell) == expected, f"parse_money({cell!r}) = {parse_money(cell)}, expected {expected}"
+    print(f"parse_money: {len(MONEY_CASES)} cases")
+
+def test_scale():
+    millions = pd.DataFrame([["In USD Millions", "Total Assets"], ["U.S. Treasury Bills", "100"], ["Cash", "20"], ["Total", "120"]])
+    assert table_scale(millions) == 1e6
+    amounts = extract_amounts_by_rules([millions])
+    assert amounts is not None and amounts.total == 120e6 and amounts.us_treasury_bills == 100e6, amounts
+    print("table_scale: millions header applied")
+
+def test_not_reconciled():
+    # 알 수 없는 행이 합계의 대부분을 차지하면 LLM 투표로 넘어가야 함
+    unknown = pd.DataFrame([["Cash", "$10"], ["Some new instrument", "$90"], ["Total", "$100"]])
+    assert extract_amounts_by_rules([unknown]) is None
+    # 발행량 합계는 자산 합계로 보지 않음
+    issuance = pd.DataFrame([["Total tokens issued", "100"], ["Cash", "100"]])
+    assert extract_amounts_by_rules([issuance]) is None
+    print("not reconciled: falls back to LLM voting")
+
+def test_period_columns():
+    # 이전 기준일 열도 자체 합계와 맞으므로 열 위치가 아니라 머리글의 기준일로 최근 열을 골라야 함
+    current_first = pd.DataFrame([
+        ["", "September 30, 2025", "August 31, 2025"],
+        ["U.S. Treasury Bills", "$80", "$70"],
+        ["Cash", "$20", "$10"],
+        ["Total", "$100", "$80"],
+    ])
+    amounts = extract_amounts_by_rules([current_first])
+    assert amounts is not None and amounts.total == 100 and amounts.us_treasury_bills == 80, amounts
+    # 기준일을 알 수 없는데 열마다 금액이 다르면 LLM 투표로 넘어가야 함
+    undated = current_first.iloc[1:]
+    assert extract_amounts_by_rules([undated]) is None
+    print("period columns: latest report date selected regardless of column order")
+
+def test_reports():
+    for coin in CAMELOT_MODE:
+        tables = get_tables_from_pdf(f"./test/report/{coin}.pdf", coin)
+        start = time.perf_counter()
+        amounts = extract_amounts_by_rules(tables)
+        elapsed = time.perf_counter() - start
+        expected = EXPECTED.get(coin)
+        if expected is None:
+            assert amounts is None, f"{coin}: expected no rule-based result, got {amounts}"
+        else:
+            assert amounts is not None, f"{coin}: rule-based amounts did not reconcile"
+            for field, value in expected.items():
+                assert abs(getattr(amounts, field) - value) < 0.01, f"{coin}: {field} = {getattr(amounts, field)}, expected {value}"
+        print(f"{coin}: {'reconciled' if amounts else 'LLM voting'} in {elapsed * 1000:.1f} ms")
+
+def main():
+    test_parse_money()
+    test_scale()
+    test_not_reconciled()
+    test_period_columns()
+    test_reports()
+    print("Rule-based extraction matches the expected amounts.")
+
+if __name__ == "__main__":
+    main()
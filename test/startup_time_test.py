@@ -0,0 +1,70 @@
+# 서버 시작(import) 시간 리포트.
+# `python -X importtime -c "import app.rfr_server"`를 별도 프로세스에서 실행하여 모듈별 import 비용을 집계하고,
+# 전체 시간이 STARTUP_BUDGET_SECONDS(기본 1.5초) 이내인지, 무거운 분석 의존성이 서버 시작 시 import되지 않는지 확인.
+# 사용 예: STARTUP_BUDGET_SECONDS=1.0 python -m test.startup_time_test
+from collections import defaultdict
+from pathlib import Path
+import os, re, subprocess, sys
+
+ROOT = Path(__file__).resolve().parent.parent
+TARGET = "app.rfr_server"
+BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.5"))
+RUNS = 3 # 디스크 캐시 등의 영향을 줄이기 위해 여러 번 실행하고 중앙값 사용
+TOP_N = 15
+# 첫 요청 이후(또는 서버 시작 후 별도 스레드)에 import되어야 하는 패키지
+LAZY_PACKAGES = ("camelot", "fitz", "matplotlib", "pandas", "numpy", "ollama", "web3")
+
+importtime_line = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def measure_imports(target: str) -> list[tuple[str, int, int, int]]:
+    # (모듈 이름, self us, cumulative us, 깊이) 목록
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        match = importtime_line.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return modules
+
+def report(modules: list[tuple[str, int, int, int]]) -> float:
+    total_us = next(cumulative for name, _, cumulative, _ in modules if name == TARGET)
+    print(f"Total import time of {TARGET}: {total_us / 1e6:.3f} seconds ({len(modules)} modules)")
+
+    print(f"\nTop {TOP_N} modules by cumulative import time")
+    for name, self_us, cumulative_us, depth in sorted(modules, key=lambda m: m[2], reverse=True)[:TOP_N]:
+        print(f"  {cumulative_us / 1e3:9.1f} ms  (self {self_us / 1e3:7.1f} ms)  {name}")
+
+    by_package: dict[str, int] = defaultdict(int)
+    for name, self_us, _, _ in modules:
+        by_package[name.split(".")[0]] += self_us
+    print(f"\nTop {TOP_N} packages by self import time")
+    for package, self_us in sorted(by_package.items(), key=lambda p: p[1], reverse=True)[:TOP_N]:
+        print(f"  {self_us / 1e3:9.1f} ms  {package}")
+    return total_us / 1e6
+
+def test_startup_budget():
+    totals = []
+    for _ in range(RUNS):
+        modules = measure_imports(TARGET)
+        totals.append(next(cumulative for name, _, cumulative, _ in modules if name == TARGET) / 1e6)
+    report(modules)
+    median = sorted(totals)[len(totals) // 2]
+    print(f"\nMedian of {RUNS} runs: {median:.3f} seconds (budget {BUDGET_SECONDS:.3f} seconds)")
+    assert median <= BUDGET_SECONDS, f"{TARGET} takes {median:.3f} seconds to import, over the {BUDGET_SECONDS} seconds budget"
+
+def test_heavy_packages_are_lazy():
+    imported = {name.split(".")[0] for name, _, _, _ in measure_imports(TARGET)}
+    eager = sorted(imported.intersection(LAZY_PACKAGES))
+    assert not eager, f"{TARGET} imports {eager} at startup"
+
+def main():
+    test_startup_budget()
+    test_heavy_packages_are_lazy()
+    print("Server startup is within budget.")
+
+if __name__ == "__main__":
+    main()
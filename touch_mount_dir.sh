@@ -1,7 +1,4 @@
 #!/bin/sh
 
 cd $HOME
-mkdir rfr_pdf_results
-cd ./rfr_pdf_results
-mkdir asset_tables
-touch pdfHash_id.log
\ No newline at end of file
+mkdir rfr_pdf_results
\ No newline at end of file